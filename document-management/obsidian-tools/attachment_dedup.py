@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Obsidian附件去重工具
+
+功能说明：
+1. 计算 附件/img-cache 中附件的内容哈希，按大小和mtime缓存摘要
+2. 为每组内容相同的附件选出一个规范文件
+3. 一次遍历受影响的笔记，把 ![[...]] 内嵌和各种 img-cache 链接改为规范文件名
+4. 将重复文件移动到库的 .trash 目录，并报告回收的字节数
+
+使用方法：
+    python attachment_dedup.py <folder_path> [--apply]
+
+默认只显示计划（dry-run），加 --apply 才会修改笔记和移动文件。
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from urllib.parse import quote
+
+from link_engine import IMG_CACHE_DIR, STATE_DIR
+from vault_index import VaultLinkIndex, unique_destination
+
+DIGEST_CACHE_FILE_NAME = 'digest-cache.json'
+CHUNK_SIZE = 1024 * 1024
+# Obsidian粘贴截图的默认命名，选择规范文件时排在有意义的文件名之后
+PASTED_IMAGE_PREFIX = 'Pasted image'
+
+
+def file_digest(path):
+    """计算文件的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AttachmentDeduplicator:
+    """附件去重工具类"""
+
+    def __init__(self, folder_path):
+        """
+        初始化去重工具
+
+        Args:
+            folder_path: Obsidian库根目录
+        """
+        self.folder_path = os.path.abspath(folder_path)
+        self.img_cache_dir = os.path.join(self.folder_path, IMG_CACHE_DIR)
+        self.cache_file = os.path.join(self.folder_path, STATE_DIR, DIGEST_CACHE_FILE_NAME)
+        self.index = VaultLinkIndex(self.folder_path)
+        # 附件名 -> [size, mtime_ns, digest]
+        self.digest_cache = {}
+
+    def load_digest_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self.digest_cache = json.load(f)
+        except (OSError, ValueError):
+            self.digest_cache = {}
+
+    def save_digest_cache(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        with open(self.cache_file, 'w', encoding='utf-8') as f:
+            json.dump(self.digest_cache, f, ensure_ascii=False, separators=(',', ':'))
+
+    def scan_attachments(self):
+        """
+        列出附件及其大小和mtime
+
+        Returns:
+            dict: 附件名（相对于 img-cache，以 / 分隔）-> (size, mtime_ns)
+        """
+        attachments = {}
+        for root, dirs, files in os.walk(self.img_cache_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for file in files:
+                if file.startswith('.') or file.endswith('.part'):
+                    continue
+                path = os.path.join(root, file)
+                st = os.stat(path)
+                name = os.path.relpath(path, self.img_cache_dir).replace(os.sep, '/')
+                attachments[name] = (st.st_size, st.st_mtime_ns)
+        return attachments
+
+    def find_duplicate_groups(self):
+        """
+        按内容哈希分组。只有大小相同的附件才需要计算哈希，摘要按 (size, mtime) 缓存。
+
+        Returns:
+            tuple: (重复组列表 [[附件名, ...], ...], 本次实际计算哈希的文件数)
+        """
+        attachments = self.scan_attachments()
+        by_size = {}
+        for name, (size, _mtime) in attachments.items():
+            by_size.setdefault(size, []).append(name)
+
+        hashed = 0
+        by_digest = {}
+        cache = {}
+        for size, names in by_size.items():
+            if len(names) < 2:
+                continue
+            for name in names:
+                size, mtime_ns = attachments[name]
+                cached = self.digest_cache.get(name)
+                if cached and cached[0] == size and cached[1] == mtime_ns:
+                    digest = cached[2]
+                else:
+                    digest = file_digest(os.path.join(self.img_cache_dir, name))
+                    hashed += 1
+                cache[name] = [size, mtime_ns, digest]
+                by_digest.setdefault(digest, []).append(name)
+
+        # 只保留仍然存在的附件的摘要
+        self.digest_cache = cache
+        groups = [sorted(names) for names in by_digest.values() if len(names) > 1]
+        groups.sort()
+        return groups, hashed
+
+    def choose_canonical(self, names):
+        """
+        选出规范文件：优先非"Pasted image"命名，其次被引用最多，再次最早创建，最后按名称
+
+        Args:
+            names: 内容相同的附件名列表
+
+        Returns:
+            str: 规范文件名
+        """
+        def sort_key(name):
+            basename = name.rsplit('/', 1)[-1]
+            refs = len(self.index.targets.get(IMG_CACHE_DIR + '/' + name, []))
+            mtime_ns = os.stat(os.path.join(self.img_cache_dir, name)).st_mtime_ns
+            return basename.startswith(PASTED_IMAGE_PREFIX), -refs, mtime_ns, name
+
+        return min(names, key=sort_key)
+
+    def build_plan(self):
+        """
+        生成去重计划
+
+        Returns:
+            dict: {"groups": [(规范文件, [重复文件...])], "renames": {重复文件: 规范文件},
+                   "notes": {笔记: 替换次数}, "bytes": 可回收字节数, "hashed": 计算哈希的文件数,
+                   "pattern"/"replacements": build_rename_pattern 的结果}
+        """
+        self.index.load()
+        self.index.update()
+        self.load_digest_cache()
+
+        groups, hashed = self.find_duplicate_groups()
+        plan = {'groups': [], 'renames': {}, 'notes': {}, 'bytes': 0, 'hashed': hashed}
+        for names in groups:
+            canonical = self.choose_canonical(names)
+            duplicates = [name for name in names if name != canonical]
+            plan['groups'].append((canonical, duplicates))
+            for name in duplicates:
+                plan['renames'][name] = canonical
+                plan['bytes'] += os.path.getsize(os.path.join(self.img_cache_dir, name))
+
+        pattern, replacements = build_rename_pattern(plan['renames'])
+        if pattern is not None:
+            affected = set()
+            for name in plan['renames']:
+                affected.update(self.index.targets.get(IMG_CACHE_DIR + '/' + name, []))
+            for note in sorted(affected):
+                with open(os.path.join(self.folder_path, note), 'r', encoding='utf-8') as f:
+                    count = len(pattern.findall(f.read()))
+                if count:
+                    plan['notes'][note] = count
+        plan['pattern'] = pattern
+        plan['replacements'] = replacements
+        return plan
+
+    def apply_plan(self, plan):
+        """
+        执行去重计划：改写笔记中的链接，并将重复文件移动到 .trash
+
+        链接索引包含所有笔记（不受改写排除规则影响），改写后重新更新索引，
+        仍被笔记引用的重复文件保留在原处，不会因移动而产生失效链接。
+        重复文件在 .trash 中保留库内相对路径，已有同名文件时追加序号。
+
+        Args:
+            plan: build_plan 生成的计划
+
+        Returns:
+            List[str]: 因仍被引用而没有移动的重复文件
+        """
+        pattern = plan['pattern']
+        replacements = plan['replacements']
+        for note in plan['notes']:
+            note_path = os.path.join(self.folder_path, note)
+            with open(note_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            content = pattern.sub(lambda m: replacements[m.group(0)], content)
+            # 注意，这里使用 LF 换行符
+            with open(note_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(content)
+
+        self.index.update()
+        trash_dir = os.path.join(self.folder_path, '.trash')
+        kept = []
+        for name in plan['renames']:
+            rel_path = IMG_CACHE_DIR + '/' + name
+            if self.index.targets.get(rel_path):
+                kept.append(name)
+                continue
+            dest = unique_destination(os.path.join(trash_dir, rel_path))
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(os.path.join(self.img_cache_dir, name), dest)
+            self.digest_cache.pop(name, None)
+
+        self.index.update()
+        self.index.save()
+        return kept
+
+
+def build_rename_pattern(renames):
+    """
+    把所有重复文件名编译为一个正则表达式，一次遍历即可完成一篇笔记中的全部替换。
+
+    匹配 ![[name]]、![[name|alias]] 中的文件名，以及任意 .../img-cache/name 形式的链接
+    （GitHub、Gitea、file:// 和相对路径），同时覆盖原始文件名和URL编码后的文件名。
+
+    Args:
+        renames: 重复文件名 -> 规范文件名
+
+    Returns:
+        tuple: (编译后的正则表达式或None, 匹配文本 -> 替换文本)
+    """
+    replacements = {}
+    for name, canonical in renames.items():
+        replacements[name] = canonical
+        encoded = quote(name)
+        if encoded != name:
+            replacements[encoded] = quote(canonical)
+    if not replacements:
+        return None, replacements
+
+    alternation = '|'.join(re.escape(text) for text in sorted(replacements, key=len, reverse=True))
+    pattern = re.compile(r'(?:(?<=!\[\[)|(?<=/img-cache/))(?:' + alternation + r')(?=[\]|#)"\'\s?>]|$)',
+                         re.MULTILINE)
+    return pattern, replacements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按内容哈希合并 附件/img-cache 中的重复附件')
+    parser.add_argument('folder_path', help='Obsidian库根目录')
+    parser.add_argument('--apply', action='store_true', help='实际改写笔记并移动重复文件（默认只显示计划）')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder_path):
+        print(f"错误: {args.folder_path} 不是有效的目录路径。")
+        sys.exit(1)
+
+    dedup = AttachmentDeduplicator(args.folder_path)
+    try:
+        plan = dedup.build_plan()
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    dedup.save_digest_cache()
+
+    for canonical, duplicates in plan['groups']:
+        print(f"保留: {canonical}")
+        for name in duplicates:
+            print(f"  重复: {name}")
+    for note, count in plan['notes'].items():
+        print(f"改写笔记: {note}（{count} 处链接）")
+    print(f"共 {len(plan['groups'])} 组重复附件，{len(plan['renames'])} 个重复文件，"
+          f"涉及 {len(plan['notes'])} 篇笔记，可回收 {plan['bytes']} 字节（本次计算哈希 {plan['hashed']} 个文件）")
+
+    if not args.apply:
+        print("未使用 --apply，未修改任何文件。")
+        return
+
+    kept = dedup.apply_plan(plan)
+    dedup.save_digest_cache()
+    for name in kept:
+        print(f"[WARN] {name} 仍被笔记引用，未移动")
+    print(f"去重完成，{len(plan['renames']) - len(kept)} 个重复文件已移动到 .trash。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Obsidian附件本地化工具
+
+功能说明：
+1. 收集库中所有指向 GitHub/Gitea img-cache 的远程图片链接
+2. 并发下载 附件/img-cache 中缺失的图片（有界线程池 + keep-alive连接复用）
+3. 记录 ETag/Last-Modified，刷新已有图片时发送条件请求
+4. 全部下载成功后再执行模式3，将远程链接改写为本地 file:// 链接
+
+使用方法：
+    python attachment_localizer.py <folder_path> [--workers N] [--refresh]
+                                   [--mirror BASE_URL] [--no-rewrite] [--force]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import http.client
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, quote, unquote
+
+from link_engine import IMG_CACHE_DIR, STATE_DIR
+from obsidian_link_replace import process_folder
+from vault_index import VaultLinkIndex, img_cache_name, link_url
+
+# 条件请求元数据缓存文件名
+LOCALIZE_CACHE_FILE_NAME = 'localize-cache.json'
+USER_AGENT = 'obsidian-tools-localizer/1.0'
+# 下载时每次读取的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+class ConnectionPool:
+    """按线程复用的HTTP连接池，同一线程对同一主机保持一个keep-alive连接"""
+
+    def __init__(self, timeout=30, verify_tls=True):
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        if not verify_tls:
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all_connections = []
+
+    def get(self, scheme, netloc):
+        """获取当前线程到指定主机的连接，不存在时新建"""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        conn = connections.get(key)
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout, context=self.ssl_context)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            connections[key] = conn
+            with self._lock:
+                self._all_connections.append(conn)
+        return conn
+
+    def discard(self, scheme, netloc):
+        """关闭并丢弃当前线程到指定主机的连接（服务端关闭或出错时）"""
+        connections = getattr(self._local, 'connections', {})
+        conn = connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close_all(self):
+        """关闭所有线程创建的连接"""
+        with self._lock:
+            for conn in self._all_connections:
+                conn.close()
+            self._all_connections.clear()
+
+
+def collect_remote_attachments(index):
+    """
+    从链接索引中收集所有远程 img-cache 图片链接
+
+    Args:
+        index: 已更新的 VaultLinkIndex
+
+    Returns:
+        dict: 附件名 -> 首次出现的远程URL
+    """
+    remote = {}
+    for note in sorted(index.notes):
+        for kind, raw in index.notes[note]['links']:
+            if kind == 'wiki':
+                continue
+            # 与链接索引使用相同的URL提取规则，附件名中的空格不会截断URL
+            url = link_url(kind, raw)
+            name = img_cache_name(url)
+            if name and urlsplit(url).scheme in ('http', 'https'):
+                remote.setdefault(name, url)
+    return remote
+
+
+def attachment_dest_path(img_cache_dir, name):
+    """
+    返回附件在本地附件目录中的保存路径，附件名会逃出附件目录时返回None
+
+    附件名来自笔记中链接的URL解码结果，不可信：拒绝绝对路径和含 .. 的名称，
+    并检查解析符号链接后的路径仍位于附件目录内。
+
+    Args:
+        img_cache_dir: 附件目录
+        name: 附件名（可含子目录）
+
+    Returns:
+        str: 保存路径，不安全时为None
+    """
+    parts = name.replace('\\', '/').split('/')
+    if os.path.isabs(name) or name.startswith(('/', '\\')) or '..' in parts or os.path.splitdrive(name)[0]:
+        return None
+    dest_path = os.path.join(img_cache_dir, name)
+    root = os.path.realpath(img_cache_dir)
+    if not os.path.realpath(dest_path).startswith(root + os.sep):
+        return None
+    return dest_path
+
+
+def build_request_url(url, mirror=None):
+    """
+    生成实际请求的URL：规范化路径编码，并可将 img-cache 之前的部分替换为镜像地址
+
+    Args:
+        url: 笔记中的原始链接
+        mirror: 镜像地址，形如 http://127.0.0.1:8000/img-cache
+
+    Returns:
+        str: 请求URL
+    """
+    if mirror:
+        url = mirror.rstrip('/') + '/' + url.split('/img-cache/', 1)[1]
+    parts = urlsplit(url)
+    path = quote(unquote(parts.path), safe='/')
+    return f"{parts.scheme}://{parts.netloc}{path}" + (f"?{parts.query}" if parts.query else '')
+
+
+def download_attachment(pool, url, dest_path, cache_entry=None, retries=1):
+    """
+    下载单个附件，存在缓存元数据时发送条件请求
+
+    Args:
+        pool: ConnectionPool
+        url: 请求URL
+        dest_path: 本地保存路径
+        cache_entry: 上次下载记录的 {"etag", "last_modified"}
+        retries: 连接失效时的重试次数
+
+    Returns:
+        dict: {"status": "downloaded"|"not_modified"|"failed", "bytes", "etag", "last_modified", "error"}
+    """
+    parts = urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else '')
+    headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'}
+    if cache_entry and os.path.exists(dest_path):
+        if cache_entry.get('etag'):
+            headers['If-None-Match'] = cache_entry['etag']
+        if cache_entry.get('last_modified'):
+            headers['If-Modified-Since'] = cache_entry['last_modified']
+
+    for attempt in range(retries + 1):
+        conn = pool.get(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', target, headers=headers)
+            response = conn.getresponse()
+            if response.status == 304:
+                response.read()
+                result = {'status': 'not_modified', 'bytes': 0}
+            elif response.status == 200:
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                tmp_path = dest_path + '.part'
+                size = 0
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        while True:
+                            chunk = response.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            size += len(chunk)
+                    # read(amt) 在连接提前关闭时不报错，按 Content-Length 检查是否完整
+                    expected = response.getheader('Content-Length')
+                    if expected is not None and expected.isdigit() and size != int(expected):
+                        raise http.client.IncompleteRead(b'', int(expected) - size)
+                    os.replace(tmp_path, dest_path)
+                except BaseException:
+                    # 下载中断时删除不完整的临时文件
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+                result = {
+                    'status': 'downloaded',
+                    'bytes': size,
+                    'etag': response.getheader('ETag'),
+                    'last_modified': response.getheader('Last-Modified'),
+                }
+            else:
+                response.read()
+                result = {'status': 'failed', 'bytes': 0, 'error': f"HTTP {response.status}"}
+
+            if response.will_close:
+                pool.discard(parts.scheme, parts.netloc)
+            return result
+        except (http.client.HTTPException, OSError) as e:
+            # keep-alive连接可能已被服务端关闭，丢弃后用新连接重试
+            pool.discard(parts.scheme, parts.netloc)
+            if attempt == retries:
+                return {'status': 'failed', 'bytes': 0, 'error': str(e)}
+
+
+def localize_attachments(folder_path, workers=8, refresh=False, mirror=None, timeout=30, verify_tls=True):
+    """
+    下载库中远程 img-cache 链接对应的缺失附件
+
+    Args:
+        folder_path: Obsidian库根目录
+        workers: 并发下载线程数
+        refresh: 是否对已存在的附件发送条件请求以检查更新
+        mirror: 镜像地址，替换链接中 img-cache 之前的部分
+        timeout: 单个连接的超时时间（秒）
+        verify_tls: 是否校验HTTPS证书
+
+    Returns:
+        dict: 统计信息 {"total", "downloaded", "not_modified", "skipped", "failed", "bytes"}
+    """
+    index = VaultLinkIndex(folder_path)
+    index.load()
+    index.update()
+    index.save()
+
+    cache_file = os.path.join(index.folder_path, STATE_DIR, LOCALIZE_CACHE_FILE_NAME)
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    remote = collect_remote_attachments(index)
+    img_cache_dir = os.path.join(index.folder_path, IMG_CACHE_DIR)
+    stats = {'total': len(remote), 'downloaded': 0, 'not_modified': 0, 'skipped': 0, 'failed': [], 'bytes': 0}
+
+    jobs = []
+    for name, url in remote.items():
+        dest_path = attachment_dest_path(img_cache_dir, name)
+        if dest_path is None:
+            stats['failed'].append((name, url, '附件名不安全（绝对路径或包含 ..），已跳过'))
+            print(f"[FAIL] {name}: 附件名不安全（绝对路径或包含 ..），已跳过")
+            continue
+        if os.path.exists(dest_path) and not refresh:
+            stats['skipped'] += 1
+            continue
+        jobs.append((name, build_request_url(url, mirror), dest_path))
+
+    pool = ConnectionPool(timeout=timeout, verify_tls=verify_tls)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [(name, url, executor.submit(download_attachment, pool, url, dest_path, cache.get(name)))
+                       for name, url, dest_path in jobs]
+            for name, url, future in futures:
+                result = future.result()
+                if result['status'] == 'failed':
+                    stats['failed'].append((name, url, result['error']))
+                    print(f"[FAIL] {name}: {result['error']}")
+                    continue
+                stats[result['status']] += 1
+                stats['bytes'] += result['bytes']
+                if result['status'] == 'downloaded':
+                    cache[name] = {'etag': result['etag'], 'last_modified': result['last_modified']}
+                    print(f"[OK] {name} ({result['bytes']} 字节)")
+    finally:
+        pool.close_all()
+
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载远程img-cache图片到本地并改写为本地链接（模式3）')
+    parser.add_argument('folder_path', help='Obsidian库根目录')
+    parser.add_argument('--workers', type=int, default=8, help='并发下载线程数（默认8）')
+    parser.add_argument('--timeout', type=float, default=30, help='连接超时秒数（默认30）')
+    parser.add_argument('--refresh', action='store_true', help='对已存在的附件发送条件请求检查更新')
+    parser.add_argument('--mirror', help='替换链接中 img-cache 之前部分的镜像地址，如 http://127.0.0.1:8000/img-cache')
+    parser.add_argument('--insecure', action='store_true', help='不校验HTTPS证书（内网自签名证书）')
+    parser.add_argument('--no-rewrite', action='store_true', help='只下载，不执行模式3的链接改写')
+    parser.add_argument('--force', action='store_true', help='存在下载失败时仍然执行链接改写')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder_path):
+        print(f"错误: {args.folder_path} 不是有效的目录路径。")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    stats = localize_attachments(args.folder_path, workers=args.workers, refresh=args.refresh,
+                                 mirror=args.mirror, timeout=args.timeout, verify_tls=not args.insecure)
+    elapsed = time.perf_counter() - start
+    print(f"远程附件 {stats['total']} 个: 下载 {stats['downloaded']} 个（{stats['bytes']} 字节），"
+          f"未变化 {stats['not_modified']} 个，已存在 {stats['skipped']} 个，失败 {len(stats['failed'])} 个，"
+          f"耗时 {elapsed:.2f} 秒")
+
+    if args.no_rewrite:
+        return
+    if stats['failed'] and not args.force:
+        print("存在下载失败的附件，未执行链接改写。可使用 --force 强制改写。")
+        sys.exit(1)
+    process_folder(args.folder_path, 3)
+
+
+if __name__ == "__main__":
+    main()
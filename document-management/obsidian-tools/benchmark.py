@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+obsidian-tools 性能基准工具
+
+功能说明：
+1. 生成合成的Obsidian库：可配置笔记数量、笔记大小、链接密度和附件数量
+2. 对每种模式测量端到端耗时（process_folder），以及分阶段耗时（遍历、读取、替换、写回）
+3. 将结果保存为JSON基线，并与已有基线比较以发现性能回退
+4. 完全离线运行，所有数据都在临时目录中生成
+
+使用方法：
+    python benchmark.py [--notes 2000] [--note-size 4096] [--link-density 3] [--linked-fraction 0.2]
+                        [--attachments 500] [--modes 1,3,6,7,8] [--repeat 3]
+                        [--save results.json] [--compare baseline.json] [--threshold 20]
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+
+from link_engine import IMG_CACHE_DIR, PathExcluder, walk_notes, read_candidate_file
+from obsidian_link_replace import get_mode_anchors, rewrite_content, process_folder
+
+GITHUB_BASE = 'https://raw.githubusercontent.com/TerraMatrix/wiki-cache/master/img-cache'
+GITEA_BASE = 'https://tmcodeserver/gitea/TerraMatrix/wiki-cache/raw/branch/master/img-cache'
+GITEA_3000_BASE = 'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache'
+# 合成正文使用的中英文混合词表
+FILLER_WORDS = ['配置', '文档', '接口', '部署', '测试', 'build', 'release', 'vcpkg', 'cmake',
+                '说明', '示例', 'python', 'obsidian', '图片', '链接', 'module', '数据', 'render']
+ALL_MODES = [1, 2, 3, 4, 5, 6, 7, 8]
+PHASES = ['walk', 'read', 'rewrite', 'write']
+
+
+def generate_vault(folder_path, notes=2000, note_size=4096, link_density=3.0, linked_fraction=0.2,
+                   attachments=500, seed=42, local_root=None):
+    """
+    生成合成的Obsidian库
+
+    Args:
+        folder_path: 库根目录（不存在时创建）
+        notes: 笔记数量
+        note_size: 每篇笔记的近似字节数
+        link_density: 含链接笔记中平均每篇的图片链接数
+        linked_fraction: 含图片链接的笔记比例（其余笔记不含任何锚点，用于衡量预筛选效果）
+        attachments: 附件数量
+        seed: 随机种子，保证相同参数生成相同的库
+        local_root: 本地 file:// 链接使用的库路径，库会被复制到其他位置运行时指定，默认为 folder_path
+
+    Returns:
+        dict: 生成统计 {"notes", "attachments", "links", "bytes"}
+    """
+    rng = random.Random(seed)
+    img_cache_dir = os.path.join(folder_path, IMG_CACHE_DIR)
+    os.makedirs(img_cache_dir, exist_ok=True)
+    local_base = 'file://' + (local_root or folder_path).replace(os.sep, '/') + '/' + IMG_CACHE_DIR
+
+    attachment_names = []
+    for i in range(attachments):
+        name = f"Pasted image {20240000 + i}.png" if i % 2 else f"img-{i:05d}.png"
+        attachment_names.append(name)
+        with open(os.path.join(img_cache_dir, name), 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n' + rng.randbytes(rng.randint(64, 512)))
+
+    def make_link():
+        name = rng.choice(attachment_names) if attachment_names else 'missing.png'
+        kind = rng.randrange(6)
+        if kind == 0:
+            return f"![[{name}]]"
+        if kind == 1:
+            return f"![{name}]({GITHUB_BASE}/{name.replace(' ', '%20')})"
+        if kind == 2:
+            return f"![]({GITEA_BASE}/{name.replace(' ', '%20')})"
+        if kind == 3:
+            return f'<img src="{GITEA_3000_BASE}/{name}" alt="{name}" />'
+        if kind == 4:
+            return f"![]({local_base}/{name.replace(' ', '%20')})"
+        return f"![截图]({name.replace(' ', '%20')})"
+
+    total_links = 0
+    total_bytes = 0
+    for i in range(notes):
+        note_dir = os.path.join(folder_path, f"notes-{i // 100:03d}")
+        os.makedirs(note_dir, exist_ok=True)
+        links = []
+        if rng.random() < linked_fraction:
+            links = [make_link() for _ in range(max(1, round(rng.expovariate(1 / link_density))))]
+        total_links += len(links)
+
+        lines = [f"# 笔记 {i}", '']
+        size = 0
+        while size < note_size:
+            line = ' '.join(rng.choice(FILLER_WORDS) for _ in range(12))
+            if links and rng.random() < 0.2:
+                line += ' ' + links.pop()
+            lines.append(line)
+            size += len(line.encode('utf-8')) + 1
+        lines.extend(links)
+        content = '\n'.join(lines) + '\n'
+        total_bytes += len(content.encode('utf-8'))
+        with open(os.path.join(note_dir, f"note-{i:06d}.md"), 'w', encoding='utf-8', newline='\n') as f:
+            f.write(content)
+
+    return {'notes': notes, 'attachments': attachments, 'links': total_links, 'bytes': total_bytes}
+
+
+def time_end_to_end(folder_path, mode):
+    """端到端运行 process_folder，返回 (耗时秒, 统计信息)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        stats = process_folder(folder_path, mode, PathExcluder())
+        elapsed = time.perf_counter() - start
+    return elapsed, stats
+
+
+def time_phases(folder_path, mode):
+    """
+    按阶段运行与 process_folder 相同的处理流程，分别计时
+
+    Returns:
+        dict: 阶段名 -> 耗时秒，另含 changed（变化笔记数）
+    """
+    timings = dict.fromkeys(PHASES, 0.0)
+
+    start = time.perf_counter()
+    note_paths = list(walk_notes(folder_path, PathExcluder()))
+    timings['walk'] = time.perf_counter() - start
+
+    anchors = get_mode_anchors(mode, folder_path)
+    start = time.perf_counter()
+    contents = [(path, read_candidate_file(path, anchors)) for path in note_paths]
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rewritten = []
+    for path, content in contents:
+        if content is None:
+            continue
+        new_content = rewrite_content(content, mode, folder_path)
+        if new_content != content:
+            rewritten.append((path, new_content))
+    timings['rewrite'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path, content in rewritten:
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(content)
+    timings['write'] = time.perf_counter() - start
+
+    timings['changed'] = len(rewritten)
+    return timings
+
+
+def run_benchmark(base_vault, work_vault, modes, repeat, vault_bytes):
+    """
+    对每种模式在库的全新副本（work_vault）上运行基准，每项取多次运行中的最小值
+
+    Returns:
+        dict: 模式 -> 结果
+    """
+    results = {}
+    for mode in modes:
+        best_total = None
+        best_phases = None
+        changed = 0
+        for _ in range(repeat):
+            shutil.copytree(base_vault, work_vault)
+            elapsed, stats = time_end_to_end(work_vault, mode)
+            shutil.rmtree(work_vault)
+            changed = stats['changed']
+            best_total = elapsed if best_total is None else min(best_total, elapsed)
+
+            shutil.copytree(base_vault, work_vault)
+            phases = time_phases(work_vault, mode)
+            shutil.rmtree(work_vault)
+            if best_phases is None:
+                best_phases = phases
+            else:
+                for phase in PHASES:
+                    best_phases[phase] = min(best_phases[phase], phases[phase])
+
+        results[str(mode)] = {
+            'end_to_end_s': round(best_total, 6),
+            'phases_s': {phase: round(best_phases[phase], 6) for phase in PHASES},
+            'changed_notes': changed,
+            'mb_per_s': round(vault_bytes / (1024 * 1024) / best_total, 2) if best_total else None,
+        }
+        print(f"模式{mode}: 端到端 {best_total * 1000:.1f} ms，变化笔记 {changed} 篇，"
+              + "，".join(f"{phase} {best_phases[phase] * 1000:.1f} ms" for phase in PHASES))
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    与基线比较端到端耗时
+
+    Args:
+        results: 本次结果（模式 -> 结果）
+        baseline: 基线文件内容
+        threshold: 允许的耗时增长百分比
+
+    Returns:
+        list: 超过阈值的回退描述
+    """
+    regressions = []
+    for mode, result in results.items():
+        base = baseline.get('results', {}).get(mode)
+        if not base or not base.get('end_to_end_s'):
+            continue
+        change = (result['end_to_end_s'] - base['end_to_end_s']) / base['end_to_end_s'] * 100
+        print(f"模式{mode}: {base['end_to_end_s'] * 1000:.1f} ms -> {result['end_to_end_s'] * 1000:.1f} ms（{change:+.1f}%）")
+        if change > threshold:
+            regressions.append(f"模式{mode} 耗时增加 {change:.1f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='obsidian-tools 替换模式性能基准（离线）')
+    parser.add_argument('--notes', type=int, default=2000, help='笔记数量（默认2000）')
+    parser.add_argument('--note-size', type=int, default=4096, help='每篇笔记的近似字节数（默认4096）')
+    parser.add_argument('--link-density', type=float, default=3.0, help='含链接笔记平均每篇的图片链接数（默认3）')
+    parser.add_argument('--linked-fraction', type=float, default=0.2, help='含图片链接的笔记比例（默认0.2）')
+    parser.add_argument('--attachments', type=int, default=500, help='附件数量（默认500）')
+    parser.add_argument('--modes', default=','.join(map(str, ALL_MODES)), help='要测试的模式，逗号分隔（默认全部）')
+    parser.add_argument('--repeat', type=int, default=3, help='每种模式重复次数，取最小值（默认3）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子（默认42）')
+    parser.add_argument('--save', help='将结果保存为JSON基线文件')
+    parser.add_argument('--compare', help='与指定的JSON基线文件比较')
+    parser.add_argument('--threshold', type=float, default=20.0, help='判定为性能回退的耗时增长百分比（默认20）')
+    args = parser.parse_args()
+
+    try:
+        modes = [int(mode) for mode in args.modes.split(',') if mode.strip()]
+    except ValueError:
+        print(f"错误: 无效的模式列表 {args.modes}")
+        sys.exit(1)
+    invalid = [mode for mode in modes if mode not in ALL_MODES]
+    if invalid:
+        print(f"错误: 无效的模式 {invalid}，必须为 1 ~ 8。")
+        sys.exit(1)
+
+    params = {
+        'notes': args.notes, 'note_size': args.note_size, 'link_density': args.link_density,
+        'linked_fraction': args.linked_fraction, 'attachments': args.attachments, 'seed': args.seed,
+    }
+
+    with tempfile.TemporaryDirectory(prefix='obsidian-bench-') as work_root:
+        base_vault = os.path.join(work_root, 'vault')
+        # 每次运行都在同一路径的全新副本上进行，模式4/5的本地链接需要与该路径一致
+        work_vault = os.path.join(work_root, 'run')
+        start = time.perf_counter()
+        vault_stats = generate_vault(base_vault, args.notes, args.note_size, args.link_density,
+                                     args.linked_fraction, args.attachments, args.seed, local_root=work_vault)
+        print(f"已生成合成库: {vault_stats['notes']} 篇笔记，{vault_stats['links']} 个链接，"
+              f"{vault_stats['attachments']} 个附件，{vault_stats['bytes']} 字节，"
+              f"耗时 {time.perf_counter() - start:.2f} 秒")
+        results = run_benchmark(base_vault, work_vault, modes, max(1, args.repeat), vault_stats['bytes'])
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'vault': vault_stats,
+        'results': results,
+    }
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print("警告: 基线的生成参数与本次不同，比较结果仅供参考。")
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            for regression in regressions:
+                print(f"[REGRESSION] {regression}")
+            sys.exit(1)
+        print("[OK] 未发现超过阈值的性能回退")
+
+
+if __name__ == "__main__":
+    main()
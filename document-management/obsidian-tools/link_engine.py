@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Obsidian链接改写规则引擎
+
+功能说明：
+1. 从规则文件（JSON，安装了PyYAML时也支持YAML）读取命名端点、改写方向和内链/图片的HTML模板
+2. 规则文件按内容哈希缓存编译结果，同一进程内只编译一次；文件修改后自动重新编译
+3. 每种模式的所有字面量链接前缀合并为一个正则，一次遍历完成替换并按规则统计命中次数
+4. 提供库遍历、排除规则、字节级预筛选、预演和统计等公共功能，
+   obsidian_link_replace.py 和 markdown-attachment.py 只是使用不同预设的薄包装
+
+规则文件查找顺序：
+    --rules 指定的文件 > <folder_path>/.obsidian-tools/link-rules.{json,yaml,yml} > 脚本目录下的 link_rules.json
+
+使用方法：
+    python link_engine.py <folder_path> <mode> [--preset obsidian] [--rules FILE] [--dry-run] [--diff]
+    python link_engine.py --list [--preset obsidian] [--rules FILE]
+"""
+
+import os
+import sys
+import re
+import mmap
+import json
+import fnmatch
+import difflib
+import hashlib
+import argparse
+
+# 超过该大小（字节）的笔记使用 mmap 进行预筛选，避免整个读入内存
+MMAP_THRESHOLD = 1024 * 1024
+
+# 图片附件目录（相对于库根目录）
+IMG_CACHE_DIR = '附件/img-cache'
+# 工具自身的状态文件（索引、缓存等）目录（相对于库根目录）
+STATE_DIR = '.obsidian-tools'
+# 库级配置文件（相对于库根目录）
+CONFIG_FILE = STATE_DIR + '/config.json'
+# 库级规则文件（相对于库根目录），按顺序查找
+VAULT_RULES_FILES = [STATE_DIR + '/link-rules.json', STATE_DIR + '/link-rules.yaml', STATE_DIR + '/link-rules.yml']
+# 随脚本提供的默认规则文件
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'link_rules.json')
+DEFAULT_PRESET = 'obsidian'
+
+# 默认排除的目录：不包含需要改写的笔记，遍历时整棵子树跳过
+DEFAULT_EXCLUDE_DIRS = ['.obsidian', '.git', '.trash', STATE_DIR, '附件']
+# 默认排除的笔记（包含示例链接的说明文档，不应被改写）
+DEFAULT_EXCLUDE_FILES = ["wiki图床链接自动替换脚本.md",
+                         "2024-02-21 小组会议.md",
+                         "vcpkg手册.md",
+                         "Markdown Reference.md",
+                         "从0开始小组知识共享.md"]
+
+# Obsidian内嵌链接 ![[...]]
+WIKI_EMBED_PATTERN = re.compile(r'!\[\[(.*?)\]\]')
+# Markdown格式图片链接 ![title](link)
+MARKDOWN_IMAGE_PATTERN = re.compile(r'!\[(.*?)\]\((.*?)\)')
+# HTML格式图片链接 <img src="link" ...>
+HTML_IMG_PATTERN = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+
+
+def compile_globs(patterns):
+    """
+    将多个glob模式合并编译为一个正则表达式，避免逐个模式线性匹配。
+
+    :param patterns: glob模式列表
+    :return: 编译后的正则表达式，模式为空时返回None
+    """
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+class PathExcluder:
+    """
+    库内路径排除规则。
+
+    不含 / 的模式匹配文件名或目录名，含 / 的模式匹配库内相对路径（以 / 分隔）。
+    """
+
+    def __init__(self, exclude_dirs=None, exclude_files=None):
+        self.exclude_dirs = list(DEFAULT_EXCLUDE_DIRS if exclude_dirs is None else exclude_dirs)
+        self.exclude_files = list(DEFAULT_EXCLUDE_FILES if exclude_files is None else exclude_files)
+        self._dir_regexes = self._compile(self.exclude_dirs)
+        self._file_regexes = self._compile(self.exclude_files)
+
+    @staticmethod
+    def _compile(patterns):
+        """将模式分为匹配名称和匹配相对路径的两组，分别编译为 (名称正则, 路径正则)"""
+        name_patterns = [pattern for pattern in patterns if '/' not in pattern]
+        path_patterns = [pattern.strip('/') for pattern in patterns if '/' in pattern]
+        return compile_globs(name_patterns), compile_globs(path_patterns)
+
+    @staticmethod
+    def _match(regexes, rel_path):
+        name_regex, path_regex = regexes
+        if name_regex is not None and name_regex.match(rel_path.rsplit('/', 1)[-1]) is not None:
+            return True
+        return path_regex is not None and path_regex.match(rel_path) is not None
+
+    def is_dir_excluded(self, rel_path):
+        """目录（库内相对路径）是否整棵子树跳过"""
+        return self._match(self._dir_regexes, rel_path)
+
+    def is_file_excluded(self, rel_path):
+        """笔记（库内相对路径）是否跳过"""
+        return self._match(self._file_regexes, rel_path)
+
+def load_excluder(folder_path):
+    """
+    从库级配置文件 .obsidian-tools/config.json 加载排除规则。
+
+    配置文件示例：
+        {"exclude_dirs": [".git", ".obsidian", "附件", "归档/*"], "exclude_files": ["*.excalidraw.md"]}
+    未配置的项使用默认规则。
+
+    :param folder_path: 库根目录
+    :return: PathExcluder
+    """
+    config_path = os.path.join(folder_path, CONFIG_FILE)
+    if not os.path.isfile(config_path):
+        return PathExcluder()
+
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except ValueError as e:
+        raise ValueError(f"配置文件格式错误 {config_path}: {e}")
+
+    return PathExcluder(config.get('exclude_dirs'), config.get('exclude_files'))
+
+def walk_notes(folder_path, excluder=None):
+    """
+    遍历库中需要处理的笔记，排除的目录在遍历时整棵剪枝，不会进入。
+
+    :param folder_path: 库根目录
+    :param excluder: PathExcluder，为None时从库级配置文件加载
+    :return: 笔记文件路径生成器
+    """
+    if excluder is None:
+        excluder = load_excluder(folder_path)
+
+    for root, dirs, files in os.walk(folder_path):
+        rel_root = os.path.relpath(root, folder_path).replace(os.sep, '/')
+        prefix = '' if rel_root == '.' else rel_root + '/'
+        dirs[:] = [d for d in dirs if not excluder.is_dir_excluded(prefix + d)]
+        for file in files:
+            if file.endswith('.md') and not excluder.is_file_excluded(prefix + file):
+                yield os.path.join(root, file)
+
+def read_candidate_file(file_path, anchors):
+    """
+    在字节层面预筛选笔记，只有包含锚点的笔记才会被解码。
+
+    小文件直接读取字节后查找，大文件使用 mmap 查找，未命中时无需整体读入内存。
+
+    :param file_path: 笔记文件路径
+    :param anchors: 字节串锚点列表
+    :return: 命中时返回解码后的文本内容，否则返回None
+    """
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if not any(mapped.find(anchor) != -1 for anchor in anchors):
+                    return None
+                data = mapped[:]
+        else:
+            data = file.read()
+            if not any(anchor in data for anchor in anchors):
+                return None
+
+    # 与文本模式读取保持一致：统一换行符为 LF
+    return data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+class LinkProgram:
+    """
+    某个预设下某个模式针对某个库编译好的改写程序。
+
+    由 LinkRules.program() 创建并缓存，端点URL中的 {vault} 已替换为库路径。
+    """
+
+    def __init__(self, steps, anchors, local_dir):
+        # 每一步为 (类型, 参数)，见 LinkRules._build_program
+        self.steps = steps
+        # 字节串锚点：笔记不包含任何锚点时所有步骤都不可能匹配
+        self.anchors = anchors
+        # 本地附件目录，内链步骤用于检查附件是否存在
+        self.local_dir = local_dir
+
+    def rewrite(self, content, rule_counts=None):
+        """
+        在内存中依次执行各步骤。
+
+        :param content: 笔记内容
+        :param rule_counts: 规则名 -> 替换次数，为None时不统计
+        :return: 替换后的内容
+        """
+        counts = {}
+        for kind, params in self.steps:
+            if kind == 'rewrite':
+                pattern, targets = params
+
+                def replace_literal(match):
+                    replacement, rule_name = targets[match.group(0)]
+                    counts[rule_name] = counts.get(rule_name, 0) + 1
+                    return replacement
+
+                content = pattern.sub(replace_literal, content)
+            elif kind == 'embed':
+                url, template, require_local, rule_name = params
+                exists = {}
+
+                def replace_embed(match):
+                    name = match.group(1)
+                    if require_local:
+                        if name not in exists:
+                            exists[name] = os.path.exists(os.path.join(self.local_dir, name))
+                        if not exists[name]:
+                            return match.group(0)
+                    counts[rule_name] = counts.get(rule_name, 0) + 1
+                    return template.format(url=url, name=name)
+
+                content = WIKI_EMBED_PATTERN.sub(replace_embed, content)
+            elif kind == 'image':
+                template, no_title_template, rule_name = params
+
+                def replace_image(match):
+                    title, link = match.group(1), match.group(2)
+                    # 如果 title 为空，使用不包含 alt 属性的模板
+                    return (template if title else no_title_template).format(link=link, title=title)
+
+                content, count = MARKDOWN_IMAGE_PATTERN.subn(replace_image, content)
+                if count:
+                    counts[rule_name] = counts.get(rule_name, 0) + count
+
+        if rule_counts is not None:
+            for rule_name, count in counts.items():
+                rule_counts[rule_name] = rule_counts.get(rule_name, 0) + count
+        return content
+
+
+class LinkRules:
+    """
+    编译后的规则文件。
+
+    构造时校验端点、模板和各预设的步骤，具体库的改写程序在第一次使用时生成并缓存。
+    """
+
+    def __init__(self, config, source='<rules>'):
+        self.source = source
+        if not isinstance(config, dict):
+            raise ValueError(f"规则文件格式错误 {source}: 顶层必须是对象")
+        self.endpoints = config.get('endpoints') or {}
+        self.templates = config.get('templates') or {}
+        self.presets = config.get('presets') or {}
+        # (预设, 模式, 库路径) -> LinkProgram
+        self._programs = {}
+        self._validate()
+
+    def _error(self, message):
+        return ValueError(f"规则文件错误 {self.source}: {message}")
+
+    def _endpoint(self, name):
+        endpoint = self.endpoints.get(name)
+        if not isinstance(endpoint, dict) or not endpoint.get('url'):
+            raise self._error(f"未定义端点 {name!r} 或缺少 url")
+        return endpoint
+
+    def _template(self, name, fields):
+        template = self.templates.get(name)
+        if not isinstance(template, str):
+            raise self._error(f"未定义模板 {name!r}")
+        try:
+            template.format(**{field: '' for field in fields})
+        except (KeyError, IndexError, ValueError) as e:
+            raise self._error(f"模板 {name!r} 只能使用 {', '.join('{' + f + '}' for f in fields)}: {e}")
+        return template
+
+    def _validate(self):
+        if not self.presets:
+            raise self._error("没有定义任何预设")
+        for preset_name, preset in self.presets.items():
+            modes = preset.get('modes') if isinstance(preset, dict) else None
+            if not modes:
+                raise self._error(f"预设 {preset_name!r} 没有定义任何模式")
+            # YAML中的模式号会被解析为整数，统一为字符串
+            modes = preset['modes'] = {str(mode): spec for mode, spec in modes.items()}
+            for mode, spec in modes.items():
+                for step in spec.get('steps') or []:
+                    if 'rewrite' in step:
+                        for name in step['rewrite']:
+                            self._endpoint(name)
+                        self._endpoint(step.get('to'))
+                    elif 'embed' in step:
+                        self._endpoint(step['embed'])
+                        self._template(step.get('template'), ['url', 'name'])
+                    elif 'image' in step:
+                        self._template(step['image'], ['link', 'title'])
+                        self._template(step.get('no_title', step['image']), ['link', 'title'])
+                    else:
+                        raise self._error(f"预设 {preset_name!r} 模式 {mode} 包含未知步骤 {step!r}")
+
+    def modes(self, preset):
+        """预设下定义的模式及说明，按模式号排序"""
+        if preset not in self.presets:
+            raise self._error(f"未定义预设 {preset!r}")
+        modes = self.presets[preset]['modes']
+        return [(int(mode) if mode.isdigit() else mode, modes[mode].get('description', ''))
+                for mode in sorted(modes, key=lambda m: (not m.isdigit(), int(m) if m.isdigit() else 0, m))]
+
+    def program(self, preset, mode, folder_path):
+        """
+        获取预设中某个模式针对指定库的改写程序（缓存）
+
+        :param preset: 预设名
+        :param mode: 模式号
+        :param folder_path: 库根目录
+        :return: LinkProgram
+        """
+        key = (preset, str(mode), folder_path)
+        program = self._programs.get(key)
+        if program is None:
+            program = self._programs[key] = self._build_program(preset, str(mode), folder_path)
+        return program
+
+    def _build_program(self, preset, mode, folder_path):
+        if preset not in self.presets:
+            raise self._error(f"未定义预设 {preset!r}")
+        spec = self.presets[preset]['modes'].get(mode)
+        if spec is None:
+            raise self._error(f"预设 {preset!r} 中未定义模式 {mode}")
+
+        vault = folder_path.replace(os.sep, '/')
+
+        def endpoint_url(name):
+            return self._endpoint(name)['url'].replace('{vault}', vault)
+
+        def endpoint_literals(name):
+            endpoint = self._endpoint(name)
+            return [literal.replace('{vault}', vault) for literal in endpoint.get('match') or [endpoint['url']]]
+
+        def label(name):
+            return self._endpoint(name).get('label', name)
+
+        steps = []
+        anchors = []
+        for step in spec.get('steps') or []:
+            if 'rewrite' in step:
+                target = step['to']
+                replacement = endpoint_url(target)
+                targets = {}
+                for source in step['rewrite']:
+                    rule_name = f"{label(source)} -> {label(target)}"
+                    for literal in endpoint_literals(source):
+                        targets.setdefault(literal, (replacement, rule_name))
+                # 所有来源前缀合并为一个正则，较长的前缀优先匹配
+                alternation = '|'.join(re.escape(literal) for literal in sorted(targets, key=len, reverse=True))
+                steps.append(('rewrite', (re.compile(alternation), targets)))
+                anchors.extend(literal.encode('utf-8') for literal in targets)
+            elif 'embed' in step:
+                template = self._template(step['template'], ['url', 'name'])
+                rule_name = f"内链 -> {label(step['embed'])} HTML"
+                steps.append(('embed', (endpoint_url(step['embed']), template,
+                                        bool(step.get('require_local')), rule_name)))
+                anchors.append(b'![[')
+            elif 'image' in step:
+                template = self._template(step['image'], ['link', 'title'])
+                no_title_template = self._template(step.get('no_title', step['image']), ['link', 'title'])
+                steps.append(('image', (template, no_title_template, 'Markdown图片 -> HTML')))
+                anchors.append(b'![')
+
+        local_dir = vault + '/' + IMG_CACHE_DIR
+        return LinkProgram(steps, list(dict.fromkeys(anchors)), local_dir)
+
+
+# 规则文件路径 -> (mtime_ns, size, 内容哈希)
+_rules_signatures = {}
+# 内容哈希 -> LinkRules
+_compiled_rules = {}
+
+def find_rules_file(folder_path=None, rules_path=None):
+    """
+    确定使用的规则文件
+
+    :param folder_path: 库根目录，用于查找库级规则文件
+    :param rules_path: 显式指定的规则文件
+    :return: 规则文件路径
+    """
+    if rules_path:
+        return rules_path
+    if folder_path:
+        for rel_path in VAULT_RULES_FILES:
+            path = os.path.join(folder_path, rel_path)
+            if os.path.isfile(path):
+                return path
+    return DEFAULT_RULES_FILE
+
+def parse_rules(data, source):
+    """按扩展名解析规则文件内容，YAML需要安装PyYAML"""
+    text = data.decode('utf-8')
+    if source.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"读取YAML规则文件 {source} 需要安装PyYAML（pip install pyyaml），或改用JSON格式")
+        try:
+            return yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"规则文件格式错误 {source}: {e}")
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"规则文件格式错误 {source}: {e}")
+
+def load_rules(rules_path):
+    """
+    加载并编译规则文件。
+
+    文件 (mtime, size) 未变化时直接复用上次的结果；变化时重新读取并计算哈希，
+    内容哈希相同（如只是touch）时复用已编译的规则。
+
+    :param rules_path: 规则文件路径
+    :return: LinkRules
+    """
+    st = os.stat(rules_path)
+    signature = _rules_signatures.get(rules_path)
+    if signature and signature[0] == st.st_mtime_ns and signature[1] == st.st_size:
+        return _compiled_rules[signature[2]]
+
+    with open(rules_path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    rules = _compiled_rules.get(digest)
+    if rules is None:
+        rules = _compiled_rules[digest] = LinkRules(parse_rules(data, rules_path), rules_path)
+    _rules_signatures[rules_path] = (st.st_mtime_ns, st.st_size, digest)
+    return rules
+
+def load_program(folder_path, mode, preset=DEFAULT_PRESET, rules_path=None):
+    """
+    获取库在指定预设和模式下的改写程序
+
+    :param folder_path: 库根目录
+    :param mode: 模式号
+    :param preset: 预设名
+    :param rules_path: 显式指定的规则文件，为None时按查找顺序确定
+    :return: LinkProgram
+    """
+    rules = load_rules(find_rules_file(folder_path, rules_path))
+    return rules.program(preset, mode, folder_path)
+
+
+def new_run_stats():
+    """创建一次运行的统计信息"""
+    return {
+        'scanned': 0,       # 遍历到的笔记数
+        'candidates': 0,    # 通过字节级预筛选、被解码的笔记数
+        'changed': 0,       # 内容发生变化的笔记数
+        'bytes_before': 0,  # 变化笔记替换前的字节数
+        'bytes_after': 0,   # 变化笔记替换后的字节数
+        'rules': {},        # 规则名 -> 替换次数
+    }
+
+def replace_links_in_file(file_path, program, folder_path, dry_run=False, show_diff=False, stats=None):
+    """
+    对单个笔记执行改写程序。
+
+    :param program: load_program() 获取的 LinkProgram
+    :param dry_run: 为True时只在内存中计算，不写回文件
+    :param show_diff: 是否输出统一diff
+    :param stats: new_run_stats() 创建的统计信息，为None时不统计
+    :return: 笔记内容发生变化时返回True（dry_run时表示将会写回），否则返回False
+    """
+    if stats is not None:
+        stats['scanned'] += 1
+
+    # 字节级预筛选：不包含当前模式任何锚点的笔记不做解码和改写
+    content = read_candidate_file(file_path, program.anchors)
+    if content is None:
+        return False
+    original_content = content
+
+    rule_counts = {}
+    content = program.rewrite(content, rule_counts)
+    if stats is not None:
+        stats['candidates'] += 1
+        for rule_name, count in rule_counts.items():
+            stats['rules'][rule_name] = stats['rules'].get(rule_name, 0) + count
+
+    # 内容没有变化时不写回，避免无意义的修改时间变化（监视模式下也会引起反复触发）
+    if content == original_content:
+        return False
+
+    display_path = file_path.replace(os.sep, '/')
+    rel_path = os.path.relpath(file_path, folder_path).replace(os.sep, '/')
+    if stats is not None:
+        stats['changed'] += 1
+        stats['bytes_before'] += len(original_content.encode('utf-8'))
+        stats['bytes_after'] += len(content.encode('utf-8'))
+    if show_diff:
+        diff = difflib.unified_diff(original_content.splitlines(keepends=True), content.splitlines(keepends=True),
+                                    fromfile=f"a/{rel_path}", tofile=f"b/{rel_path}")
+        sys.stdout.writelines(diff)
+
+    if dry_run:
+        print(f"{display_path} 将被修改（{sum(rule_counts.values())} 处替换）")
+        return True
+
+    # 注意，这里使用 LF 换行符
+    with open(file_path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write(content)
+    print(f"{display_path} 转换完成!")
+    return True
+
+def process_folder(folder_path, program, excluder=None, dry_run=False, show_diff=False):
+    """
+    对文件夹中的所有笔记执行改写程序。
+
+    :return: 本次运行的统计信息
+    """
+    stats = new_run_stats()
+    for file_path in walk_notes(folder_path, excluder):
+        replace_links_in_file(file_path, program, folder_path, dry_run, show_diff, stats)
+    return stats
+
+def print_run_stats(stats, dry_run=False):
+    """打印运行统计：各规则命中次数、变化笔记数和字节数"""
+    print("-" * 50)
+    print(f"{'[dry-run] ' if dry_run else ''}扫描笔记: {stats['scanned']}，预筛选命中: {stats['candidates']}，"
+          f"{'将被修改' if dry_run else '已修改'}: {stats['changed']}")
+    for rule_name, count in sorted(stats['rules'].items()):
+        print(f"  规则 {rule_name}: {count} 处")
+    delta = stats['bytes_after'] - stats['bytes_before']
+    print(f"变化笔记字节数: {stats['bytes_before']} -> {stats['bytes_after']}（{delta:+d}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按规则文件改写Obsidian库中的图片链接')
+    parser.add_argument('folder_path', nargs='?', help='Obsidian库根目录')
+    parser.add_argument('mode', nargs='?', help='模式号（见 --list）')
+    parser.add_argument('--preset', default=DEFAULT_PRESET, help=f'规则预设（默认 {DEFAULT_PRESET}）')
+    parser.add_argument('--rules', help='规则文件（JSON/YAML），默认按库级规则文件、内置规则的顺序查找')
+    parser.add_argument('--dry-run', action='store_true', help='只计算替换结果并输出统计，不写回文件')
+    parser.add_argument('--diff', action='store_true', help='输出每篇变化笔记的统一diff')
+    parser.add_argument('--list', action='store_true', help='列出预设中的模式说明后退出')
+    args = parser.parse_args()
+
+    if args.folder_path and not os.path.isdir(args.folder_path):
+        print(f"错误: {args.folder_path} 不是有效的目录路径。")
+        sys.exit(1)
+
+    try:
+        rules = load_rules(find_rules_file(args.folder_path, args.rules))
+        modes = rules.modes(args.preset)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    if args.list:
+        print(f"规则文件: {rules.source.replace(os.sep, '/')}，预设: {args.preset}")
+        for mode, description in modes:
+            print(f"  模式{mode}: {description}")
+        return
+
+    if not args.folder_path or not args.mode:
+        parser.error('需要指定 folder_path 和 mode')
+    if args.mode not in [str(mode) for mode, _ in modes]:
+        print(f"错误: {args.mode} 不是预设 {args.preset} 中的有效模式。")
+        sys.exit(1)
+
+    try:
+        excluder = load_excluder(args.folder_path)
+        program = rules.program(args.preset, args.mode, args.folder_path)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    stats = process_folder(args.folder_path, program, excluder, dry_run=args.dry_run, show_diff=args.diff)
+    print_run_stats(stats, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
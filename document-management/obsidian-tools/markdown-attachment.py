@@ -1,6 +1,12 @@
 import os
 import sys
-import re
+import argparse
+
+import link_engine
+from link_engine import load_excluder, load_program, load_rules, find_rules_file, print_run_stats
+
+# link_rules.json 中本脚本使用的预设（模式 1 ~ 5，Gitea 使用 tmcodeserver:3000）
+PRESET = 'attachment'
 
 def display_help():
     help_text = """
@@ -28,60 +34,48 @@ def display_help():
     模式5: 将 file://<folder_path>/附件/img-cache 替换为 
            https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache。
 
+    选项:
+    --dry-run  - 只在内存中计算替换结果并输出统计，不写回任何文件
+    --diff     - 输出每个变化文件的统一diff（可与 --dry-run 同时使用）
+    --rules    - 使用指定的规则文件（JSON/YAML），默认依次查找库级 .obsidian-tools/link-rules.json
+                 和脚本目录下的 link_rules.json，使用其中的 attachment 预设
+
     注意事项:
     - 确保文件夹路径有效且包含Markdown文件（.md后缀）。
     - 请在执行前备份文件以防数据丢失。
 
     示例:
     python replace_links.py /path/to/your/folder 1
+    python replace_links.py /path/to/your/folder 3 --dry-run --diff
     """
     print(help_text)
 
-def replace_links_in_file(file_path, mode, folder_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-
-    if mode == 1:
-        content = re.sub(r'https://raw\.githubusercontent\.com/TerraMatrix/wiki-cache/(?:upstream-master|master)/img-cache',
-                         r'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache', content)
-    elif mode == 2:
-        content = re.sub(r'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache',
-                         r'https://raw.githubusercontent.com/TerraMatrix/wiki-cache/master/img-cache', content)
-    elif mode == 3:
-        folder_uri = 'file://' + folder_path.replace(os.sep, '/') + '/附件/img-cache'
-        content = re.sub(r'https://raw\.githubusercontent\.com/TerraMatrix/wiki-cache/(?:upstream-master|master)/img-cache',
-                         folder_uri, content)
-        content = re.sub(r'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache',
-                         folder_uri, content)
-    elif mode == 4:
-        folder_uri = 'file://' + folder_path.replace(os.sep, '/') + '/附件/img-cache'
-        content = re.sub(re.escape(folder_uri),
-                         r'https://raw.githubusercontent.com/TerraMatrix/wiki-cache/master/img-cache', content)
-    elif mode == 5:
-        folder_uri = 'file://' + folder_path.replace(os.sep, '/') + '/附件/img-cache'
-        content = re.sub(re.escape(folder_uri),
-                         r'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache', content)
-
-    # 注意，这里使用 LF 换行符
-    with open(file_path, 'w', encoding='utf-8', newline='\n') as file:
-        file.write(content)
-    print(f"{file_path.replace(os.sep, '/')} 转换完成!")
-
-def process_folder(folder_path, mode):
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith('.md'):
-                file_path = os.path.join(root, file)
-                replace_links_in_file(file_path, mode, folder_path)
+def process_folder(folder_path, mode, dry_run=False, show_diff=False, rules_path=None):
+    """使用规则文件中的 attachment 预设处理文件夹中的所有Markdown文件"""
+    program = load_program(folder_path, mode, PRESET, rules_path)
+    return link_engine.process_folder(folder_path, program, load_excluder(folder_path), dry_run, show_diff)
 
 def main():
-    if len(sys.argv) != 3 or sys.argv[1] in ['help', '--help', '-h']:
+    argv = sys.argv[1:]
+    if not argv or argv[0] in ['help', '--help', '-h']:
+        display_help()
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('folder_path')
+    parser.add_argument('mode')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--diff', action='store_true')
+    parser.add_argument('--rules')
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit:
         display_help()
         sys.exit(1)
 
-    folder_path = sys.argv[1]
+    folder_path = args.folder_path
     try:
-        mode = int(sys.argv[2])
+        mode = int(args.mode)
     except ValueError:
         display_help()
         sys.exit(1)
@@ -90,12 +84,23 @@ def main():
         print(f"错误: {folder_path} 不是有效的目录路径。")
         sys.exit(1)
 
-    if mode not in [1, 2, 3, 4, 5]:
-        print(f"错误: {mode} 不是有效的模式。必须为 1, 2, 3, 4 或 5。\n")
+    try:
+        modes = [m for m, _ in load_rules(find_rules_file(folder_path, args.rules)).modes(PRESET)]
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    if mode not in modes:
+        print(f"错误: {mode} 不是有效的模式。必须为 {', '.join(str(m) for m in modes)}。\n")
         display_help()
         sys.exit(1)
 
-    process_folder(folder_path, mode)
+    try:
+        stats = process_folder(folder_path, mode, dry_run=args.dry_run, show_diff=args.diff, rules_path=args.rules)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print_run_stats(stats, dry_run=args.dry_run)
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,12 @@
 import os
 import sys
-import re
+import argparse
+
+import link_engine
+from link_engine import load_excluder, load_program, load_rules, find_rules_file, print_run_stats
+
+# link_rules.json 中本脚本使用的预设（模式 1 ~ 8）
+PRESET = 'obsidian'
 
 def display_help():
     help_text = """
@@ -11,6 +17,16 @@ def display_help():
     <folder_path>  - 需要遍历的文件夹路径
     <mode>         - 运行模式，可选值为 1, 2, 3, 4, 5, 6, 7, 8
 
+    选项:
+    --watch                 - 监视模式：持续监听笔记变化，只对发生变化的笔记执行所选模式
+                              （启动前请先不带 --watch 处理一次整个文件夹）
+    --debounce <秒>         - 监视模式下笔记停止变化多久后才处理，默认 1.0
+    --poll-interval <秒>    - 不支持inotify时轮询扫描的间隔，默认 2.0
+    --dry-run               - 只在内存中计算替换结果并输出统计，不写回任何文件
+    --diff                  - 输出每篇变化笔记的统一diff（可与 --dry-run 同时使用）
+    --rules <文件>          - 使用指定的规则文件（JSON/YAML），默认依次查找
+                              <folder_path>/.obsidian-tools/link-rules.json 和脚本目录下的 link_rules.json
+
     模式说明:
     模式1: 将GitHub链接替换为Gitea链接。用于外网文档向内网迁移。
 
@@ -28,131 +44,105 @@ def display_help():
     
     模式8: 依次执行模式 6 和模式 7。
 
+    以上模式由规则文件中的 obsidian 预设定义，链接前缀和HTML模板都可在规则文件中修改。
+
+    排除规则:
+    - 默认跳过 .obsidian、.git、.trash、.obsidian-tools、附件 目录以及几篇包含示例链接的说明文档。
+    - 可在 <folder_path>/.obsidian-tools/config.json 中用glob模式自定义：
+      {"exclude_dirs": [".git", "附件", "归档/*"], "exclude_files": ["*.excalidraw.md"]}
+      不含 / 的模式匹配文件名或目录名，含 / 的模式匹配相对于 <folder_path> 的路径。
+
     注意事项:
     - 确保文件夹路径有效且包含Markdown文件（.md后缀）。
     - 请在执行前备份文件以防数据丢失。
 
     示例:
     python replace_links.py /path/to/your/folder 1
+    python replace_links.py /path/to/your/folder 8 --watch
+    python replace_links.py /path/to/your/folder 3 --dry-run --diff
     """
     print(help_text)
     
-def replace_mode6(content, folder_path):
-    # 使用正则表达式匹配所有 [[...]] 中的内容
-    matches = re.findall(r'\[\[(.*?)\]\]', content)
-    
-    # 遍历所有匹配的内容
-    for match in matches:
-        # 拼接文件路径
-        file_path = os.path.join(folder_path, match)
-        
-        # 检查文件路径是否存在
-        if os.path.exists(file_path):
-            # 替换匹配内容为指定的替换文字
-            replacement_text=f"<div align=\"center\"><img src=\"https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache/{match}\" alt=\"{match}\" style=\"zoom:100%;\" /></div>"
-            
-            content = content.replace(f'![[{match}]]', replacement_text)
-    
-    return content
+def get_mode_anchors(mode, folder_path, rules_path=None):
+    """
+    获取指定模式下替换规则的字面量锚点。
 
-def replace_mode7(content):
-    # 正则表达式，用于匹配Markdown格式的图片链接 ![title](link)
-    markdown_image_pattern = r'!\[(.*?)\]\((.*?)\)'
+    笔记中不包含任何锚点时，该模式的所有规则都不可能匹配，可以直接跳过。
 
-    # 替换函数
-    def replace_match(match):
-        title = match.group(1)
-        link = match.group(2)
-        # 如果 title 为空，生成的 HTML 中不包含 alt 属性
-        if title:
-            replacement_text = f'<div align="center"><img src="{link}" alt="{title}" style="zoom:100%;" /></div>'
-        else:
-            replacement_text = f'<div align="center"><img src="{link}" style="zoom:100%;" /></div>'
-        return replacement_text
+    :param mode: 运行模式
+    :param folder_path: 需要遍历的文件夹路径
+    :param rules_path: 规则文件，为None时按默认顺序查找
+    :return: 字节串锚点列表
+    """
+    return load_program(folder_path, mode, PRESET, rules_path).anchors
 
-    # 使用 re.sub() 函数进行替换
-    result = re.sub(markdown_image_pattern, replace_match, content)
+def rewrite_content(content, mode, folder_path, rule_counts=None, rules_path=None):
+    """
+    在内存中对笔记内容执行指定模式的替换。
+
+    :param content: 笔记内容
+    :param mode: 运行模式
+    :param folder_path: 需要遍历的文件夹路径
+    :param rule_counts: 规则名 -> 替换次数，为None时不统计
+    :param rules_path: 规则文件，为None时按默认顺序查找
+    :return: 替换后的内容
+    """
+    return load_program(folder_path, mode, PRESET, rules_path).rewrite(content, rule_counts)
 
-    return result
+def replace_links_in_file(file_path, mode, folder_path, dry_run=False, show_diff=False, stats=None, rules_path=None):
+    """
+    对单个笔记执行指定模式的替换。
 
+    :param dry_run: 为True时只在内存中计算，不写回文件
+    :param show_diff: 是否输出统一diff
+    :param stats: new_run_stats() 创建的统计信息，为None时不统计
+    :param rules_path: 规则文件，为None时按默认顺序查找
+    :return: 笔记内容发生变化时返回True（dry_run时表示将会写回），否则返回False
+    """
+    program = load_program(folder_path, mode, PRESET, rules_path)
+    return link_engine.replace_links_in_file(file_path, program, folder_path, dry_run, show_diff, stats)
 
-def check_file_in_except(file_name):
+def process_folder(folder_path, mode, excluder=None, dry_run=False, show_diff=False, rules_path=None):
     """
-    检查指定文件名是否在队列中。
+    处理文件夹中的所有笔记。
 
-    :param file_name: 要检查的文件名
-    :return: 如果文件名在队列中返回True，否则返回False
+    :return: 本次运行的统计信息
     """
-    file_name_queue = ["wiki图床链接自动替换脚本.md", 
-                       "2024-02-21 小组会议.md",
-                       "vcpkg手册.md",
-                       "Markdown Reference.md",
-                       "从0开始小组知识共享.md"]
-    
-    return file_name in file_name_queue
+    program = load_program(folder_path, mode, PRESET, rules_path)
+    return link_engine.process_folder(folder_path, program, excluder, dry_run, show_diff)
 
-def replace_links_in_file(file_path, mode, folder_path):
-    file_name = os.path.basename(file_path)
-    
-    # 跳过脚本代码
-    if check_file_in_except(file_name):
-        return
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-
-    if mode == 1:
-        content = re.sub(r'https://raw\.githubusercontent\.com/TerraMatrix/wiki-cache/(?:upstream-master|master)/img-cache',
-                         r'https://tmcodeserver/gitea/TerraMatrix/wiki-cache/raw/branch/master/img-cache', content)
-    elif mode == 2:
-        content = re.sub(r'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache',
-                         r'https://raw.githubusercontent.com/TerraMatrix/wiki-cache/master/img-cache', content)
-        content = re.sub(r'https://tmcodeserver/gitea/TerraMatrix/wiki-cache/raw/branch/master/img-cache',
-                         r'https://raw.githubusercontent.com/TerraMatrix/wiki-cache/master/img-cache', content)
-    elif mode == 3:
-        folder_uri = 'file://' + folder_path.replace(os.sep, '/') + '/附件/img-cache'
-        content = re.sub(r'https://raw\.githubusercontent\.com/TerraMatrix/wiki-cache/(?:upstream-master|master)/img-cache',
-                         folder_uri, content)
-        content = re.sub(r'https://tmcodeserver:3000/TerraMatrix/wiki-cache/raw/branch/master/img-cache',
-                         folder_uri, content)
-        content = re.sub(r'https://tmcodeserver/gitea/TerraMatrix/wiki-cache/raw/branch/master/img-cache',
-                         folder_uri, content)
-    elif mode == 4:
-        folder_uri = 'file://' + folder_path.replace(os.sep, '/') + '/附件/img-cache'
-        content = re.sub(re.escape(folder_uri),
-                         r'https://raw.githubusercontent.com/TerraMatrix/wiki-cache/master/img-cache', content)
-    elif mode == 5:
-        folder_uri = 'file://' + folder_path.replace(os.sep, '/') + '/附件/img-cache'
-        content = re.sub(re.escape(folder_uri),
-                         r'https://tmcodeserver/gitea/TerraMatrix/wiki-cache/raw/branch/master/img-cache', content)
-    elif mode == 6:
-        content = replace_mode6(content, folder_path.replace(os.sep, '/') + '/附件/img-cache')
-    elif mode == 7:
-        content = replace_mode7(content)
-    elif mode == 8:
-        content = replace_mode6(content, folder_path.replace(os.sep, '/') + '/附件/img-cache')
-        content = replace_mode7(content)
-
-    # 注意，这里使用 LF 换行符
-    with open(file_path, 'w', encoding='utf-8', newline='\n') as file:
-        file.write(content)
-    print(f"{file_path.replace(os.sep, '/')} 转换完成!")
-
-def process_folder(folder_path, mode):
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith('.md'):
-                file_path = os.path.join(root, file)
-                replace_links_in_file(file_path, mode, folder_path)
+def parse_arguments(argv):
+    """
+    解析命令行参数，参数错误时显示帮助信息并退出。
 
-def main():
-    if len(sys.argv) != 3 or sys.argv[1] in ['help', '--help', '-h']:
+    :param argv: 命令行参数（不含脚本名）
+    :return: argparse.Namespace
+    """
+    if not argv or argv[0] in ['help', '--help', '-h']:
         display_help()
         sys.exit(1)
 
-    folder_path = sys.argv[1]
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('folder_path')
+    parser.add_argument('mode')
+    parser.add_argument('--watch', action='store_true')
+    parser.add_argument('--debounce', type=float, default=1.0)
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--diff', action='store_true')
+    parser.add_argument('--rules')
     try:
-        mode = int(sys.argv[2])
+        return parser.parse_args(argv)
+    except SystemExit:
+        display_help()
+        sys.exit(1)
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+
+    folder_path = args.folder_path
+    try:
+        mode = int(args.mode)
     except ValueError:
         display_help()
         sys.exit(1)
@@ -161,12 +151,28 @@ def main():
         print(f"错误: {folder_path} 不是有效的目录路径。")
         sys.exit(1)
 
-    if mode not in [1, 2, 3, 4, 5, 6, 7, 8]:
-        print(f"错误: {mode} 不是有效的模式。必须为 1 ~ 8。\n")
+    try:
+        excluder = load_excluder(folder_path)
+        modes = [m for m, _ in load_rules(find_rules_file(folder_path, args.rules)).modes(PRESET)]
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    if mode not in modes:
+        print(f"错误: {mode} 不是有效的模式。必须为 {', '.join(str(m) for m in modes)}。\n")
         display_help()
         sys.exit(1)
 
-    process_folder(folder_path, mode)
+    if args.watch:
+        # 延迟导入，vault_watcher 依赖本模块的替换函数
+        from vault_watcher import watch_folder
+        watch_folder(folder_path, mode, debounce=args.debounce, poll_interval=args.poll_interval,
+                     excluder=excluder, rules_path=args.rules)
+        return
+
+    stats = process_folder(folder_path, mode, excluder, dry_run=args.dry_run, show_diff=args.diff,
+                           rules_path=args.rules)
+    print_run_stats(stats, dry_run=args.dry_run)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
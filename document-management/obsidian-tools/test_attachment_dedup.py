@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+attachment_dedup.py 的回归测试
+
+使用方法：
+    python -m unittest test_attachment_dedup.py
+"""
+
+import unittest
+
+from attachment_dedup import AttachmentDeduplicator
+from link_engine import IMG_CACHE_DIR
+from test_vault_index import GITEA_BASE, VaultTestCase
+
+
+class Mode6NoteTest(VaultTestCase):
+    """模式6生成的HTML链接中的附件名含有空格"""
+
+    def setUp(self):
+        super().setUp()
+        self.write(IMG_CACHE_DIR + '/Pasted image 1.png', b'same')
+        self.write(IMG_CACHE_DIR + '/shot.png', b'same')
+        self.html = ('<div align="center"><img src="{}/{}" alt="Pasted image 1.png" '
+                     'style="zoom:100%;" /></div>\n')
+        self.write('note.md', self.html.format(GITEA_BASE, 'Pasted image 1.png'))
+        self.dedup = AttachmentDeduplicator(self.vault)
+
+    def read_note(self):
+        with open(f'{self.vault}/note.md', 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_plan_includes_note(self):
+        plan = self.dedup.build_plan()
+        self.assertEqual(plan['renames'], {'Pasted image 1.png': 'shot.png'})
+        self.assertEqual(plan['notes'], {'note.md': 1})
+
+    def test_apply_rewrites_before_moving(self):
+        kept = self.dedup.apply_plan(self.dedup.build_plan())
+        self.assertEqual(kept, [])
+        self.assertIn(f'{GITEA_BASE}/shot.png"', self.read_note())
+        self.assertFalse(self.exists(IMG_CACHE_DIR + '/Pasted image 1.png'))
+        self.assertTrue(self.exists('.trash/' + IMG_CACHE_DIR + '/Pasted image 1.png'))
+        self.assertEqual(self.dedup.index.find_broken(), [])
+
+    def test_referenced_duplicate_is_kept(self):
+        # 笔记没有改写时HTML链接仍引用该文件，重复文件必须保留在原处
+        plan = self.dedup.build_plan()
+        plan['notes'] = {}
+        kept = self.dedup.apply_plan(plan)
+        self.assertEqual(kept, ['Pasted image 1.png'])
+        self.assertTrue(self.exists(IMG_CACHE_DIR + '/Pasted image 1.png'))
+
+
+if __name__ == '__main__':
+    unittest.main()
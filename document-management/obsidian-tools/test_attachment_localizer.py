@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+attachment_localizer.py 的回归测试（使用本地HTTP服务器，不访问外网）
+
+使用方法：
+    python -m unittest test_attachment_localizer.py
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+from attachment_localizer import collect_remote_attachments, localize_attachments
+from link_engine import IMG_CACHE_DIR
+from test_vault_index import GITEA_BASE, VaultTestCase
+from vault_index import VaultLinkIndex
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class AttachmentWithSpaceTest(VaultTestCase):
+    """模式6生成的HTML链接中的附件名含有空格"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('note.md', f'<div align="center"><img src="{GITEA_BASE}/Pasted image 1.png" '
+                              f'alt="Pasted image 1.png" style="zoom:100%;" /></div>\n'
+                              f'![截图]({GITEA_BASE}/Pasted%20image%202.png "截图 2")\n')
+
+    def test_collect_keeps_full_name(self):
+        index = VaultLinkIndex(self.vault)
+        index.update()
+        self.assertEqual(collect_remote_attachments(index), {
+            'Pasted image 1.png': f'{GITEA_BASE}/Pasted image 1.png',
+            'Pasted image 2.png': f'{GITEA_BASE}/Pasted%20image%202.png',
+        })
+
+    def test_download_from_mirror(self):
+        served = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, served)
+        os.makedirs(os.path.join(served, 'img-cache'))
+        for name in ('Pasted image 1.png', 'Pasted image 2.png'):
+            with open(os.path.join(served, 'img-cache', name), 'wb') as f:
+                f.write(name.encode('utf-8'))
+        server = HTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=served))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with redirect_stdout(io.StringIO()):
+            stats = localize_attachments(self.vault, workers=2,
+                                         mirror=f'http://127.0.0.1:{server.server_port}/img-cache')
+        self.assertEqual(stats['failed'], [])
+        self.assertEqual(stats['downloaded'], 2)
+        with open(os.path.join(self.vault, IMG_CACHE_DIR, 'Pasted image 1.png'), 'rb') as f:
+            self.assertEqual(f.read(), b'Pasted image 1.png')
+
+
+if __name__ == '__main__':
+    unittest.main()
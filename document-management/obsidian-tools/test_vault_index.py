@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+vault_index.py 的回归测试
+
+使用方法：
+    python -m unittest test_vault_index.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from link_engine import IMG_CACHE_DIR
+from vault_index import VaultLinkIndex, link_url
+
+GITEA_BASE = 'https://tmcodeserver/gitea/TerraMatrix/wiki-cache/raw/branch/master/img-cache'
+
+
+class VaultTestCase(unittest.TestCase):
+    """在临时目录中创建库的测试基类"""
+
+    def setUp(self):
+        self.vault = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.vault)
+        os.makedirs(os.path.join(self.vault, IMG_CACHE_DIR))
+
+    def write(self, rel_path, content):
+        path = os.path.join(self.vault, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        mode = 'wb' if isinstance(content, bytes) else 'w'
+        with open(path, mode, **({} if isinstance(content, bytes) else {'encoding': 'utf-8'})) as f:
+            f.write(content)
+
+    def exists(self, rel_path):
+        return os.path.exists(os.path.join(self.vault, rel_path))
+
+
+class LinkUrlTest(unittest.TestCase):
+
+    def test_html_src_keeps_spaces(self):
+        self.assertEqual(link_url('html', f'{GITEA_BASE}/Pasted image 1.png'), f'{GITEA_BASE}/Pasted image 1.png')
+
+    def test_markdown_strips_only_title(self):
+        self.assertEqual(link_url('markdown', 'Pasted image 1.png'), 'Pasted image 1.png')
+        self.assertEqual(link_url('markdown', 'Pasted image 1.png "标题 1"'), 'Pasted image 1.png')
+        self.assertEqual(link_url('markdown', "a.png 'title'"), 'a.png')
+        self.assertEqual(link_url('markdown', '<Pasted image 1.png> "title"'), 'Pasted image 1.png')
+
+
+class AttachmentWithSpaceTest(VaultTestCase):
+    """Obsidian默认的附件名 Pasted image N.png 含有空格"""
+
+    def setUp(self):
+        super().setUp()
+        self.write(IMG_CACHE_DIR + '/Pasted image 1.png', b'png1')
+        self.write(IMG_CACHE_DIR + '/Pasted image 2.png', b'png2')
+        self.write(IMG_CACHE_DIR + '/unused.png', b'png3')
+        # 模式6生成的HTML链接和带标题的Markdown链接
+        self.write('note.md', f'<div align="center"><img src="{GITEA_BASE}/Pasted image 1.png" '
+                              f'alt="Pasted image 1.png" style="zoom:100%;" /></div>\n'
+                              f'![截图](附件/img-cache/Pasted image 2.png "截图 2")\n')
+        self.index = VaultLinkIndex(self.vault)
+        self.index.update()
+
+    def test_links_resolve(self):
+        self.assertEqual(self.index.targets.get(IMG_CACHE_DIR + '/Pasted image 1.png'), ['note.md'])
+        self.assertEqual(self.index.targets.get(IMG_CACHE_DIR + '/Pasted image 2.png'), ['note.md'])
+        self.assertEqual(self.index.find_broken(), [])
+
+    def test_gc_moves_only_unreferenced(self):
+        self.assertEqual(self.index.find_orphans(), [IMG_CACHE_DIR + '/unused.png'])
+        self.index.collect_garbage(apply=True)
+        self.assertTrue(self.exists(IMG_CACHE_DIR + '/Pasted image 1.png'))
+        self.assertTrue(self.exists(IMG_CACHE_DIR + '/Pasted image 2.png'))
+        self.assertTrue(self.exists('.trash/' + IMG_CACHE_DIR + '/unused.png'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Obsidian库链接索引工具
+
+功能说明：
+1. 记录每篇笔记中的 ![[...]] 内嵌、Markdown图片和HTML <img> 链接
+2. 将倒排索引持久化到 <库根目录>/.obsidian-tools/link-index.json，按mtime增量更新
+3. 查询 附件/img-cache 中没有任何笔记引用的孤立附件
+4. 查询引用了不存在文件的失效链接
+5. 将孤立附件移动到 .trash 目录进行回收
+
+使用方法：
+    python vault_index.py <folder_path> update
+    python vault_index.py <folder_path> orphans [--no-update]
+    python vault_index.py <folder_path> broken [--no-update]
+    python vault_index.py <folder_path> gc [--apply]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+from urllib.parse import unquote, urlsplit
+
+from link_engine import (
+    IMG_CACHE_DIR,
+    STATE_DIR,
+    WIKI_EMBED_PATTERN,
+    MARKDOWN_IMAGE_PATTERN,
+    HTML_IMG_PATTERN,
+)
+
+# 索引文件名及格式版本，格式变化时递增版本号使旧索引失效
+INDEX_FILE_NAME = 'link-index.json'
+INDEX_VERSION = 1
+# Markdown图片链接末尾的标题 ![alt](link "title") 或 ![alt](link 'title')
+MARKDOWN_TITLE_PATTERN = re.compile(r'\s+(?:"[^"]*"|\'[^\']*\')\s*$')
+
+
+def to_vault_path(path):
+    """将相对路径统一为 / 分隔的库内路径"""
+    return path.replace(os.sep, '/')
+
+
+def unique_destination(path):
+    """
+    返回不会覆盖已有文件的目标路径：目标已存在时在文件名后追加 " (1)"、" (2)" 等序号
+
+    :param path: 期望的目标路径
+    :return: 不存在的目标路径
+    """
+    if not os.path.lexists(path):
+        return path
+    stem, ext = os.path.splitext(path)
+    counter = 1
+    while os.path.lexists(f"{stem} ({counter}){ext}"):
+        counter += 1
+    return f"{stem} ({counter}){ext}"
+
+
+def link_url(kind, raw):
+    """
+    从 Markdown/HTML 图片链接的原始文本中取出URL
+
+    HTML 的 src 由引号界定，原样使用；Markdown 只去掉 <...> 包裹或末尾的 "title" 部分。
+    URL 中可能含有空格（如Obsidian默认的 Pasted image 1.png），不能按空格截断。
+
+    :param kind: 链接类型（markdown 或 html）
+    :param raw: 原始链接文本
+    :return: URL，可能为空字符串
+    """
+    url = raw.strip()
+    if kind == 'markdown':
+        if url.startswith('<') and '>' in url:
+            # ![title](<link> "tooltip")
+            url = url[1:url.index('>')]
+        else:
+            url = MARKDOWN_TITLE_PATTERN.sub('', url)
+    return url.strip()
+
+
+def img_cache_name(url):
+    """
+    返回 GitHub、Gitea、file:// 形式的 .../img-cache/<name> 链接中的附件名（已URL解码）
+
+    :param url: link_url 取出的URL
+    :return: 附件名，不是 img-cache 链接时返回None
+    """
+    marker = '/img-cache/'
+    if marker not in url or urlsplit(url).scheme not in ('http', 'https', 'file'):
+        return None
+    return unquote(url.split(marker, 1)[1].split('?', 1)[0].split('#', 1)[0])
+
+
+def parse_note_links(content):
+    """
+    解析笔记中的所有图片/内嵌链接。
+
+    :param content: 笔记文本内容
+    :return: [链接类型, 原始链接] 列表，类型为 wiki、markdown 或 html
+    """
+    links = []
+    for match in WIKI_EMBED_PATTERN.finditer(content):
+        links.append(['wiki', match.group(1)])
+    for match in MARKDOWN_IMAGE_PATTERN.finditer(content):
+        links.append(['markdown', match.group(2)])
+    for match in HTML_IMG_PATTERN.finditer(content):
+        links.append(['html', match.group(1)])
+    return links
+
+
+class VaultLinkIndex:
+    """库链接倒排索引"""
+
+    def __init__(self, folder_path):
+        """
+        初始化索引
+
+        Args:
+            folder_path: Obsidian库根目录
+        """
+        self.folder_path = os.path.abspath(folder_path)
+        self.index_file = os.path.join(self.folder_path, STATE_DIR, INDEX_FILE_NAME)
+
+        # 库内所有文件（不含点号开头的目录），库内路径列表
+        self.files = []
+        # 笔记 -> {"mtime_ns", "size", "links"}
+        self.notes = {}
+        # 目标文件 -> 引用它的笔记列表
+        self.targets = {}
+        # 失效链接 [笔记, 链接类型, 原始链接]
+        self.broken = []
+
+        # 解析链接时使用的查找表，由 files 构建
+        self._file_set = set()
+        self._basename_map = {}
+
+    def load(self):
+        """
+        从磁盘加载索引，索引不存在或版本不一致时保持为空
+
+        Returns:
+            bool: 是否成功加载
+        """
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get('version') != INDEX_VERSION:
+            return False
+
+        self.files = data.get('files', [])
+        self.notes = data.get('notes', {})
+        self.targets = data.get('targets', {})
+        self.broken = data.get('broken', [])
+        return True
+
+    def save(self):
+        """原子地将索引写入磁盘"""
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        data = {
+            'version': INDEX_VERSION,
+            'files': self.files,
+            'notes': self.notes,
+            'targets': self.targets,
+            'broken': self.broken,
+        }
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, self.index_file)
+
+    def update(self):
+        """
+        增量更新索引：只重新解析 mtime 或大小发生变化的笔记
+
+        Returns:
+            dict: 本次更新的统计信息
+        """
+        stats = {'scanned': 0, 'parsed': 0, 'removed': 0}
+        files = []
+        notes = {}
+
+        # 库级排除规则（exclude_dirs / exclude_files）只决定哪些笔记被改写，不影响索引：
+        # 被排除的笔记中的引用同样使附件保持有效，附件目录中的文件同样可以作为链接目标
+        for root, dirs, names in os.walk(self.folder_path):
+            # 跳过 .obsidian、.git、.trash 以及工具自身的状态目录
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            rel_root = to_vault_path(os.path.relpath(root, self.folder_path))
+            prefix = '' if rel_root == '.' else rel_root + '/'
+            for name in names:
+                rel_path = prefix + name
+                files.append(rel_path)
+                if not name.endswith('.md'):
+                    continue
+                file_path = os.path.join(root, name)
+
+                stats['scanned'] += 1
+                st = os.stat(file_path)
+                entry = self.notes.get(rel_path)
+                if entry and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                    notes[rel_path] = entry
+                    continue
+
+                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                    content = f.read()
+                notes[rel_path] = {
+                    'mtime_ns': st.st_mtime_ns,
+                    'size': st.st_size,
+                    'links': parse_note_links(content),
+                }
+                stats['parsed'] += 1
+
+        stats['removed'] = len(set(self.notes) - set(notes))
+        self.files = sorted(files)
+        self.notes = notes
+        self.rebuild_targets()
+        return stats
+
+    def rebuild_targets(self):
+        """
+        根据各笔记的原始链接重新解析目标并构建倒排索引。
+
+        附件增删会改变未修改笔记的解析结果，因此每次更新都从原始链接重建，
+        这一步只涉及内存操作，不需要重新读取笔记。
+        """
+        self._file_set = set(self.files)
+        self._basename_map = {}
+        for rel_path in self.files:
+            basename = rel_path.rsplit('/', 1)[-1]
+            self._basename_map.setdefault(basename, rel_path)
+            if basename.endswith('.md'):
+                self._basename_map.setdefault(basename[:-3], rel_path)
+
+        targets = {}
+        broken = []
+        for note in sorted(self.notes):
+            for kind, raw in self.notes[note]['links']:
+                resolved, target = self.resolve_link(note, kind, raw)
+                if target is None:
+                    continue
+                if resolved:
+                    referrers = targets.setdefault(target, [])
+                    if not referrers or referrers[-1] != note:
+                        referrers.append(note)
+                else:
+                    broken.append([note, kind, raw])
+
+        self.targets = targets
+        self.broken = broken
+
+    def resolve_link(self, note, kind, raw):
+        """
+        将原始链接解析为库内文件路径
+
+        Args:
+            note: 链接所在笔记的库内路径
+            kind: 链接类型（wiki、markdown、html）
+            raw: 原始链接文本
+
+        Returns:
+            tuple: (是否存在, 库内目标路径)，外部链接返回 (False, None)
+        """
+        if kind == 'wiki':
+            # ![[name|alias]]、![[name#heading]] 只取文件名部分
+            target = raw.split('|', 1)[0].split('#', 1)[0].strip()
+            if not target:
+                return False, None
+            candidates = [IMG_CACHE_DIR + '/' + target, target, target + '.md']
+            for candidate in candidates:
+                if candidate in self._file_set:
+                    return True, candidate
+            basename = target.rsplit('/', 1)[-1]
+            if basename in self._basename_map:
+                return True, self._basename_map[basename]
+            return False, IMG_CACHE_DIR + '/' + target
+
+        url = link_url(kind, raw)
+        if not url:
+            return False, None
+
+        # GitHub、Gitea、本地 file:// 形式的 img-cache 链接统一映射到附件目录
+        name = img_cache_name(url)
+        if name is not None:
+            target = IMG_CACHE_DIR + '/' + name
+            return target in self._file_set, target
+
+        # 其他带协议的链接（外部图片、data: 等）不在索引范围内
+        if urlsplit(url).scheme:
+            return False, None
+
+        path = unquote(url.split('?', 1)[0].split('#', 1)[0])
+        note_dir = note.rsplit('/', 1)[0] if '/' in note else ''
+        relative = os.path.normpath(os.path.join(note_dir, path)).replace(os.sep, '/')
+        for candidate in (relative, path.lstrip('/')):
+            if candidate in self._file_set:
+                return True, candidate
+        basename = path.rsplit('/', 1)[-1]
+        if basename in self._basename_map:
+            return True, self._basename_map[basename]
+        return False, relative
+
+    def find_orphans(self):
+        """
+        查询 附件/img-cache 中未被任何笔记引用的附件
+
+        Returns:
+            List[str]: 孤立附件的库内路径列表
+        """
+        prefix = IMG_CACHE_DIR + '/'
+        return [f for f in self.files if f.startswith(prefix) and f not in self.targets]
+
+    def find_broken(self):
+        """
+        查询失效链接
+
+        Returns:
+            List[list]: [笔记, 链接类型, 原始链接] 列表
+        """
+        return list(self.broken)
+
+    def collect_garbage(self, apply=False):
+        """
+        将孤立附件移动到库根目录的 .trash 目录（与Obsidian回收站一致）
+
+        附件在 .trash 中保留库内相对路径，不同目录下的同名附件不会互相覆盖；
+        .trash 中已有同名文件时追加序号。
+
+        Args:
+            apply: False 时只返回计划，不移动任何文件
+
+        Returns:
+            tuple: (孤立附件列表, 可回收字节数)
+        """
+        orphans = self.find_orphans()
+        reclaimed = 0
+        trash_dir = os.path.join(self.folder_path, '.trash')
+        for rel_path in orphans:
+            src = os.path.join(self.folder_path, rel_path)
+            reclaimed += os.path.getsize(src)
+            if apply:
+                dest = unique_destination(os.path.join(trash_dir, rel_path))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.move(src, dest)
+
+        if apply and orphans:
+            removed = set(orphans)
+            self.files = [f for f in self.files if f not in removed]
+            self.rebuild_targets()
+        return orphans, reclaimed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Obsidian库链接索引：孤立附件与失效链接查询')
+    parser.add_argument('folder_path', help='Obsidian库根目录')
+    parser.add_argument('command', choices=['update', 'orphans', 'broken', 'gc'],
+                        help='update: 增量更新索引; orphans: 孤立附件; broken: 失效链接; gc: 回收孤立附件')
+    parser.add_argument('--no-update', action='store_true', help='直接使用已持久化的索引，不扫描库')
+    parser.add_argument('--apply', action='store_true', help='gc 时实际移动文件（默认只显示计划）')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder_path):
+        print(f"错误: {args.folder_path} 不是有效的目录路径。")
+        sys.exit(1)
+
+    index = VaultLinkIndex(args.folder_path)
+    loaded = index.load()
+    if args.command == 'update' or not args.no_update or not loaded:
+        start = time.perf_counter()
+        stats = index.update()
+        index.save()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"索引已更新: 扫描 {stats['scanned']} 篇笔记，重新解析 {stats['parsed']} 篇，"
+              f"移除 {stats['removed']} 篇，耗时 {elapsed:.1f} ms")
+
+    start = time.perf_counter()
+    if args.command == 'orphans':
+        orphans = index.find_orphans()
+        for rel_path in orphans:
+            print(rel_path)
+        print(f"共 {len(orphans)} 个孤立附件，查询耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    elif args.command == 'broken':
+        broken = index.find_broken()
+        for note, kind, raw in broken:
+            print(f"{note}: [{kind}] {raw}")
+        print(f"共 {len(broken)} 个失效链接，查询耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    elif args.command == 'gc':
+        orphans, reclaimed = index.collect_garbage(apply=args.apply)
+        for rel_path in orphans:
+            print(f"{'已移动到 .trash' if args.apply else '待回收'}: {rel_path}")
+        print(f"共 {len(orphans)} 个孤立附件，{reclaimed} 字节")
+        if args.apply:
+            index.save()
+        else:
+            print("未使用 --apply，未移动任何文件。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Obsidian库监视工具
+
+功能说明：
+1. Linux下通过inotify订阅库内笔记的变化事件，其他平台退化为轮询扫描
+2. 对Obsidian频繁的自动保存进行防抖，笔记停止变化一段时间后才处理
+3. 只对发生变化的笔记执行所选替换模式
+4. 忽略自身写回笔记产生的事件，避免反复触发
+5. 遵循库级配置文件中的排除规则，排除的目录不添加监视
+
+由 obsidian_link_replace.py 的 --watch 选项调用：
+    python obsidian_link_replace.py <folder_path> <mode> --watch
+"""
+
+import os
+import sys
+import time
+import struct
+import select
+import ctypes
+import ctypes.util
+
+from link_engine import load_excluder, walk_notes
+from obsidian_link_replace import replace_links_in_file
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def to_rel_path(folder_path, path):
+    """转换为以 / 分隔的库内相对路径"""
+    return os.path.relpath(path, folder_path).replace(os.sep, '/')
+
+
+class InotifyWatcher:
+    """基于Linux inotify的笔记变化监视器（通过ctypes调用libc，无第三方依赖）"""
+
+    def __init__(self, folder_path, excluder):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("当前系统不支持inotify")
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 调用失败")
+        self.folder_path = folder_path
+        self.excluder = excluder
+        # 监视描述符 -> 目录路径
+        self._watches = {}
+        self.overflowed = False
+        self._add_tree(folder_path)
+
+    def _add_watch(self, dir_path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = dir_path
+
+    def _add_tree(self, dir_path):
+        """递归添加目录监视，返回目录中已存在的笔记（新建目录时可能先于监视写入）"""
+        notes = []
+        for root, dirs, files in os.walk(dir_path):
+            rel_root = to_rel_path(self.folder_path, root)
+            prefix = '' if rel_root == '.' else rel_root + '/'
+            dirs[:] = [d for d in dirs if not self.excluder.is_dir_excluded(prefix + d)]
+            self._add_watch(root)
+            notes.extend(os.path.join(root, f) for f in files
+                         if f.endswith('.md') and not self.excluder.is_file_excluded(prefix + f))
+        return notes
+
+    def read_changes(self, timeout):
+        """
+        等待并读取变化的笔记
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            set: 发生变化的笔记路径
+        """
+        changed = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed
+
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name_bytes = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+            offset += EVENT_HEADER.size + length
+            name = os.fsdecode(name_bytes.rstrip(b'\0'))
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，调用方需要退化为处理整个目录
+                self.overflowed = True
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self._watches.pop(wd, None)
+                continue
+
+            dir_path = self._watches.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, name)
+            rel_path = to_rel_path(self.folder_path, path)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.excluder.is_dir_excluded(rel_path):
+                    changed.update(self._add_tree(path))
+            elif name.endswith('.md') and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                if not self.excluder.is_file_excluded(rel_path):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """轮询扫描笔记的 mtime 和大小，用于不支持inotify的平台"""
+
+    def __init__(self, folder_path, excluder, poll_interval=2.0):
+        self.folder_path = folder_path
+        self.excluder = excluder
+        self.poll_interval = poll_interval
+        self.overflowed = False
+        self._snapshot = self._scan()
+        self._next_poll = time.monotonic() + poll_interval
+
+    def _scan(self):
+        snapshot = {}
+        for path in walk_notes(self.folder_path, self.excluder):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def read_changes(self, timeout):
+        """
+        等待到下一次轮询（不超过timeout）并返回变化的笔记
+
+        Args:
+            timeout: 最长等待秒数，None 表示等到下一次轮询
+
+        Returns:
+            set: 发生变化的笔记路径
+        """
+        wait = max(0.0, self._next_poll - time.monotonic())
+        if timeout is not None and timeout < wait:
+            time.sleep(timeout)
+            return set()
+        time.sleep(wait)
+        self._next_poll = time.monotonic() + self.poll_interval
+
+        snapshot = self._scan()
+        changed = {path for path, sig in snapshot.items() if self._snapshot.get(path) != sig}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(folder_path, excluder, poll_interval=2.0):
+    """优先使用inotify，不可用时退化为轮询"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folder_path, excluder)
+        except (OSError, AttributeError) as e:
+            print(f"inotify不可用（{e}），改用轮询扫描。")
+    return PollingWatcher(folder_path, excluder, poll_interval)
+
+
+def file_signature(path):
+    """文件的 (mtime_ns, size)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def watch_folder(folder_path, mode, debounce=1.0, poll_interval=2.0, excluder=None, rules_path=None):
+    """
+    持续监视目录，对发生变化的笔记执行指定替换模式
+
+    Args:
+        folder_path: 需要监视的文件夹路径
+        mode: 运行模式（1 ~ 8）
+        debounce: 笔记最后一次变化后等待的秒数
+        poll_interval: 轮询模式下的扫描间隔
+        excluder: PathExcluder，为None时从库级配置文件加载
+        rules_path: 规则文件，为None时按默认顺序查找（规则文件修改后下一次处理即生效）
+    """
+    if excluder is None:
+        excluder = load_excluder(folder_path)
+    watcher = create_watcher(folder_path, excluder, poll_interval)
+    print(f"开始监视 {folder_path.replace(os.sep, '/')}（模式{mode}，{type(watcher).__name__}），按 Ctrl+C 停止。")
+
+    # 笔记 -> 最后一次变化的时间
+    pending = {}
+    # 笔记 -> 本工具写回后的文件签名，用于识别并忽略自身写入产生的事件
+    own_writes = {}
+
+    try:
+        while True:
+            if pending:
+                timeout = max(0.0, min(pending.values()) + debounce - time.monotonic())
+            else:
+                timeout = None
+
+            changes = watcher.read_changes(timeout)
+            # 在等待结束后取时间：事件可能在等待的任意时刻发生，按等待开始的时间计会提前处理编辑中的笔记
+            now = time.monotonic()
+            for path in changes:
+                pending[path] = now
+
+            if watcher.overflowed:
+                watcher.overflowed = False
+                pending.update((path, now) for path in walk_notes(folder_path, excluder))
+
+            ready = [path for path, last in pending.items() if now - last >= debounce]
+            for path in ready:
+                del pending[path]
+                signature = file_signature(path)
+                if signature is None:
+                    continue
+                if own_writes.get(path) == signature:
+                    continue
+                try:
+                    if replace_links_in_file(path, mode, folder_path, rules_path=rules_path):
+                        own_writes[path] = file_signature(path)
+                    else:
+                        own_writes.pop(path, None)
+                except (OSError, UnicodeDecodeError, ValueError) as e:
+                    print(f"处理 {path.replace(os.sep, '/')} 失败: {e}")
+    except KeyboardInterrupt:
+        print("已停止监视。")
+    finally:
+        watcher.close()
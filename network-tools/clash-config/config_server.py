@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并配置的本地HTTP服务
+
+功能说明：
+1. 通过HTTP提供 yaml_merger.py 最新生成的配置文件，Clash客户端直接订阅本地地址
+2. 强ETag（内容SHA-256），请求带 If-None-Match 且内容未变化时返回 304，只传输几百字节的响应头
+3. 按 Accept-Encoding 返回 gzip 或 deflate 压缩内容，压缩结果按内容缓存，只压缩一次
+4. 后台线程定期检查订阅源、模板和订阅源配置文件，有变化时重新生成，生成成功后原子切换提供的内容
+5. 可选：按 fetch_interval 定期下载配置了订阅地址的订阅源，内容变化时随之重新生成
+
+由 yaml_merger.py --serve 启动，也可以在其他脚本中直接使用 ConfigServer。
+"""
+
+import re
+import gzip
+import zlib
+import time
+import hashlib
+import threading
+from datetime import datetime
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# 默认监听地址和检查输入变化的间隔（秒）
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_WATCH_INTERVAL = 10.0
+# 提供配置的路径
+CONFIG_PATHS = ('/', '/config')
+# 支持的压缩编码（按优先顺序）
+CONTENT_ENCODINGS = ('gzip', 'deflate')
+# 带日期的默认输出文件名
+DATED_OUTPUT_PATTERN = re.compile(r'^all-in-one-\d{8}$')
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    根据 Accept-Encoding 请求头选择压缩编码
+
+    Args:
+        accept_encoding: 请求头的值
+
+    Returns:
+        Optional[str]: gzip、deflate，或不压缩时为None
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        weight = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                weight = float(match.group(1))
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    candidates = [(weights.get(encoding, weights.get('*', 0.0)), -index, encoding)
+                  for index, encoding in enumerate(CONTENT_ENCODINGS)]
+    weight, _, encoding = max(candidates)
+    return encoding if weight > 0 else None
+
+
+def etag_matches(if_none_match: Optional[str], etags) -> bool:
+    """
+    判断 If-None-Match 请求头是否匹配当前内容（按弱比较，忽略 W/ 前缀）
+
+    Args:
+        if_none_match: 请求头的值
+        etags: 当前内容各种编码的ETag
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    requested = {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()
+                 for tag in if_none_match.split(',')}
+    return not requested.isdisjoint(etags)
+
+
+class ConfigContent:
+    """一次生成结果的内容、ETag和压缩缓存"""
+
+    def __init__(self, body: bytes, content_type: str, modified: float):
+        """
+        Args:
+            body: 配置文件内容
+            content_type: Content-Type
+            modified: 文件修改时间戳
+        """
+        self.body = body
+        self.content_type = content_type
+        self.last_modified = formatdate(modified, usegmt=True)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # 不同编码是不同的表示，强ETag各不相同
+        self.etags = {None: f'"{digest}"'}
+        self.etags.update({encoding: f'"{digest}-{encoding}"' for encoding in CONTENT_ENCODINGS})
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        """返回指定编码的内容（首次请求时压缩并缓存）"""
+        if encoding is None:
+            return self.body
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'gzip':
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=6, mtime=0)
+                else:
+                    self._encoded[encoding] = zlib.compress(self.body, 6)
+            return self._encoded[encoding]
+
+
+class ConfigRequestHandler(BaseHTTPRequestHandler):
+    """配置请求处理器，通过 self.server.config_server 访问 ConfigServer"""
+
+    server_version = 'ClashConfigServer/1.0'
+
+    def do_GET(self):
+        self.send_config(head_only=False)
+
+    def do_HEAD(self):
+        self.send_config(head_only=True)
+
+    def send_config(self, head_only: bool):
+        path = self.path.split('?', 1)[0]
+        if path not in CONFIG_PATHS:
+            self.send_error(404, 'Not Found')
+            return
+        content = self.server.config_server.content
+        if content is None:
+            self.send_error(503, 'Config not generated yet')
+            return
+
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        etag = content.etags[encoding]
+        if etag_matches(self.headers.get('If-None-Match'), content.etags.values()):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        body = content.encoded(encoding)
+        self.send_response(200)
+        self.send_header('Content-Type', content.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', content.last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.config_server.logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class ConfigServer:
+    """提供最新合并配置的HTTP服务，输入变化时在后台重新生成"""
+
+    def __init__(self, merger, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 watch_interval: float = DEFAULT_WATCH_INTERVAL, fetch_interval: Optional[float] = None):
+        """
+        Args:
+            merger: YamlToJsonMerger 实例
+            host: 监听地址
+            port: 监听端口（0表示自动选择）
+            watch_interval: 检查输入变化的间隔秒数
+            fetch_interval: 定期下载订阅的间隔秒数，为None时只在重新生成时下载
+        """
+        self.merger = merger
+        self.logger = merger.logger
+        self.watch_interval = watch_interval
+        self.fetch_interval = fetch_interval
+        self.last_fetch = time.monotonic()
+        self.content: Optional[ConfigContent] = None
+        self.input_signature = None
+        self.stop_event = threading.Event()
+        self.httpd = ThreadingHTTPServer((host, port), ConfigRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.config_server = self
+        self.watch_thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """实际监听的 (地址, 端口)"""
+        return self.httpd.server_address[:2]
+
+    def compute_input_signature(self):
+        """订阅源、模板和订阅源配置文件的 (路径, mtime, 大小) 列表，文件变化时结果随之变化"""
+        paths = [Path(info['yml']) for info in self.merger.source_files.values()]
+        paths.append(Path(self.merger.template_file))
+        if self.merger.sources_config:
+            paths.append(Path(self.merger.sources_config))
+        signature = []
+        for path in paths:
+            try:
+                st = path.stat()
+                signature.append((str(path), st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((str(path), None, None))
+        return signature
+
+    def regenerate(self, reload_sources: bool = False) -> bool:
+        """
+        重新生成配置（输入未变化时由增量缓存直接跳过），成功后切换提供的内容
+
+        Args:
+            reload_sources: 是否先重新加载订阅源配置文件
+
+        Returns:
+            bool: 是否成功
+        """
+        if reload_sources and self.merger.sources_config:
+            try:
+                self.merger.load_sources_config(self.merger.sources_config)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"重新加载订阅源配置失败，继续使用原有配置: {e}")
+
+        # 跨天运行时按当天日期生成新的输出文件
+        output_file = Path(self.merger.output_file)
+        if DATED_OUTPUT_PATTERN.match(output_file.stem):
+            today = datetime.now().strftime('%Y%m%d')
+            self.merger.output_file = output_file.with_name(f"all-in-one-{today}{output_file.suffix}")
+
+        self.input_signature = self.compute_input_signature()
+        if not self.merger.run():
+            self.logger.error("重新生成配置失败，继续提供上一次的配置")
+            return False
+        return self.load_output()
+
+    def load_output(self) -> bool:
+        """读取输出文件作为新的提供内容"""
+        output_file = Path(self.merger.output_file)
+        try:
+            body = output_file.read_bytes()
+            modified = output_file.stat().st_mtime
+        except OSError as e:
+            self.logger.error(f"读取输出文件失败: {e}")
+            return False
+        content_type = 'application/json; charset=utf-8'
+        if output_file.suffix in ('.yaml', '.yml'):
+            content_type = 'application/yaml; charset=utf-8'
+        content = ConfigContent(body, content_type, modified)
+        if self.content is None or content.etags[None] != self.content.etags[None]:
+            self.logger.info(f"提供配置: {output_file.name}（{len(body)} 字节，ETag {content.etags[None]}）")
+        self.content = content
+        return True
+
+    def watch(self):
+        """后台线程：定期检查输入变化并重新生成"""
+        while not self.stop_event.wait(self.watch_interval):
+            try:
+                if self.fetch_interval and time.monotonic() - self.last_fetch >= self.fetch_interval:
+                    # 下载只改写内容有变化的订阅源文件，变化由下面的输入检查发现
+                    self.last_fetch = time.monotonic()
+                    if self.merger.fetch_enabled:
+                        self.merger.fetch_subscriptions()
+                signature = self.compute_input_signature()
+                if signature != self.input_signature:
+                    self.logger.info("检测到订阅源或模板变化，重新生成配置")
+                    # 订阅源配置文件总是列表中的最后一项
+                    reload_sources = bool(self.merger.sources_config) and signature[-1] != self.input_signature[-1]
+                    self.regenerate(reload_sources)
+            except Exception as e:
+                self.logger.error(f"后台重新生成配置时发生异常: {e}")
+
+    def start(self):
+        """生成一次配置并启动后台检查线程（不阻塞）"""
+        if not self.regenerate():
+            self.logger.warning("初次生成配置失败，尝试提供已有的输出文件")
+            self.load_output()
+        self.watch_thread = threading.Thread(target=self.watch, name='config-watch', daemon=True)
+        self.watch_thread.start()
+
+    def serve_forever(self):
+        """启动服务并阻塞，直到 shutdown 或 Ctrl+C"""
+        self.start()
+        host, port = self.address
+        self.logger.info(f"配置服务已启动: http://{host}:{port}/config（每 {self.watch_interval} 秒检查输入变化）")
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            self.logger.info("收到中断信号，停止配置服务")
+        finally:
+            self.stop_event.set()
+            self.httpd.server_close()
+
+    def shutdown(self):
+        """停止服务（可在其他线程中调用）"""
+        self.stop_event.set()
+        self.httpd.shutdown()
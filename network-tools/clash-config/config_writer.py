@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash配置流式输出工具
+
+功能说明：
+1. 按顶层字段和列表元素逐块写出配置，不在内存中拼接整个输出文本
+2. 支持三种格式：json（indent=2，与 json.dump 输出相同）、json-compact（紧凑JSON）、yaml（Clash原生YAML）
+3. 先写入同目录下的临时文件，完成后原子替换目标文件，写出失败或中断时不会留下不完整的配置
+4. atomic_open 也供 yml2json.py（流式转换）和 merger_metrics.py（指标文件）使用
+"""
+
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Dict, Any, Iterator
+
+import yaml
+
+from yml2json import SafeDumper
+
+# 支持的输出格式 -> 文件扩展名
+OUTPUT_FORMATS = {
+    'json': '.json',
+    'json-compact': '.json',
+    'yaml': '.yaml',
+}
+
+
+# 进程的文件创建掩码：读取umask只能先设置再恢复，期间其他线程（如服务模式）新建的文件会得到错误的权限，
+# 因此只在导入模块时读取一次
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'w') -> Iterator[IO]:
+    """
+    打开目标文件同目录下的临时文件用于写入，with 语句块正常结束后写入磁盘并原子替换目标文件，
+    块内抛出异常时删除临时文件，目标文件保持不变
+
+    Args:
+        path: 目标文件路径
+        mode: 'w'（UTF-8文本）或 'wb'（二进制）
+
+    Yields:
+        IO: 临时文件对象
+    """
+    path = os.fspath(path)
+    output_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=output_dir)
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 创建的文件权限为0600，改为与普通新建文件一致（订阅客户端、指标采集程序可能以其他用户读取）
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class NoAliasDumper(SafeDumper):
+    """不输出锚点和别名的YAML输出器（同一对象被多处引用时分别展开，部分客户端不支持别名）"""
+
+    def ignore_aliases(self, data):
+        return True
+
+
+def dump_yaml_block(data: Any) -> str:
+    """以块格式输出YAML片段（保留中文字符和键的顺序，不使用别名）"""
+    return yaml.dump(data, Dumper=NoAliasDumper, allow_unicode=True, sort_keys=False)
+
+
+def iter_json_chunks(config: Dict[str, Any], compact: bool = False) -> Iterator[str]:
+    """
+    逐块生成配置的JSON文本，大列表（proxies、rules等）按元素分块
+
+    Args:
+        config: 配置字典
+        compact: 是否使用紧凑格式，否则与 json.dump(indent=2, ensure_ascii=False) 的输出相同
+
+    Yields:
+        str: JSON文本片段
+    """
+    if not config:
+        yield '{}'
+        return
+
+    if compact:
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+        def encode(value, _):
+            return encoder.encode(value)
+        key_separator, item_separator = ':', ','
+        open_key, open_item, close_list, close_object = '', '', ']', '}'
+    else:
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+
+        def encode(value, prefix):
+            return encoder.encode(value).replace('\n', '\n' + prefix)
+        key_separator, item_separator = ': ', ','
+        open_key, open_item, close_list, close_object = '\n  ', '\n    ', '\n  ]', '\n}'
+
+    yield '{'
+    for index, (key, value) in enumerate(config.items()):
+        yield (item_separator if index else '') + open_key + encode(key, '') + key_separator
+        if isinstance(value, list) and value:
+            yield '['
+            for item_index, item in enumerate(value):
+                yield (item_separator if item_index else '') + open_item + encode(item, '    ')
+            yield close_list
+        else:
+            yield encode(value, '  ')
+    yield close_object
+
+
+def iter_yaml_chunks(config: Dict[str, Any]) -> Iterator[str]:
+    """
+    逐块生成配置的YAML文本，输出与一次性 yaml.dump 整个配置相同（不使用别名）
+
+    Args:
+        config: 配置字典
+
+    Yields:
+        str: YAML文本片段
+    """
+    if not config:
+        yield dump_yaml_block(config)
+        return
+
+    for key, value in config.items():
+        if isinstance(value, list) and value:
+            # 第一个元素和字段名一起输出，其余元素逐个输出（块序列与字段名同列缩进）
+            yield dump_yaml_block({key: value[:1]})
+            for item in value[1:]:
+                yield dump_yaml_block([item])
+        else:
+            yield dump_yaml_block({key: value})
+
+
+def write_config(config: Dict[str, Any], output_path: str, output_format: str = 'json') -> int:
+    """
+    流式写出配置，写入临时文件后原子替换目标文件
+
+    Args:
+        config: 配置字典
+        output_path: 目标文件路径
+        output_format: 输出格式，见 OUTPUT_FORMATS
+
+    Returns:
+        int: 写出的文件大小（字节）
+
+    Raises:
+        ValueError: 输出格式无效
+        OSError: 写出失败（目标文件保持不变）
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"无效的输出格式: {output_format}，可选: {', '.join(OUTPUT_FORMATS)}")
+    if output_format == 'yaml':
+        chunks = iter_yaml_chunks(config)
+    else:
+        chunks = iter_json_chunks(config, compact=output_format == 'json-compact')
+
+    with atomic_open(output_path) as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return os.path.getsize(output_path)
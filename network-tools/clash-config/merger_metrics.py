@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并任务的运行指标
+
+功能说明：
+1. RunMetrics 记录一次合并的各阶段耗时（墙钟时间和CPU时间）、各订阅源的文件大小和节点数量、进程峰值内存
+2. CPU时间包括已结束的子进程（阶段一的解析进程池在阶段结束时回收，其CPU时间计入该阶段）
+3. 写出JSON指标文件，以及可选的Prometheus文本文件（供 node_exporter 的 textfile collector 采集）
+4. 两种文件都先写入同目录下的临时文件再原子替换，采集程序不会读到不完整的内容
+"""
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+from config_writer import atomic_open
+
+try:
+    import resource
+except ImportError:
+    # Windows没有 resource 模块，峰值内存记为None
+    resource = None
+
+# Prometheus指标名称前缀
+PROMETHEUS_PREFIX = "clash_merger"
+
+
+def cpu_seconds() -> float:
+    """当前进程及已回收子进程的CPU时间（用户态+内核态）之和"""
+    # process_time 的精度远高于 os.times，子进程部分只能从 os.times 获取
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+def peak_memory() -> Dict[str, Optional[int]]:
+    """
+    返回进程自启动以来的峰值常驻内存（字节）
+
+    Returns:
+        Dict: {"self": 当前进程, "children": 已回收子进程中的最大值}，无法获取时为None
+    """
+    if resource is None:
+        return {"self": None, "children": None}
+    # Linux 上 ru_maxrss 的单位为KB，macOS 上为字节
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+
+def escape_label(value: Any) -> str:
+    """转义Prometheus标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: Any) -> str:
+    """格式化Prometheus样本值（整数不带小数部分，浮点数保留完整精度）"""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class RunMetrics:
+    """一次合并任务的运行指标"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = cpu_seconds()
+        # 阶段名称 -> {"wall_seconds", "cpu_seconds"}，按执行顺序排列
+        self.stages: Dict[str, Dict[str, float]] = {}
+        # 订阅源名称 -> {"bytes", "proxies", "valid", "merged", "cached", "ok"}
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.success = None
+        # 输入未变化、跳过生成时由调用方设为True
+        self.skipped = False
+        self.duration = None
+        self.cpu = None
+        self.memory = {"self": None, "children": None}
+        self.stats: Dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        记录 with 语句块的耗时，同名阶段多次执行时累加（阶段内抛出异常时同样记录）
+
+        Args:
+            name: 阶段名称
+        """
+        start_wall = time.perf_counter()
+        start_cpu = cpu_seconds()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0})
+            entry["wall_seconds"] += time.perf_counter() - start_wall
+            entry["cpu_seconds"] += cpu_seconds() - start_cpu
+
+    def record_source(self, name: str, **values):
+        """记录或更新订阅源的指标（bytes、proxies、valid、merged、cached、ok）"""
+        self.sources.setdefault(name, {}).update(values)
+
+    def finish(self, success: bool, stats: Optional[Dict[str, Any]] = None):
+        """
+        结束计时，记录结果、峰值内存和统计信息
+
+        Args:
+            success: 任务是否成功
+            stats: 合并工具的统计信息
+        """
+        self.success = success
+        self.duration = time.perf_counter() - self._start_wall
+        self.cpu = cpu_seconds() - self._start_cpu
+        self.memory = peak_memory()
+        self.stats = dict(stats or {})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """返回可写出为JSON的指标"""
+        return {
+            "started_at": self.started_at,
+            "success": self.success,
+            "skipped": self.skipped,
+            "wall_seconds": self.duration,
+            "cpu_seconds": self.cpu,
+            "peak_rss_bytes": self.memory,
+            "stages": self.stages,
+            "sources": self.sources,
+            "stats": self.stats,
+        }
+
+    def write_json(self, path: str):
+        """写出JSON指标文件"""
+        with atomic_open(path) as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + '\n')
+
+    def prometheus_lines(self) -> List[str]:
+        """按Prometheus文本格式生成指标（均为gauge，表示最近一次运行的结果）"""
+        lines = []
+
+        def gauge(name, help_text, samples):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                sample = f"{metric}{{{label_text}}}" if label_text else metric
+                lines.append(f"{sample} {format_value(value)}")
+
+        gauge("last_run_timestamp_seconds", "最近一次运行的开始时间", [({}, self.started_at)])
+        gauge("last_run_success", "最近一次运行是否成功", [({}, self.success)])
+        gauge("last_run_skipped", "最近一次运行是否因输入未变化而跳过生成", [({}, self.skipped)])
+        gauge("run_wall_seconds", "运行的墙钟时间", [({}, self.duration)])
+        gauge("run_cpu_seconds", "运行的CPU时间（含子进程）", [({}, self.cpu)])
+        gauge("stage_wall_seconds", "各阶段的墙钟时间",
+              [({"stage": name}, entry["wall_seconds"]) for name, entry in self.stages.items()])
+        gauge("stage_cpu_seconds", "各阶段的CPU时间（含子进程）",
+              [({"stage": name}, entry["cpu_seconds"]) for name, entry in self.stages.items()])
+        gauge("source_bytes", "订阅源文件大小",
+              [({"source": name}, entry.get("bytes")) for name, entry in self.sources.items()])
+        gauge("source_up", "订阅源是否解析成功",
+              [({"source": name}, entry.get("ok")) for name, entry in self.sources.items()])
+        gauge("source_proxies", "订阅源的节点数量（listed 源中全部，valid 有效，merged 去重后合并）",
+              [({"source": name, "state": state}, entry.get(key))
+               for name, entry in self.sources.items()
+               for state, key in (("listed", "proxies"), ("valid", "valid"), ("merged", "merged"))])
+        gauge("proxies", "最终配置中的节点数量", [({}, self.stats.get("total_proxies"))])
+        gauge("duplicate_proxies", "去除的重复节点数量", [({}, self.stats.get("duplicate_proxies"))])
+        gauge("unreachable_proxies", "测速不可达的节点数量", [({}, self.stats.get("unreachable_proxies"))])
+        gauge("errors", "转换和合并错误数量",
+              [({"kind": kind}, len(self.stats[key]))
+               for kind, key in (("conversion", "conversion_errors"), ("merge", "merge_errors")) if key in self.stats])
+        gauge("peak_rss_bytes", "进程自启动以来的峰值常驻内存",
+              [({"process": process}, value) for process, value in self.memory.items()])
+        return lines
+
+    def write_prometheus(self, path: str):
+        """写出Prometheus文本文件"""
+        with atomic_open(path) as f:
+            f.write('\n'.join(self.prometheus_lines()) + '\n')
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理节点TCP延迟探测工具
+
+功能说明：
+1. 使用asyncio并发测量所有代理节点服务器的TCP连接延迟，可选测量TLS握手
+2. 通过信号量限制同时进行的连接数，每次连接有独立的超时
+3. 相同的 (服务器, 端口, TLS, SNI) 只探测一次，结果由使用它的所有节点共享
+4. hysteria、hysteria2、tuic、wireguard 等只走UDP（QUIC）的节点无法用TCP连接测量，不探测，
+   排序时保持原有位置，也不会被当作不可达节点移除
+5. 可单独运行，也由 yaml_merger.py 的测速阶段调用
+
+使用方法：
+    python proxy_probe.py <配置文件.json|.yml> [--concurrency 100] [--timeout 3] [--tls] [--save results.json]
+"""
+
+import sys
+import ssl
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Any, Optional, Tuple
+
+# 默认的并发连接数和单次连接超时（秒）
+DEFAULT_CONCURRENCY = 100
+DEFAULT_TIMEOUT = 3.0
+# 默认使用TLS的代理类型（其余类型按 tls 字段判断）
+TLS_PROXY_TYPES = ('trojan',)
+# 只使用UDP（QUIC）传输的代理类型，TCP连接无法反映其可用性，不参与测速
+UDP_PROXY_TYPES = ('hysteria', 'hysteria2', 'tuic', 'wireguard')
+
+
+def proxy_uses_tls(proxy: Dict[str, Any]) -> bool:
+    """判断代理的传输层是否使用TLS"""
+    return bool(proxy.get('tls')) or proxy.get('type') in TLS_PROXY_TYPES
+
+
+def proxy_is_probeable(proxy: Dict[str, Any]) -> bool:
+    """判断代理能否用TCP连接测量（只走UDP的代理类型不能）"""
+    return proxy.get('type') not in UDP_PROXY_TYPES
+
+
+def probe_target(proxy: Dict[str, Any], tls: bool = False) -> Tuple[str, int, Optional[str]]:
+    """
+    计算代理的探测目标
+
+    Args:
+        proxy: 代理配置字典
+        tls: 是否对使用TLS的代理测量TLS握手
+
+    Returns:
+        Tuple: (服务器, 端口, TLS握手使用的SNI；不测量TLS时为None)
+    """
+    server = str(proxy['server']).strip()
+    sni = None
+    if tls and proxy_uses_tls(proxy):
+        sni = proxy.get('sni') or proxy.get('servername') or server
+    return server, int(proxy['port']), sni
+
+
+async def probe_endpoint(host: str, port: int, timeout: float = DEFAULT_TIMEOUT,
+                         sni: Optional[str] = None) -> Optional[float]:
+    """
+    测量一次TCP连接（sni不为None时包含TLS握手）的耗时
+
+    TLS握手不校验证书，只用于测量延迟。
+
+    Args:
+        host: 服务器地址
+        port: 端口
+        timeout: 超时秒数（包含DNS解析）
+        sni: TLS握手使用的服务器名称，为None时只建立TCP连接
+
+    Returns:
+        Optional[float]: 延迟毫秒数，连接失败或超时时为None
+    """
+    context = None
+    if sni is not None:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, server_hostname=sni if context else None),
+            timeout)
+    except (OSError, asyncio.TimeoutError, ssl.SSLError, UnicodeError, ValueError):
+        return None
+    latency = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (OSError, ssl.SSLError):
+        pass
+    return latency
+
+
+async def probe_targets(targets: List[Tuple[str, int, Optional[str]]], concurrency: int = DEFAULT_CONCURRENCY,
+                        timeout: float = DEFAULT_TIMEOUT) -> Dict[Tuple[str, int, Optional[str]], Optional[float]]:
+    """
+    并发探测一组目标，同时进行的连接数不超过 concurrency
+
+    Args:
+        targets: probe_target 的结果列表（可以重复）
+        concurrency: 最大并发连接数
+        timeout: 单次连接超时秒数
+
+    Returns:
+        Dict: 目标 -> 延迟毫秒数或None
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def probe(target):
+        async with semaphore:
+            host, port, sni = target
+            return target, await probe_endpoint(host, port, timeout, sni)
+
+    unique_targets = list(dict.fromkeys(targets))
+    results = await asyncio.gather(*(probe(target) for target in unique_targets))
+    return dict(results)
+
+
+def probe_proxies(proxies: List[Dict[str, Any]], concurrency: int = DEFAULT_CONCURRENCY,
+                  timeout: float = DEFAULT_TIMEOUT, tls: bool = False) -> Dict[str, Optional[float]]:
+    """
+    探测代理列表中所有节点的延迟
+
+    Args:
+        proxies: 代理配置列表（名称应唯一）
+        concurrency: 最大并发连接数
+        timeout: 单次连接超时秒数
+        tls: 是否对使用TLS的代理测量TLS握手
+
+    Returns:
+        Dict[str, Optional[float]]: 代理名称 -> 延迟毫秒数，不可达时为None；
+                                    只走UDP的代理（UDP_PROXY_TYPES）未测量，不在结果中
+    """
+    targets = {proxy['name']: probe_target(proxy, tls) for proxy in proxies if proxy_is_probeable(proxy)}
+    results = asyncio.run(probe_targets(list(targets.values()), concurrency, timeout))
+    return {name: results[target] for name, target in targets.items()}
+
+
+def rank_proxies(proxies: List[Dict[str, Any]], latencies: Dict[str, Optional[float]],
+                 drop_unreachable: bool = False) -> List[Dict[str, Any]]:
+    """
+    按延迟从低到高排序代理，延迟相同时保持原有顺序
+
+    未测量的代理（不在 latencies 中）保持原有位置，已测量的代理在其余位置中排序。
+
+    Args:
+        proxies: 代理配置列表
+        latencies: probe_proxies 的结果
+        drop_unreachable: 是否移除不可达节点，否则排在最后（未测量的节点不受影响）
+
+    Returns:
+        List[Dict]: 排序后的代理列表
+    """
+    measured = [proxy for proxy in proxies if proxy['name'] in latencies]
+    reachable = [proxy for proxy in measured if latencies[proxy['name']] is not None]
+    reachable.sort(key=lambda proxy: latencies[proxy['name']])
+    ranked = reachable if drop_unreachable else \
+        reachable + [proxy for proxy in measured if latencies[proxy['name']] is None]
+    # 按原列表的位置依次填入：未测量的代理原样保留，已测量代理的位置按排序结果填充（移除的位置跳过）
+    ranked = iter(ranked)
+    result = []
+    for proxy in proxies:
+        if proxy['name'] not in latencies:
+            result.append(proxy)
+            continue
+        proxy = next(ranked, None)
+        if proxy is not None:
+            result.append(proxy)
+    return result
+
+
+def load_proxies(config_file: str) -> List[Dict[str, Any]]:
+    """读取JSON或YAML配置文件中的 proxies 列表"""
+    if config_file.endswith(('.yml', '.yaml')):
+        from yml2json import load_yaml_file
+        config = load_yaml_file(config_file)
+    else:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    proxies = config.get('proxies') if isinstance(config, dict) else None
+    if not isinstance(proxies, list):
+        raise ValueError(f"配置文件缺少 proxies 列表: {config_file}")
+    return [proxy for proxy in proxies if isinstance(proxy, dict) and proxy.get('server') and proxy.get('port')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发测量Clash配置中代理节点的TCP连接延迟')
+    parser.add_argument('config', help='包含 proxies 列表的JSON或YAML配置文件')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'最大并发连接数（默认{DEFAULT_CONCURRENCY}）')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help=f'单次连接超时秒数（默认{DEFAULT_TIMEOUT}）')
+    parser.add_argument('--tls', action='store_true', help='对使用TLS的节点同时测量TLS握手')
+    parser.add_argument('--save', help='将结果保存为JSON文件')
+    args = parser.parse_args()
+
+    try:
+        proxies = load_proxies(args.config)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+
+    start = time.perf_counter()
+    latencies = probe_proxies(proxies, args.concurrency, args.timeout, args.tls)
+    elapsed = time.perf_counter() - start
+
+    for proxy in rank_proxies(proxies, latencies):
+        if proxy['name'] not in latencies:
+            print(f"{'未测量':>10s}  {proxy['name']}（{proxy.get('type')}，UDP）")
+            continue
+        latency = latencies[proxy['name']]
+        print(f"{'超时' if latency is None else f'{latency:7.1f} ms':>10s}  {proxy['name']}")
+    reachable = sum(1 for latency in latencies.values() if latency is not None)
+    print(f"共 {len(proxies)} 个节点，可达 {reachable} 个，未测量 {len(proxies) - len(latencies)} 个，"
+          f"耗时 {elapsed:.1f} 秒")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(latencies, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
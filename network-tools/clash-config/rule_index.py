@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash规则解析和索引结构
+
+功能说明：
+1. parse_rule：将 "TYPE,payload,target[,options]" 格式的规则解析为 Rule
+2. DomainSuffixTrie：按域名标签倒序建立的前缀树，查询某个域名被哪些 DOMAIN-SUFFIX 规则覆盖
+3. KeywordAutomaton：Aho-Corasick关键字自动机，一次扫描找出文本中包含的所有 DOMAIN-KEYWORD
+4. CidrIndex：按前缀长度分层的CIDR索引（每层是网络地址到值的哈希表），查询地址或网段被哪些网段覆盖
+
+供 rules_optimizer.py（规则去重和遮蔽检查）和 rule_simulator.py（离线规则匹配）使用。
+"""
+
+import ipaddress
+from collections import deque, namedtuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+# 单条规则：index 为在规则列表中的位置，line 为原始文本
+Rule = namedtuple('Rule', 'index line type payload target options')
+
+# 没有匹配内容的规则类型
+NO_PAYLOAD_TYPES = ('MATCH', 'FINAL')
+# 逻辑规则（payload 中含有逗号，目标为最后一个字段）
+LOGIC_TYPES = ('AND', 'OR', 'NOT')
+# 域名规则和IP规则
+DOMAIN_TYPES = ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD')
+CIDR_TYPES = ('IP-CIDR', 'IP-CIDR6')
+NO_RESOLVE = 'no-resolve'
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_rule(line: str, index: int = 0) -> Rule:
+    """
+    解析一条Clash规则
+
+    Args:
+        line: 规则文本，如 "DOMAIN-SUFFIX,google.com,Proxy" 或 "IP-CIDR,10.0.0.0/8,DIRECT,no-resolve"
+        index: 规则在列表中的位置
+
+    Returns:
+        Rule: 解析结果，type 为大写，payload 和 target 去掉首尾空白
+
+    Raises:
+        ValueError: 规则格式错误
+    """
+    if not isinstance(line, str):
+        raise ValueError(f"规则不是字符串: {line!r}")
+    parts = [part.strip() for part in line.split(',')]
+    rule_type = parts[0].upper()
+    if rule_type in NO_PAYLOAD_TYPES:
+        if len(parts) < 2 or not parts[1]:
+            raise ValueError(f"规则缺少目标: {line}")
+        return Rule(index, line, rule_type, '', parts[1], tuple(parts[2:]))
+    if rule_type in LOGIC_TYPES:
+        payload, _, target = line.partition(',')[2].rpartition(',')
+        if not payload or not target.strip():
+            raise ValueError(f"逻辑规则格式错误: {line}")
+        return Rule(index, line, rule_type, payload.strip(), target.strip(), ())
+    if len(parts) < 3 or not parts[1] or not parts[2]:
+        raise ValueError(f"规则格式错误（应为 类型,内容,目标）: {line}")
+    return Rule(index, line, rule_type, parts[1], parts[2], tuple(parts[3:]))
+
+
+def normalize_domain(domain: str) -> str:
+    """域名统一为小写，去掉首尾的点"""
+    return domain.strip().strip('.').lower()
+
+
+def parse_network(payload: str) -> IPNetwork:
+    """解析规则中的网段（主机位不为0时按网段处理）"""
+    return ipaddress.ip_network(payload, strict=False)
+
+
+class DomainSuffixTrie:
+    """
+    域名后缀前缀树：按标签倒序存储（google.com -> com -> google），
+    每个节点的值表示"该域名及其所有子域名"，同一节点只保留最先插入的值
+    """
+
+    VALUE = None  # 节点中存放值的键（不会与任何域名标签冲突）
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+        self.size = 0
+
+    def insert(self, suffix: str, value: Any) -> bool:
+        """
+        插入后缀
+
+        Returns:
+            bool: 是否新插入（节点已有值时保持原值并返回False）
+        """
+        node = self.root
+        for label in reversed(normalize_domain(suffix).split('.')):
+            node = node.setdefault(label, {})
+        if self.VALUE in node:
+            return False
+        node[self.VALUE] = value
+        self.size += 1
+        return True
+
+    def covering(self, domain: str) -> Iterator[Any]:
+        """按从短到长的顺序返回覆盖该域名的所有后缀的值（包括与域名相同的后缀）"""
+        return self.covering_normalized(normalize_domain(domain))
+
+    def covering_normalized(self, domain: str) -> Iterator[Any]:
+        """同 covering，域名已经过 normalize_domain 处理"""
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                return
+            if self.VALUE in node:
+                yield node[self.VALUE]
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick关键字自动机：扫描一遍文本即可找出其中出现的全部关键字，耗时与关键字数量无关
+
+    每个状态预先记录以该状态结尾的所有关键字中最小的值（如规则位置），
+    search 返回文本中出现的关键字的最小值。
+    """
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.best: List[Any] = [None]
+        self.built = True
+
+    def add(self, keyword: str, value: Any):
+        """添加关键字（同一关键字保留较小的值），添加后需重新 build"""
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(None)
+            state = next_state
+        if self.best[state] is None or value < self.best[state]:
+            self.best[state] = value
+        self.built = False
+
+    def build(self):
+        """按广度优先计算失败指针，并把后缀状态的最小值合并到每个状态"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            fail_best = self.best[self.fail[state]]
+            if fail_best is not None and (self.best[state] is None or fail_best < self.best[state]):
+                self.best[state] = fail_best
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                queue.append(next_state)
+        self.built = True
+
+    def search(self, text: str) -> Any:
+        """返回文本中出现的关键字的最小值，没有关键字出现时为None"""
+        if not self.built:
+            self.build()
+        goto, fail, best = self.goto, self.fail, self.best
+        found = None
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            value = best[state]
+            if value is not None and (found is None or value < found):
+                found = value
+        return found
+
+
+class CidrIndex:
+    """
+    CIDR索引：按 (地址族, 前缀长度) 分层，每层以网络地址的整数值为键的哈希表，同一网段只保留最先插入的值
+
+    查询时只遍历实际出现过的前缀长度，每层一次掩码和一次哈希查找，
+    效果等同于在二进制前缀树（radix tree）上沿地址路径查找，但在Python中快得多。
+    """
+
+    BITS = {4: 32, 6: 128}
+
+    def __init__(self):
+        # 地址族版本 -> {前缀长度: {网络地址整数: 值}}
+        self.tables: Dict[int, Dict[int, Dict[int, Any]]] = {4: {}, 6: {}}
+        # 地址族版本 -> 已出现的 (前缀长度, 掩码, 哈希表)，按前缀长度升序
+        self.levels: Dict[int, List[Tuple[int, int, Dict[int, Any]]]] = {4: [], 6: []}
+        self.size = 0
+
+    def insert(self, network: IPNetwork, value: Any) -> bool:
+        """
+        插入网段
+
+        Returns:
+            bool: 是否新插入（网段已有值时保持原值并返回False）
+        """
+        version, prefix = network.version, network.prefixlen
+        table = self.tables[version].get(prefix)
+        if table is None:
+            table = self.tables[version][prefix] = {}
+            bits = self.BITS[version]
+            self.levels[version] = [(length, ((1 << length) - 1) << (bits - length), self.tables[version][length])
+                                    for length in sorted(self.tables[version])]
+        key = int(network.network_address)
+        if key in table:
+            return False
+        table[key] = value
+        self.size += 1
+        return True
+
+    def covering(self, network: IPNetwork) -> Iterator[Any]:
+        """按前缀从短到长返回包含该网段的所有网段的值（包括相同网段）"""
+        return self.covering_int(network.version, int(network.network_address), network.prefixlen)
+
+    def covering_int(self, version: int, address: int, prefixlen: Optional[int] = None) -> Iterator[Any]:
+        """
+        同 covering，网段以整数表示
+
+        Args:
+            version: 地址族版本（4或6）
+            address: 网络地址的整数值
+            prefixlen: 前缀长度，为None时表示单个地址
+        """
+        for prefix, mask, table in self.levels[version]:
+            if prefixlen is not None and prefix > prefixlen:
+                break
+            value = table.get(address & mask)
+            if value is not None:
+                yield value
+
+    def lowest_int(self, version: int, address: int, default: Any) -> Any:
+        """返回包含该地址（整数值）的所有网段中最小的值，都不小于 default 时返回 default（批量查询的快速路径）"""
+        lowest = default
+        for _, mask, table in self.levels[version]:
+            value = table.get(address & mask)
+            if value is not None and value < lowest:
+                lowest = value
+        return lowest
+
+    def lookup(self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> Iterator[Any]:
+        """返回包含该地址的所有网段的值"""
+        return self.covering_int(address.version, int(address))
+
+
+def cidr_key(rule: Rule) -> Tuple[IPNetwork, bool]:
+    """返回IP规则的 (网段, 是否 no-resolve)"""
+    return parse_network(rule.payload), NO_RESOLVE in (option.lower() for option in rule.options)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash规则离线匹配模拟工具
+
+功能说明：
+1. 将配置中的 rules 加载到索引结构中：DOMAIN 哈希表、DOMAIN-SUFFIX 后缀前缀树、
+   DOMAIN-KEYWORD Aho-Corasick自动机、IP-CIDR / IP-CIDR6 CIDR索引
+2. 按Clash的顺序匹配语义（命中位置最早的规则）批量解析域名和IP，得到目标策略组，不需要逐条遍历规则
+3. 统计每条规则的命中次数和解析吞吐量
+4. 保存解析结果，或与上一次保存的结果比较（回归测试），目标变化时返回非零退出码
+5. GEOIP、RULE-SET、逻辑规则等无法离线判断的规则视为不命中，并在输出中列出数量
+
+查询文件每行一个查询：域名、IP，或"域名 IP"（该域名已解析的地址，用于匹配不带 no-resolve 的IP规则），
+空行和 # 开头的行忽略。
+
+使用方法：
+    python rule_simulator.py <配置文件.json|.yml> <查询文件.txt> [--save results.tsv] [--expect results.tsv] [--stats hits.json]
+    python rule_simulator.py <配置文件.json|.yml> --query www.google.com --query 8.8.8.8
+"""
+
+import re
+import sys
+import socket
+import json
+import time
+import argparse
+from collections import Counter
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from rule_index import (CIDR_TYPES, NO_PAYLOAD_TYPES, CidrIndex, DomainSuffixTrie, KeywordAutomaton,
+                        cidr_key, normalize_domain, parse_rule)
+from rules_optimizer import load_config
+
+# 没有规则命中时Clash使用的策略
+DEFAULT_TARGET = 'DIRECT'
+# 缓存的查询结果数上限（DNS日志等查询集中重复较多，缓存满时清空重新开始）
+RESULT_CACHE_SIZE = 1 << 20
+# 快速判断查询是否可能是IP地址（域名的最后一段不会是纯数字，IPv6地址含冒号）
+IP_LIKE_PATTERN = re.compile(r'(?:^|\.)\d+$|:')
+
+
+def parse_address(text: str) -> Optional[Tuple[int, int]]:
+    """
+    解析IP地址（比 ipaddress 模块快得多，批量查询时使用）
+
+    Returns:
+        Optional[Tuple[int, int]]: (地址族版本, 地址整数值)，不是IP地址时为None
+    """
+    if ':' in text:
+        family, version = socket.AF_INET6, 6
+        text = text.strip('[]')
+    else:
+        family, version = socket.AF_INET, 4
+    try:
+        return version, int.from_bytes(socket.inet_pton(family, text), 'big')
+    except (OSError, ValueError):
+        return None
+
+
+class RuleMatcher:
+    """规则匹配引擎：按规则类型建立索引，每次查询只访问可能命中的规则"""
+
+    def __init__(self, lines: List[str]):
+        """
+        Args:
+            lines: 规则文本列表（通常是最终配置的 rules）
+        """
+        self.rules = []
+        self.domains: Dict[str, int] = {}
+        self.suffixes = DomainSuffixTrie()
+        self.keywords = KeywordAutomaton()
+        self.regexes: List[Tuple[int, re.Pattern]] = []
+        # 不带 no-resolve 的网段对已解析的域名和IP查询都生效，所有网段（包括 no-resolve）对IP查询生效
+        self.networks = CidrIndex()
+        self.all_networks = CidrIndex()
+        self.final_index: Optional[int] = None
+        # 无法离线判断、视为不命中的规则：类型 -> 数量
+        self.unsupported = Counter()
+        self.invalid = []
+        # 最早的关键字规则位置，已命中更早的规则时跳过关键字扫描
+        min_keyword = None
+
+        for index, line in enumerate(lines):
+            try:
+                rule = parse_rule(line, index)
+            except ValueError as e:
+                self.rules.append(None)
+                self.invalid.append(f"#{index} {e}")
+                continue
+            self.rules.append(rule)
+            if rule.type == 'DOMAIN':
+                self.domains.setdefault(normalize_domain(rule.payload), index)
+            elif rule.type == 'DOMAIN-SUFFIX':
+                self.suffixes.insert(rule.payload, index)
+            elif rule.type == 'DOMAIN-KEYWORD':
+                self.keywords.add(rule.payload.lower(), index)
+                if min_keyword is None:
+                    min_keyword = index
+            elif rule.type == 'DOMAIN-REGEX':
+                try:
+                    self.regexes.append((index, re.compile(rule.payload)))
+                except re.error as e:
+                    self.invalid.append(f"#{index} {e}")
+            elif rule.type in CIDR_TYPES:
+                try:
+                    network, no_resolve = cidr_key(rule)
+                except ValueError as e:
+                    self.invalid.append(f"#{index} {e}")
+                    continue
+                if not no_resolve:
+                    self.networks.insert(network, index)
+                self.all_networks.insert(network, index)
+            elif rule.type in NO_PAYLOAD_TYPES:
+                if self.final_index is None:
+                    self.final_index = index
+            else:
+                self.unsupported[rule.type] += 1
+        self.keywords.build()
+        self.min_keyword = min_keyword
+        # 没有规则命中时的位置（排在所有规则之后）
+        self.miss_index = len(self.rules)
+
+
+    def match_domain(self, domain: str, address=None) -> int:
+        """
+        返回域名命中的规则位置
+
+        Args:
+            domain: 规范化的域名
+            address: 该域名已解析的地址（parse_address 的结果），为None时不匹配IP规则
+        """
+        best = self.final_index if self.final_index is not None else self.miss_index
+        index = self.domains.get(domain)
+        if index is not None and index < best:
+            best = index
+        for index in self.suffixes.covering_normalized(domain):
+            if index < best:
+                best = index
+        if self.min_keyword is not None and self.min_keyword < best:
+            index = self.keywords.search(domain)
+            if index is not None and index < best:
+                best = index
+        for index, pattern in self.regexes:
+            if index >= best:
+                break
+            if pattern.search(domain):
+                best = index
+                break
+        if address is not None:
+            best = self.networks.lowest_int(address[0], address[1], best)
+        return best
+
+    def match(self, query: str) -> int:
+        """
+        解析一个查询（域名、IP，或"域名 IP"），返回命中的规则位置，没有规则命中时为 miss_index
+
+        Raises:
+            ValueError: 查询中的IP地址无效
+        """
+        domain, _, address = query.strip().partition(' ')
+        if IP_LIKE_PATTERN.search(domain):
+            ip = parse_address(domain)
+            if ip is not None:
+                best = self.final_index if self.final_index is not None else self.miss_index
+                return self.all_networks.lowest_int(ip[0], ip[1], best)
+        if address:
+            text = address.strip()
+            address = parse_address(text)
+            if address is None:
+                raise ValueError(f"无效的IP地址: {text}")
+        return self.match_domain(normalize_domain(domain), address or None)
+
+    def target(self, index: int) -> str:
+        """返回规则位置对应的目标策略"""
+        return self.rules[index].target if index < self.miss_index else DEFAULT_TARGET
+
+
+def iter_queries(lines: Iterable[str]) -> Iterator[str]:
+    """过滤空行和注释"""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def load_expected(path: str) -> Dict[str, str]:
+    """读取保存的结果文件（查询\\t目标\\t规则），返回 查询 -> 目标"""
+    expected = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) >= 2 and not line.startswith('#'):
+                expected[parts[0]] = parts[1]
+    return expected
+
+
+def simulate(matcher: RuleMatcher, queries: Iterable[str], save_file=None,
+             expected: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    批量解析查询，统计规则命中次数，可选写出结果和与期望结果比较
+
+    Args:
+        matcher: 规则匹配引擎
+        queries: 查询迭代器
+        save_file: 写出结果的文本文件对象（查询\\t目标\\t规则）
+        expected: 期望结果（查询 -> 目标）
+
+    Returns:
+        Dict: queries（查询数）、elapsed（秒）、hits（规则位置 -> 命中次数，miss_index 表示未命中）、
+              invalid（无效查询）、mismatches（与期望不同的 (查询, 期望, 实际)）
+    """
+    hits = [0] * (matcher.miss_index + 1)
+    rules = matcher.rules
+    invalid = []
+    mismatches = []
+    cache = {}
+    count = 0
+    start = time.perf_counter()
+    for query in queries:
+        count += 1
+        index = cache.get(query)
+        if index is None:
+            try:
+                index = matcher.match(query)
+            except ValueError:
+                invalid.append(query)
+                continue
+            if len(cache) >= RESULT_CACHE_SIZE:
+                cache.clear()
+            cache[query] = index
+        hits[index] += 1
+        if save_file is not None or expected is not None:
+            target = matcher.target(index)
+            if save_file is not None:
+                save_file.write(f"{query}\t{target}\t{rules[index].line if index < matcher.miss_index else ''}\n")
+            if expected is not None:
+                expected_target = expected.get(query)
+                if expected_target is not None and expected_target != target:
+                    mismatches.append((query, expected_target, target))
+    return {
+        'queries': count,
+        'elapsed': time.perf_counter() - start,
+        'hits': hits,
+        'invalid': invalid,
+        'mismatches': mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线模拟Clash规则匹配，批量解析域名和IP的目标策略组')
+    parser.add_argument('config', help='包含 rules 列表的JSON或YAML配置文件')
+    parser.add_argument('queries', nargs='?', help='查询文件，每行一个域名、IP或"域名 IP"')
+    parser.add_argument('--query', action='append', help='直接指定查询，可重复指定')
+    parser.add_argument('--save', help='将解析结果保存为TSV文件（查询、目标、命中的规则）')
+    parser.add_argument('--expect', help='与保存的结果比较，目标不同时返回退出码1')
+    parser.add_argument('--stats', help='将每条规则的命中次数保存为JSON文件')
+    parser.add_argument('--top', type=int, default=10, help='显示命中次数最多的规则条数（默认10）')
+    args = parser.parse_args()
+    if not args.queries and not args.query:
+        parser.error('需要指定查询文件或 --query')
+
+    try:
+        config = load_config(args.config)
+        expected = load_expected(args.expect) if args.expect else None
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+
+    start = time.perf_counter()
+    matcher = RuleMatcher(config['rules'])
+    print(f"加载 {len(matcher.rules)} 条规则，耗时 {time.perf_counter() - start:.2f} 秒")
+    if matcher.unsupported:
+        unsupported = ', '.join(f"{rule_type} {count}" for rule_type, count in matcher.unsupported.most_common())
+        print(f"无法离线判断、视为不命中的规则: {unsupported}")
+    for error in matcher.invalid[:10]:
+        print(f"无效规则: {error}")
+
+    query_file = None
+    save_file = None
+    try:
+        if args.queries:
+            query_file = open(args.queries, 'r', encoding='utf-8')
+            queries = iter_queries(query_file)
+        else:
+            queries = iter_queries(args.query)
+        if args.save:
+            save_file = open(args.save, 'w', encoding='utf-8')
+        result = simulate(matcher, queries, save_file, expected)
+    except OSError as e:
+        print(f"错误: {e}")
+        return 1
+    finally:
+        if query_file:
+            query_file.close()
+        if save_file:
+            save_file.close()
+
+    if args.query:
+        for query in iter_queries(args.query):
+            try:
+                index = matcher.match(query)
+            except ValueError:
+                continue
+            rule = matcher.rules[index].line if index < matcher.miss_index else '（未命中任何规则）'
+            print(f"{query} -> {matcher.target(index)}  [{rule}]")
+
+    elapsed = result['elapsed']
+    rate = result['queries'] / elapsed if elapsed > 0 else 0
+    print(f"解析 {result['queries']} 个查询，耗时 {elapsed:.2f} 秒（{rate:,.0f} 个/秒）")
+    if result['invalid']:
+        print(f"无效查询 {len(result['invalid'])} 个，如: {result['invalid'][0]}")
+
+    hits = result['hits']
+    ranked = sorted((index for index in range(matcher.miss_index) if hits[index]), key=lambda index: -hits[index])
+    if ranked:
+        print(f"命中次数最多的规则（共 {len(ranked)} 条规则有命中，{matcher.miss_index - len(ranked)} 条未命中）:")
+        for index in ranked[:args.top]:
+            print(f"  {hits[index]:>10d}  #{index} {matcher.rules[index].line}")
+    if hits[matcher.miss_index]:
+        print(f"未命中任何规则（使用 {DEFAULT_TARGET}）: {hits[matcher.miss_index]} 个")
+    targets = Counter()
+    for index, count in enumerate(hits):
+        if count:
+            targets[matcher.target(index)] += count
+    print("目标分布: " + ', '.join(f"{target} {count}" for target, count in targets.most_common()))
+
+    if args.stats:
+        stats = {
+            'queries': result['queries'],
+            'elapsed': round(elapsed, 3),
+            'targets': dict(targets),
+            'rules': [{'index': index, 'rule': matcher.rules[index].line, 'hits': hits[index]} for index in ranked],
+            'unmatched': hits[matcher.miss_index],
+        }
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+        print(f"命中统计已保存: {args.stats}")
+    if args.save:
+        print(f"解析结果已保存: {args.save}")
+
+    if expected is not None:
+        mismatches = result['mismatches']
+        if mismatches:
+            print(f"[FAIL] {len(mismatches)} 个查询的目标与 {args.expect} 不同:")
+            for query, expected_target, target in mismatches[:args.top]:
+                print(f"  {query}: {expected_target} -> {target}")
+            return 1
+        print(f"[OK] 所有查询的目标与 {args.expect} 相同")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
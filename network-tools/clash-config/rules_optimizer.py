@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Clash规则列表优化工具
+
+功能说明：
+1. 规范化规则（类型大写，域名小写并去掉首尾的点，关键字只转小写，网段按网络地址表示），移除完全重复的规则
+2. 移除被前面更宽泛的规则遮蔽、永远不会命中的规则：
+   - DOMAIN / DOMAIN-SUFFIX 被前面的 DOMAIN-SUFFIX（域名后缀前缀树）或 DOMAIN-KEYWORD 覆盖
+   - DOMAIN-KEYWORD 被前面包含于它的 DOMAIN-KEYWORD 覆盖
+   - IP-CIDR / IP-CIDR6 被前面包含它的网段覆盖（CIDR索引）；带 no-resolve 的规则只能遮蔽同样带 no-resolve 的规则
+   - MATCH / FINAL 之后的所有规则
+3. 被遮蔽的规则与遮蔽它的规则目标不同时报告为冲突（模板作者的本意可能没有生效）
+4. Clash按顺序匹配规则，优化后的规则列表对任意请求的匹配结果与原列表相同
+5. 可单独运行，也由 yaml_merger.py 在生成配置前优化模板规则（--optimize-rules）
+6. --verify 用逐条顺序匹配的方式比较优化前后的规则列表（回归检查），匹配结果不同时返回非零退出码
+
+使用方法：
+    python rules_optimizer.py <配置文件.json|.yml> [--output 优化后的配置.json] [--report 报告.json] [--verify]
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+
+from rule_index import (CIDR_TYPES, NO_PAYLOAD_TYPES, CidrIndex, DomainSuffixTrie, Rule,
+                        cidr_key, normalize_domain, parse_rule)
+
+# Clash内置的策略，规则目标可以直接使用
+BUILTIN_TARGETS = ('DIRECT', 'REJECT', 'REJECT-DROP', 'PASS', 'COMPATIBLE')
+# 移除原因
+REASON_DUPLICATE = 'duplicate'
+REASON_SHADOWED = 'shadowed'
+REASON_UNREACHABLE = 'unreachable'
+
+
+def rule_identity(rule: Rule) -> Tuple:
+    """规则的规范化身份（不含目标），身份相同的两条规则匹配完全相同的请求"""
+    payload = rule.payload
+    options = tuple(sorted(option.lower() for option in rule.options))
+    if rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+        payload = normalize_domain(payload)
+    elif rule.type == 'DOMAIN-KEYWORD':
+        # 关键字按子串匹配，首尾的点是关键字的一部分（".cn" 不匹配 "cn.com"），只转小写
+        payload = payload.strip().lower()
+    elif rule.type in CIDR_TYPES:
+        try:
+            network, _ = cidr_key(rule)
+            payload = str(network)
+        except ValueError:
+            pass
+    return rule.type, payload, options
+
+
+class RuleOptimizer:
+    """按顺序检查规则，维护已保留规则的索引，判断每条新规则是否重复或被遮蔽"""
+
+    def __init__(self):
+        self.identities: Dict[Tuple, Rule] = {}
+        self.suffixes = DomainSuffixTrie()
+        self.keywords: Dict[str, Rule] = {}
+        self._keyword_pattern = None
+        # 不带 no-resolve 的网段遮蔽所有子网段，带 no-resolve 的只遮蔽带 no-resolve 的子网段
+        self.networks = CidrIndex()
+        self.no_resolve_networks = CidrIndex()
+        self.final_rule: Optional[Rule] = None
+
+    def find_keyword(self, text: str) -> Optional[Rule]:
+        """返回包含于 text 中的、最早的 DOMAIN-KEYWORD 规则"""
+        if not self.keywords:
+            return None
+        if self._keyword_pattern is None:
+            self._keyword_pattern = re.compile('|'.join(map(re.escape, self.keywords)))
+        # 绝大多数规则不含任何关键字，由组合正则一次排除；命中时按规则顺序找出最早的关键字
+        if not self._keyword_pattern.search(text):
+            return None
+        return next(rule for keyword, rule in self.keywords.items() if keyword in text)
+
+    def check(self, rule: Rule) -> Optional[Tuple[str, Rule]]:
+        """
+        判断规则是否可以移除，不可移除时将其加入索引
+
+        Args:
+            rule: 按顺序传入的规则
+
+        Returns:
+            Optional[Tuple[str, Rule]]: (移除原因, 导致移除的前面的规则)，需要保留时为None
+        """
+        if self.final_rule is not None:
+            return REASON_UNREACHABLE, self.final_rule
+
+        identity = rule_identity(rule)
+        if identity in self.identities:
+            return REASON_DUPLICATE, self.identities[identity]
+
+        # 可能遮蔽该规则的前面的规则，Clash实际命中其中位置最早的一条
+        covering = []
+        if rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+            covering.extend(self.suffixes.covering(identity[1]))
+            covering.append(self.find_keyword(identity[1]))
+        elif rule.type == 'DOMAIN-KEYWORD':
+            covering.append(self.find_keyword(identity[1]))
+        elif rule.type in CIDR_TYPES:
+            try:
+                network, no_resolve = cidr_key(rule)
+            except ValueError:
+                network = None
+            if network is not None:
+                covering.extend(self.networks.covering(network))
+                if no_resolve:
+                    covering.extend(self.no_resolve_networks.covering(network))
+        covering = [item for item in covering if item is not None]
+        if covering:
+            return REASON_SHADOWED, min(covering, key=lambda item: item.index)
+
+        self.identities[identity] = rule
+        if rule.type == 'DOMAIN-SUFFIX':
+            self.suffixes.insert(identity[1], rule)
+        elif rule.type == 'DOMAIN-KEYWORD':
+            self.keywords[identity[1]] = rule
+            self._keyword_pattern = None
+        elif rule.type in CIDR_TYPES and network is not None:
+            (self.no_resolve_networks if no_resolve else self.networks).insert(network, rule)
+        elif rule.type in NO_PAYLOAD_TYPES:
+            self.final_rule = rule
+        return None
+
+
+def optimize_rules(lines: List[str]) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    优化规则列表：移除重复、被遮蔽和不可达的规则，保持其余规则的原有顺序和文本
+
+    Args:
+        lines: 规则文本列表
+
+    Returns:
+        Tuple: (优化后的规则列表, 报告)。报告包含 total、kept、各原因的移除数量 removed、
+               移除明细 removed_rules、目标不同的冲突 conflicts 和无法解析的规则 invalid
+    """
+    optimizer = RuleOptimizer()
+    kept = []
+    removed = []
+    conflicts = []
+    invalid = []
+    for index, line in enumerate(lines):
+        try:
+            rule = parse_rule(line, index)
+        except ValueError as e:
+            # 无法解析的规则原样保留，由客户端报告
+            invalid.append({'index': index, 'rule': line, 'error': str(e)})
+            kept.append(line)
+            continue
+        result = optimizer.check(rule)
+        if result is None:
+            kept.append(line)
+            continue
+        reason, by = result
+        entry = {'index': index, 'rule': line, 'reason': reason, 'by_index': by.index, 'by': by.line}
+        removed.append(entry)
+        if rule.target != by.target:
+            conflicts.append(entry)
+
+    counts = {reason: 0 for reason in (REASON_DUPLICATE, REASON_SHADOWED, REASON_UNREACHABLE)}
+    for entry in removed:
+        counts[entry['reason']] += 1
+    report = {
+        'total': len(lines),
+        'kept': len(kept),
+        'removed': counts,
+        'removed_rules': removed,
+        'conflicts': conflicts,
+        'invalid': invalid,
+    }
+    return kept, report
+
+
+@lru_cache(maxsize=None)
+def _linear_network(rule: Rule) -> Tuple[Any, bool]:
+    """linear_match 使用的网段解析缓存（逐条匹配时每个查询都要检查全部IP规则）"""
+    try:
+        return cidr_key(rule)
+    except ValueError:
+        return None, False
+
+
+def linear_match(rules: List[Rule], domain: Optional[str], address=None) -> Optional[Rule]:
+    """
+    逐条按顺序匹配规则，返回第一条命中的规则（不使用任何索引，用于检查优化结果）
+
+    Args:
+        rules: 已解析的规则列表
+        domain: 规范化的域名，查询IP时为None
+        address: IP地址（ipaddress 对象）。domain 不为None时表示该域名已解析的地址，
+                 只匹配不带 no-resolve 的IP规则
+    """
+    for rule in rules:
+        if rule.type in NO_PAYLOAD_TYPES:
+            return rule
+        if domain is not None and rule.type in ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD'):
+            if rule.type == 'DOMAIN':
+                hit = domain == normalize_domain(rule.payload)
+            elif rule.type == 'DOMAIN-SUFFIX':
+                suffix = normalize_domain(rule.payload)
+                hit = domain == suffix or domain.endswith('.' + suffix)
+            else:
+                hit = rule.payload.strip().lower() in domain
+            if hit:
+                return rule
+        elif address is not None and rule.type in CIDR_TYPES:
+            network, no_resolve = _linear_network(rule)
+            if network is None:
+                continue
+            if (domain is None or not no_resolve) and address.version == network.version and address in network:
+                return rule
+    return None
+
+
+def probe_queries(rule: Rule) -> List[Tuple[Optional[str], Any]]:
+    """生成一定会命中该规则本身的查询 (域名, IP地址)，用于检查该规则被移除后匹配结果是否改变"""
+    if rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+        domain = rule_identity(rule)[1]
+        return [(domain, None), ('probe.' + domain, None)] if rule.type == 'DOMAIN-SUFFIX' else [(domain, None)]
+    if rule.type == 'DOMAIN-KEYWORD':
+        keyword = rule_identity(rule)[1]
+        return [(keyword, None), (f"probe{keyword}probe", None)]
+    if rule.type in CIDR_TYPES:
+        try:
+            network, _ = cidr_key(rule)
+        except ValueError:
+            return []
+        return [(None, address) for address in (network.network_address, network.broadcast_address)] + \
+               [('probe.invalid', address) for address in (network.network_address, network.broadcast_address)]
+    if rule.type in NO_PAYLOAD_TYPES:
+        return [('probe.invalid', None)]
+    return []
+
+
+def verify_rules(lines: List[str], kept: List[str]) -> List[Dict[str, Any]]:
+    """
+    检查优化后的规则列表与原列表的匹配结果是否相同
+
+    保留的规则顺序不变，只可能在原列表中第一条命中的规则被移除时结果不同，
+    因此只对被移除规则生成的查询做逐条顺序匹配，耗时为 被移除规则数 x 规则总数。
+
+    Args:
+        lines: 原规则文本列表
+        kept: optimize_rules 返回的规则列表
+
+    Returns:
+        List[Dict]: 匹配结果不同的查询 {"query", "before", "after"}（命中的规则文本，未命中为None）
+    """
+    def parse_all(rule_lines):
+        rules = []
+        for index, line in enumerate(rule_lines):
+            try:
+                rules.append(parse_rule(line, index))
+            except ValueError:
+                continue
+        return rules
+
+    before_rules = parse_all(lines)
+    after_rules = parse_all(kept)
+    # 按原列表中的位置判断规则是否被移除（kept 保持原文本和顺序）
+    remaining = Counter(kept)
+    removed = []
+    for rule in before_rules:
+        if remaining[rule.line] > 0:
+            remaining[rule.line] -= 1
+        else:
+            removed.append(rule)
+
+    mismatches = []
+    checked = set()
+    for rule in removed:
+        for query in probe_queries(rule):
+            if query in checked:
+                continue
+            checked.add(query)
+            before = linear_match(before_rules, *query)
+            after = linear_match(after_rules, *query)
+            before_target = before.target if before else None
+            after_target = after.target if after else None
+            if before_target != after_target:
+                domain, address = query
+                text = ' '.join(str(part) for part in (domain, address) if part is not None)
+                mismatches.append({'query': text, 'before': before.line if before else None,
+                                   'after': after.line if after else None})
+    _linear_network.cache_clear()
+    return mismatches
+
+
+def find_unknown_targets(lines: List[str], config: Dict[str, Any]) -> List[str]:
+    """
+    返回目标既不是代理分组、代理节点，也不是内置策略的规则
+
+    Args:
+        lines: 规则文本列表
+        config: 包含 proxy-groups（和 proxies）的配置
+    """
+    targets = set(BUILTIN_TARGETS)
+    targets.update(group.get('name') for group in config.get('proxy-groups') or [] if isinstance(group, dict))
+    targets.update(proxy.get('name') for proxy in config.get('proxies') or [] if isinstance(proxy, dict))
+    unknown = []
+    for line in lines:
+        try:
+            rule = parse_rule(line)
+        except ValueError:
+            continue
+        if rule.target not in targets:
+            unknown.append(line)
+    return unknown
+
+
+def load_config(config_file: str) -> Dict[str, Any]:
+    """读取JSON或YAML配置文件"""
+    if config_file.endswith(('.yml', '.yaml')):
+        from yml2json import load_yaml_file
+        config = load_yaml_file(config_file)
+    else:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    if not isinstance(config, dict) or not isinstance(config.get('rules'), list):
+        raise ValueError(f"配置文件缺少 rules 列表: {config_file}")
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='移除Clash配置中重复、被遮蔽和不可达的规则，并报告目标冲突')
+    parser.add_argument('config', help='包含 rules 列表的JSON或YAML配置文件')
+    parser.add_argument('--output', help='写出优化后的配置（JSON格式）')
+    parser.add_argument('--report', help='将完整报告保存为JSON文件')
+    parser.add_argument('--show', type=int, default=10, help='显示的冲突条数（默认10）')
+    parser.add_argument('--verify', action='store_true',
+                        help='逐条顺序匹配比较优化前后的规则列表，结果不同时返回退出码1')
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+
+    start = time.perf_counter()
+    kept, report = optimize_rules(config['rules'])
+    elapsed = time.perf_counter() - start
+
+    removed = report['removed']
+    print(f"规则 {report['total']} 条 -> {report['kept']} 条（重复 {removed[REASON_DUPLICATE]}，"
+          f"被遮蔽 {removed[REASON_SHADOWED]}，不可达 {removed[REASON_UNREACHABLE]}），耗时 {elapsed:.2f} 秒")
+    if report['invalid']:
+        print(f"无法解析的规则 {len(report['invalid'])} 条（原样保留）")
+    if report['conflicts']:
+        print(f"目标冲突 {len(report['conflicts'])} 条:")
+        for entry in report['conflicts'][:args.show]:
+            print(f"  #{entry['index']} {entry['rule']}  <-  #{entry['by_index']} {entry['by']}")
+    unknown = find_unknown_targets(kept, config)
+    if unknown:
+        print(f"目标不存在的规则 {len(unknown)} 条，如: {unknown[0]}")
+
+    mismatches = []
+    if args.verify:
+        mismatches = verify_rules(config['rules'], kept)
+        if mismatches:
+            print(f"校验失败：{len(mismatches)} 个查询的匹配结果改变:")
+            for entry in mismatches[:args.show]:
+                print(f"  {entry['query']}: {entry['before']} -> {entry['after']}")
+        else:
+            print("校验通过：优化前后的匹配结果相同")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存: {args.report}")
+    if args.output:
+        config['rules'] = kept
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        print(f"优化后的配置已保存: {args.output}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
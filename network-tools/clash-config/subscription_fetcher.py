@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+订阅并发下载工具
+
+功能说明：
+1. 在线程池中并发下载所有订阅地址，同一主机的连接放入连接池复用（HTTP keep-alive）
+2. 条件请求：按上一次响应的 ETag / Last-Modified 发送 If-None-Match / If-Modified-Since，未变化时服务器返回 304
+3. 响应元数据保存在磁盘缓存清单中，订阅内容直接写入订阅源文件；内容与已有文件相同时不改写文件
+4. 连接错误、超时、429和5xx响应按指数退避重试（遵循 Retry-After），下载失败时保留已有文件
+5. 支持gzip压缩传输和重定向
+
+由 yaml_merger.py 的下载阶段调用，也可单独运行：
+    python subscription_fetcher.py <url> <保存路径> [--cache-dir .merger-cache]
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import tempfile
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+# 默认的并发数、超时（秒）、重试次数和User-Agent（部分订阅服务按UA返回Clash格式）
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_USER_AGENT = 'clash.meta'
+# 下载缓存清单文件名（保存在缓存目录中）
+FETCH_MANIFEST_NAME = 'fetch-manifest.json'
+# 可重试的HTTP状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+MAX_REDIRECTS = 5
+
+
+class FetchError(Exception):
+    """下载失败（重试后仍失败或返回不可重试的错误状态）"""
+
+
+class ConnectionPool:
+    """按 (协议, 主机, 端口) 复用 http.client 连接的线程安全连接池"""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme: str, host: str, port: int, reuse: bool = True) -> http.client.HTTPConnection:
+        """取出一个空闲连接（conn.reused 为True），没有空闲连接或 reuse 为False时新建"""
+        key = (scheme, host, port)
+        if reuse:
+            with self._lock:
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()
+                    conn.reused = True
+                    return conn
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        conn.reused = False
+        return conn
+
+    def release(self, scheme: str, host: str, port: int, conn: http.client.HTTPConnection):
+        """归还可以继续使用的连接"""
+        with self._lock:
+            self._idle.setdefault((scheme, host, port), []).append(conn)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+
+
+class SubscriptionFetcher:
+    """并发下载订阅，带条件请求、磁盘缓存清单和重试"""
+
+    def __init__(self, cache_dir: Path, concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                 user_agent: str = DEFAULT_USER_AGENT, logger=None):
+        """
+        Args:
+            cache_dir: 缓存目录（保存下载缓存清单）
+            concurrency: 最大并发下载数
+            timeout: 单次请求超时秒数
+            retries: 失败后的最大重试次数
+            backoff: 第一次重试前的等待秒数，之后每次翻倍
+            user_agent: 请求使用的User-Agent
+            logger: 日志器，为None时不输出日志
+        """
+        self.cache_dir = Path(cache_dir)
+        self.manifest_file = self.cache_dir / FETCH_MANIFEST_NAME
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.user_agent = user_agent
+        self.logger = logger
+        self.pool = ConnectionPool(timeout)
+        self.manifest = self.load_manifest()
+        self._manifest_lock = threading.Lock()
+
+    def log(self, level: str, message: str):
+        if self.logger:
+            getattr(self.logger, level)(message)
+
+    def load_manifest(self) -> Dict[str, Any]:
+        """读取下载缓存清单：URL -> {etag, last_modified, sha256, path, fetched_at}"""
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest if isinstance(manifest, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_manifest(self):
+        """原子写出下载缓存清单"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    @staticmethod
+    def send(conn: http.client.HTTPConnection, path: str, headers: Dict[str, str]):
+        """在连接上发送GET请求并读取完整响应"""
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def request(self, url: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        发送一次GET请求（跟随重定向），连接可复用时归还连接池
+
+        Returns:
+            Tuple: (状态码, 响应头（小写键）, 响应体（已解压）)
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise FetchError(f"不支持的地址: {url}")
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+
+            conn = self.pool.acquire(parts.scheme, parts.hostname, port)
+            try:
+                response, body = self.send(conn, path, headers)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if not conn.reused:
+                    raise
+                # 复用的连接可能已被服务器关闭，立即用新连接重试一次（不计入重试次数）
+                conn = self.pool.acquire(parts.scheme, parts.hostname, port, reuse=False)
+                try:
+                    response, body = self.send(conn, path, headers)
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    raise
+            response_headers = {key.lower(): value for key, value in response.getheaders()}
+            if response.will_close:
+                conn.close()
+            else:
+                self.pool.release(parts.scheme, parts.hostname, port, conn)
+
+            if response.status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+                url = urljoin(url, response_headers['location'])
+                continue
+            if response_headers.get('content-encoding') == 'gzip':
+                body = gzip.decompress(body)
+            return response.status, response_headers, body
+        raise FetchError(f"重定向次数过多: {url}")
+
+    def fetch(self, name: str, url: str, path: Path) -> Dict[str, Any]:
+        """
+        下载一个订阅到 path（条件请求，失败时按指数退避重试）
+
+        Args:
+            name: 源名称（用于日志）
+            url: 订阅地址
+            path: 保存路径
+
+        Returns:
+            Dict: {"name", "status": "updated"/"unchanged"/"failed", "bytes", "attempts", "error"}
+        """
+        path = Path(path)
+        result = {"name": name, "status": "failed", "bytes": 0, "attempts": 0, "error": None}
+        cached = self.manifest.get(url) or {}
+        headers = {'User-Agent': self.user_agent, 'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'}
+        # 只有本地文件仍存在时才发送条件请求
+        if path.exists() and cached.get('path') == str(path):
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        for attempt in range(self.retries + 1):
+            result["attempts"] = attempt + 1
+            delay = self.backoff * (2 ** attempt)
+            try:
+                status, response_headers, body = self.request(url, headers)
+            except (OSError, http.client.HTTPException, EOFError, zlib.error) as e:
+                # 截断或损坏的gzip响应体解压时抛出 EOFError/zlib.error（BadGzipFile 为 OSError 子类），按可重试失败处理
+                result["error"] = f"{type(e).__name__}: {e}"
+            except FetchError as e:
+                result["error"] = str(e)
+                break
+            else:
+                if status == 304:
+                    result["status"] = "unchanged"
+                    result["error"] = None
+                    self.record(url, path, response_headers, cached.get('sha256'))
+                    return result
+                if status == 200:
+                    result["bytes"] = len(body)
+                    result["error"] = None
+                    digest = hashlib.sha256(body).hexdigest()
+                    # 内容未变化时不改写文件，保持 mtime 不变，后续增量构建可直接跳过
+                    if path.exists() and cached.get('sha256') == digest and cached.get('path') == str(path):
+                        result["status"] = "unchanged"
+                    else:
+                        try:
+                            self.write_file(path, body)
+                        except OSError as e:
+                            result["error"] = f"写出文件失败: {e}"
+                            break
+                        result["status"] = "updated"
+                    self.record(url, path, response_headers, digest)
+                    return result
+                result["error"] = f"HTTP {status}"
+                if status not in RETRY_STATUS:
+                    break
+                retry_after = response_headers.get('retry-after', '')
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            if attempt < self.retries:
+                self.log('warning', f"下载 {name} 失败（{result['error']}），{delay:.1f} 秒后重试")
+                time.sleep(delay)
+        return result
+
+    def record(self, url: str, path: Path, headers: Dict[str, str], digest: Optional[str]):
+        """记录一次成功响应的缓存元数据"""
+        with self._manifest_lock:
+            entry = dict(self.manifest.get(url) or {})
+            entry.update({
+                'path': str(path),
+                'sha256': digest,
+                'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            })
+            for header, key in (('etag', 'etag'), ('last-modified', 'last_modified')):
+                if headers.get(header):
+                    entry[key] = headers[header]
+            self.manifest[url] = entry
+
+    @staticmethod
+    def write_file(path: Path, body: bytes):
+        """原子写出下载内容"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + path.name + '.', suffix='.tmp', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def fetch_all(self, subscriptions: List[Tuple[str, str, Path]]) -> List[Dict[str, Any]]:
+        """
+        并发下载所有订阅，完成后保存缓存清单
+
+        Args:
+            subscriptions: (源名称, 订阅地址, 保存路径) 列表
+
+        Returns:
+            List[Dict]: 各订阅的 fetch 结果，顺序与输入相同
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, max(1, len(subscriptions)))) as executor:
+                results = list(executor.map(lambda item: self.fetch(*item), subscriptions))
+        finally:
+            self.pool.close()
+        self.save_manifest()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='下载订阅（条件请求、重试），内容未变化时不改写文件')
+    parser.add_argument('url', help='订阅地址')
+    parser.add_argument('path', help='保存路径')
+    parser.add_argument('--cache-dir', default='.merger-cache', help='缓存清单目录（默认 .merger-cache）')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help=f'最大重试次数（默认{DEFAULT_RETRIES}）')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help=f'请求超时秒数（默认{DEFAULT_TIMEOUT}）')
+    parser.add_argument('--user-agent', default=DEFAULT_USER_AGENT, help=f'User-Agent（默认{DEFAULT_USER_AGENT}）')
+    args = parser.parse_args()
+
+    fetcher = SubscriptionFetcher(Path(args.cache_dir), timeout=args.timeout, retries=args.retries,
+                                  user_agent=args.user_agent)
+    result = fetcher.fetch_all([(Path(args.path).stem, args.url, Path(args.path))])[0]
+    if result["status"] == "failed":
+        print(f"下载失败: {result['error']}（尝试 {result['attempts']} 次）")
+        return 1
+    print(f"{'已更新' if result['status'] == 'updated' else '未变化'}: {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
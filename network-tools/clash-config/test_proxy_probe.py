@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+proxy_probe.py 和 yaml_merger.py 节点测速的回归测试（只连接本机端口，不访问外网）
+
+使用方法：
+    python -m unittest test_proxy_probe.py
+"""
+
+import socket
+import logging
+import tempfile
+import shutil
+import unittest
+
+from proxy_probe import probe_proxies, probe_target, rank_proxies
+from yaml_merger import YamlToJsonMerger
+
+
+def closed_port() -> int:
+    """返回本机一个当前没有监听的端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class UdpProxyTest(unittest.TestCase):
+    """hysteria2 等只走UDP的节点不能用TCP连接判断是否可达"""
+
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.addCleanup(self.listener.close)
+        port = closed_port()
+        self.proxies = [
+            {'name': 'hy2', 'type': 'hysteria2', 'server': '127.0.0.1', 'port': port, 'password': 'x'},
+            {'name': 'dead', 'type': 'ss', 'server': '127.0.0.1', 'port': port, 'cipher': 'aes-128-gcm'},
+            {'name': 'alive', 'type': 'ss', 'server': '127.0.0.1', 'port': self.listener.getsockname()[1],
+             'cipher': 'aes-128-gcm'},
+            {'name': 'tuic', 'type': 'tuic', 'server': '127.0.0.1', 'port': port, 'uuid': 'x'},
+        ]
+
+    def test_udp_proxies_are_not_probed(self):
+        latencies = probe_proxies(self.proxies, timeout=1)
+        self.assertEqual(set(latencies), {'dead', 'alive'})
+        self.assertIsNone(latencies['dead'])
+        self.assertIsNotNone(latencies['alive'])
+
+    def test_no_tls_handshake_for_udp_types(self):
+        self.assertIsNone(probe_target(self.proxies[0], tls=True)[2])
+
+    def test_drop_keeps_udp_proxies_in_place(self):
+        latencies = {'dead': None, 'alive': 12.0}
+        names = [proxy['name'] for proxy in rank_proxies(self.proxies, latencies, drop_unreachable=True)]
+        self.assertEqual(names, ['hy2', 'alive', 'tuic'])
+        names = [proxy['name'] for proxy in rank_proxies(self.proxies, latencies)]
+        self.assertEqual(names, ['hy2', 'alive', 'dead', 'tuic'])
+
+    def test_merger_drop_keeps_hysteria2(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        merger = YamlToJsonMerger(work_dir=work_dir)
+        merger.logger.setLevel(logging.WARNING)
+        merger.set_probe_options('drop', timeout=1)
+        names = [proxy['name'] for proxy in merger.probe_proxy_latency(self.proxies)]
+        self.assertEqual(names, ['hy2', 'alive', 'tuic'])
+        self.assertEqual(merger.stats['unreachable_proxies'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+YAML解析后端性能基准工具
+
+功能说明：
+1. 生成合成的大型Clash订阅（默认20000个节点，包含ss/vmess/trojan等常见节点类型和中文名称）
+2. 分别使用libyaml（CSafeLoader/CSafeDumper）和纯Python（SafeLoader/SafeDumper）解析和输出
+3. 校验两种后端的解析结果和JSON输出完全一致，并报告加速比
+4. 完全离线运行，数据生成在临时目录中
+
+使用方法：
+    python yaml_benchmark.py [--nodes 20000] [--repeat 3] [--seed 42] [--save results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+from datetime import datetime
+from typing import Dict, Any
+
+import yaml
+
+from yml2json import YAML_BACKEND, load_yaml, dump_yaml
+
+# 合成节点名称使用的地区和线路
+REGIONS = ['🇺🇸 美国', '🇯🇵 日本', '🇸🇬 新加坡', '🇭🇰 香港', '🇹🇼 台湾', '🇬🇧 英国',
+           '🇩🇪 德国', '🇰🇷 韩国', 'US', 'JP', 'SG', 'HK']
+LINES = ['IPLC', 'IEPL', 'BGP', '直连', '中转']
+
+
+def generate_subscription(nodes: int = 20000, seed: int = 42) -> Dict[str, Any]:
+    """
+    生成合成的Clash订阅数据
+
+    Args:
+        nodes: 节点数量
+        seed: 随机种子，相同参数生成相同的数据
+
+    Returns:
+        Dict: 包含 proxies、proxy-groups 和 rules 的订阅数据
+    """
+    rng = random.Random(seed)
+    proxies = []
+    for i in range(nodes):
+        name = f"{rng.choice(REGIONS)} {rng.choice(LINES)} {i:05d}"
+        server = f"node{i}.{rng.choice(['example.com', 'example.net', 'example.org'])}"
+        kind = rng.choice(['ss', 'vmess', 'trojan'])
+        if kind == 'ss':
+            proxy = {'name': name, 'type': 'ss', 'server': server, 'port': rng.randint(10000, 60000),
+                     'cipher': 'chacha20-ietf-poly1305', 'password': f"{rng.getrandbits(64):016x}", 'udp': True}
+        elif kind == 'vmess':
+            proxy = {'name': name, 'type': 'vmess', 'server': server, 'port': 443,
+                     'uuid': f"{rng.getrandbits(128):032x}", 'alterId': 0, 'cipher': 'auto', 'tls': True,
+                     'network': 'ws', 'ws-opts': {'path': f"/{rng.getrandbits(32):08x}", 'headers': {'Host': server}}}
+        else:
+            proxy = {'name': name, 'type': 'trojan', 'server': server, 'port': 443,
+                     'password': f"{rng.getrandbits(64):016x}", 'sni': server, 'skip-cert-verify': False}
+        proxies.append(proxy)
+
+    names = [proxy['name'] for proxy in proxies]
+    return {
+        'port': 7890,
+        'mode': 'rule',
+        'proxies': proxies,
+        'proxy-groups': [
+            {'name': 'Proxy', 'type': 'select', 'proxies': ['Auto'] + names},
+            {'name': 'Auto', 'type': 'url-test', 'url': 'http://www.gstatic.com/generate_204',
+             'interval': 300, 'proxies': names},
+        ],
+        'rules': [f"DOMAIN-SUFFIX,site{i}.example,Proxy" for i in range(2000)] + ['MATCH,Proxy'],
+    }
+
+
+def time_call(func, repeat: int) -> float:
+    """重复执行并返回最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(yml_path: str, repeat: int) -> Dict[str, Any]:
+    """
+    对比两种后端的解析和输出耗时
+
+    Args:
+        yml_path: 合成订阅文件路径
+        repeat: 每项测量的重复次数（取最短耗时）
+
+    Returns:
+        Dict: 各后端的耗时、是否一致及加速比
+    """
+    with open(yml_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+
+    backends = {'python': (yaml.SafeLoader, yaml.SafeDumper)}
+    if hasattr(yaml, 'CSafeLoader'):
+        backends['libyaml'] = (yaml.CSafeLoader, yaml.CSafeDumper)
+
+    results = {}
+    outputs = {}
+    for backend, (loader, dumper) in backends.items():
+        data = load_yaml(text, loader)
+        outputs[backend] = json.dumps(data, indent=2, ensure_ascii=False)
+        results[backend] = {
+            'load_seconds': time_call(lambda: load_yaml(text, loader), repeat),
+            'dump_seconds': time_call(lambda: dump_yaml(data, dumper=dumper), repeat),
+        }
+
+    summary = {'backends': results, 'identical': len(set(outputs.values())) == 1}
+    if 'libyaml' in results:
+        summary['load_speedup'] = results['python']['load_seconds'] / results['libyaml']['load_seconds']
+        summary['dump_speedup'] = results['python']['dump_seconds'] / results['libyaml']['dump_seconds']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比libyaml和纯Python YAML后端在大型订阅上的性能')
+    parser.add_argument('--nodes', type=int, default=20000, help='合成订阅的节点数量（默认20000）')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测量的重复次数，取最短耗时（默认3）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子（默认42）')
+    parser.add_argument('--save', help='将结果保存为JSON文件')
+    args = parser.parse_args()
+
+    print(f"当前默认后端: {YAML_BACKEND}，PyYAML {yaml.__version__}")
+    if not hasattr(yaml, 'CSafeLoader'):
+        print("警告: 当前PyYAML未编译libyaml支持，只能测量纯Python后端。")
+
+    with tempfile.TemporaryDirectory(prefix='yaml-bench-') as tmp_dir:
+        yml_path = os.path.join(tmp_dir, 'subscription.yml')
+        with open(yml_path, 'w', encoding='utf-8') as f:
+            dump_yaml(generate_subscription(args.nodes, args.seed), f)
+        size = os.path.getsize(yml_path)
+        print(f"已生成合成订阅: {args.nodes} 个节点，{size} 字节")
+
+        summary = run_benchmark(yml_path, max(1, args.repeat))
+
+    for backend, timing in summary['backends'].items():
+        print(f"{backend:8s} 解析 {timing['load_seconds'] * 1000:8.1f} ms，输出 {timing['dump_seconds'] * 1000:8.1f} ms")
+    if 'load_speedup' in summary:
+        print(f"libyaml 加速比: 解析 {summary['load_speedup']:.1f}x，输出 {summary['dump_speedup']:.1f}x")
+    print(f"两种后端的解析结果{'一致' if summary['identical'] else '不一致'}")
+
+    if args.save:
+        summary.update({
+            'nodes': args.nodes,
+            'bytes': size,
+            'pyyaml': yaml.__version__,
+            'python': platform.python_version(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        })
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.save}")
+
+    return 0 if summary['identical'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
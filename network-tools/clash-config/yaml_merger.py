@@ -4,10 +4,15 @@
 YAML配置文件合并为JSON配置工具
 
 功能说明：
-1. 将多个YAML配置文件转换为JSON格式
-2. 合并代理配置到统一的模板文件中
-3. 配置AI-Proxy和Auto代理分组
-4. 生成最终的Clash配置文件
+0. 可选：并发下载配置了订阅地址的订阅源（条件请求、重试，见 subscription_fetcher.py）
+1. 在进程池中并行解析和验证任意数量的YAML订阅（源列表来自配置文件或目录glob，每个文件只解析一次）
+2. 合并代理配置到统一的模板文件中，按连接身份去除重复节点
+3. 可选：并发测量节点TCP延迟，按延迟排序并移除或降级不可达节点（见 proxy_probe.py）
+4. 一次扫描完成地区分类，配置AI-Proxy、各地区分组和Auto代理分组；可选：将超过大小上限的分组按地区或订阅源拆分为子分组
+5. 可选：移除模板中重复、被遮蔽和不可达的规则，报告目标冲突（见 rules_optimizer.py）
+   流式生成最终的Clash配置文件（JSON、紧凑JSON或YAML），在内存中验证后原子替换
+6. 按输入内容哈希增量构建：未变化的订阅源直接使用缓存的代理列表，所有输入都未变化时跳过生成
+7. 服务模式（--serve）：通过本地HTTP提供最新配置，支持ETag/304和gzip，输入变化时在后台重新生成（见 config_server.py）
 
 作者：Claude AI Assistant
 创建时间：2025-07-13
@@ -18,35 +23,385 @@ import sys
 import json
 import yaml
 import re
-import subprocess
-from typing import Dict, List, Any, Optional
+import glob
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 import logging
 from datetime import datetime
 
+from yml2json import load_yaml_file, write_json_file, yaml_backend_description
+from config_writer import OUTPUT_FORMATS, write_config
+from config_server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_WATCH_INTERVAL, ConfigServer
+from subscription_fetcher import SubscriptionFetcher
+from proxy_probe import DEFAULT_CONCURRENCY, DEFAULT_TIMEOUT, probe_proxies, rank_proxies
+from merger_metrics import RunMetrics
+from rules_optimizer import REASON_DUPLICATE, REASON_SHADOWED, REASON_UNREACHABLE, find_unknown_targets, optimize_rules
+
+# 源列表配置文件（位于工作目录时自动加载）
+SOURCES_CONFIG_NAME = "merger-sources.json"
+# 增量构建缓存目录（位于工作目录）及格式版本，合并逻辑或缓存格式变化时递增版本号使旧缓存失效
+CACHE_DIR_NAME = ".merger-cache"
+CACHE_MANIFEST_NAME = "manifest.json"
+CACHE_VERSION = 2
+# 重复节点的保留策略：first 保留最先出现的，last 保留最后出现的，off 不去重
+DEDUP_POLICIES = ('first', 'last', 'off')
+# 测速后对不可达节点的处理：drop 移除，demote 排到最后
+PROBE_POLICIES = ('drop', 'demote')
+# 测速结果文件（写在工作目录中）
+PROBE_RESULTS_NAME = "probe-results.json"
+# 运行指标文件（写在工作目录中），见 merger_metrics.py
+METRICS_NAME = "merger-metrics.json"
+# 日志格式
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# 不属于连接身份的字段，计算指纹时忽略
+FINGERPRINT_IGNORED_FIELDS = ('name',)
+# 超大分组的拆分方式：region 按地区，provider 按订阅源
+SHARD_STRATEGIES = ('region', 'provider')
+# 拆分后父分组的类型：在各子分组之间自动选择
+SHARD_PARENT_TYPES = ('url-test', 'fallback')
+# 按地区拆分时不属于任何地区的节点所在子分组
+SHARD_OTHER_KEY = "Other"
+# 子分组的健康检查默认值（父分组没有配置时使用）
+SHARD_DEFAULT_TEST_URL = "http://www.gstatic.com/generate_204"
+SHARD_DEFAULT_INTERVAL = 300
+
+
+def file_digest(path: Path) -> str:
+    """计算文件内容的SHA-256摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_valid_proxy(proxy: Dict[str, Any]) -> bool:
+    """
+    验证代理配置的有效性
+    
+    Args:
+        proxy: 代理配置字典
+        
+    Returns:
+        bool: 是否为有效代理
+    """
+    if not isinstance(proxy, dict):
+        return False
+    
+    required_fields = ['name', 'type', 'server', 'port']
+    
+    for field in required_fields:
+        if field not in proxy or not proxy[field]:
+            return False
+    
+    # 检查端口是否为有效数字
+    try:
+        port = int(proxy['port'])
+        if not (1 <= port <= 65535):
+            return False
+    except (ValueError, TypeError):
+        return False
+    
+    return True
+
+
+def proxy_fingerprint(proxy: Dict[str, Any]) -> str:
+    """
+    计算代理的连接身份指纹：类型、服务器、端口、凭据和传输选项等除名称外的全部字段
+    
+    服务器地址不区分大小写，端口统一为整数，字段顺序不影响结果。
+    
+    Args:
+        proxy: 代理配置字典（已通过 is_valid_proxy 验证）
+        
+    Returns:
+        str: SHA-1摘要
+    """
+    identity = {key: value for key, value in proxy.items() if key not in FINGERPRINT_IGNORED_FIELDS}
+    identity['server'] = str(identity['server']).strip().lower().rstrip('.')
+    identity['port'] = int(identity['port'])
+    text = json.dumps(identity, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# 模式开头的全局内联标志，如 (?i)
+LEADING_FLAGS_PATTERN = re.compile(r'^\(\?([aiLmsux]+)\)')
+# 不含正则元字符的纯文本分支（允许转义的标点，如 \-）
+LITERAL_PATTERN = re.compile(r'(?:[^\\.^$*+?{}\[\]()|]|\\[^A-Za-z0-9])+')
+
+
+def split_region_pattern(pattern: str) -> Tuple[str, List[str]]:
+    """
+    拆分地区匹配模式：提取开头的全局标志，去掉首尾多余的 .*（按 search 语义匹配时没有作用，只会引起回溯），
+    并按顶层的 | 拆分为分支
+    
+    Args:
+        pattern: 正则表达式模式，如 (?i).*(美国|US).*
+        
+    Returns:
+        Tuple[str, List[str]]: (标志, 分支列表)，如 ('i', ['美国', 'US'])
+        
+    Raises:
+        re.error: 模式不是合法的正则表达式
+    """
+    re.compile(pattern)
+    flags = ''
+    match = LEADING_FLAGS_PATTERN.match(pattern)
+    if match:
+        flags = match.group(1)
+        pattern = pattern[match.end():]
+    if pattern.startswith('.*'):
+        pattern = pattern[2:]
+    if pattern.endswith('.*') and not pattern.endswith('\\.*'):
+        pattern = pattern[:-2]
+    
+    # 按顶层的 | 拆分，括号、字符集和转义内的 | 不拆分
+    branches = []
+    depth = 0
+    in_class = False
+    start = 0
+    first_group_end = -1
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\':
+            index += 1
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0 and first_group_end < 0:
+                first_group_end = index
+        elif char == '|' and depth == 0:
+            branches.append(pattern[start:index])
+            start = index + 1
+        index += 1
+    branches.append(pattern[start:])
+    
+    # 整个模式只是一个分组时（如 (美国|US)）拆分分组内部
+    if len(branches) == 1 and first_group_end == len(pattern) - 1:
+        if pattern.startswith('(?:'):
+            return flags, split_region_pattern(pattern[3:-1])[1]
+        if not pattern.startswith('(?'):
+            return flags, split_region_pattern(pattern[1:-1])[1]
+    return flags, branches
+
+
+def build_keyword_pattern(keywords: List[str]) -> str:
+    """
+    将关键字列表构造为前缀树形式的正则（公共前缀只比较一次，同一位置优先匹配最长的关键字）
+    
+    Args:
+        keywords: 关键字列表
+        
+    Returns:
+        str: 正则表达式模式
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    
+    def render(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+    
+    return render(trie)
+
+
+class RegionClassifier:
+    """
+    地区分类器：扫描一次节点名称即可得到它属于的全部地区，结果与逐个地区模式 search 相同
+    
+    纯文本分支（如 美国、US）合并为一棵前缀树，以零宽前瞻的方式在名称的每个位置尝试，
+    并按匹配到的文本及其前缀查表，重叠的关键字（如 "United Statesgwt" 中的 SG、"地区10" 中的 地区1）都会被识别；
+    其余分支（如 United\\s*States）数量很少，按地区单独 search。
+    """
+    
+    def __init__(self, regions: Dict[str, str]):
+        """
+        Args:
+            regions: 地区名称 -> 正则表达式模式
+        """
+        self.region_names = list(regions)
+        self.region_order = {region: index for index, region in enumerate(self.region_names)}
+        # 纯文本关键字 -> 地区列表，分为忽略大小写和区分大小写两组
+        self.keywords = {'i': {}, '': {}}
+        # (地区, 非纯文本分支组成的正则)
+        self.region_patterns = []
+        for region in self.region_names:
+            flags, branches = split_region_pattern(regions[region])
+            others = []
+            for branch in branches:
+                if set(flags) <= {'i', 'u'} and LITERAL_PATTERN.fullmatch(branch):
+                    keyword = re.sub(r'\\(.)', r'\1', branch)
+                    table = self.keywords['i' if 'i' in flags else '']
+                    key = keyword.lower() if 'i' in flags else keyword
+                    if region not in table.setdefault(key, []):
+                        table[key].append(region)
+                else:
+                    others.append(branch)
+            if others:
+                body = '|'.join(others)
+                self.region_patterns.append((region, re.compile(f'(?{flags})(?:{body})' if flags else body)))
+        
+        # 零宽前瞻：在每个位置匹配该位置开始的最长关键字，finditer 逐个位置前进，不会跳过重叠的关键字
+        self.keyword_patterns = []
+        if self.keywords['i']:
+            trie = build_keyword_pattern(list(self.keywords['i']))
+            self.keyword_patterns.append(('i', re.compile(f'(?=((?i:{trie})))')))
+        if self.keywords['']:
+            trie = build_keyword_pattern(list(self.keywords['']))
+            self.keyword_patterns.append(('', re.compile(f'(?=({trie}))')))
+    
+    def match_keywords(self, flags: str, text: str) -> List[str]:
+        """
+        返回以 text 开头的所有关键字对应的地区（text 为某个位置上匹配到的最长关键字）
+        
+        Args:
+            flags: 'i' 表示忽略大小写的关键字组，'' 表示区分大小写的关键字组
+            text: 匹配到的文本
+        """
+        table = self.keywords[flags]
+        regions = []
+        for length in range(len(text), 0, -1):
+            prefix = text[:length]
+            matched = table.get(prefix.lower() if flags else prefix)
+            if matched is None and flags and length == len(text):
+                # 少数字符的大小写折叠与 lower() 不一致，逐个比较
+                matched = next((value for keyword, value in table.items()
+                                if re.fullmatch(re.escape(keyword), text, re.IGNORECASE)), None)
+            if matched:
+                regions.extend(matched)
+        return regions
+    
+    def classify(self, name: str) -> List[str]:
+        """
+        Args:
+            name: 节点名称
+            
+        Returns:
+            List[str]: 节点所属的地区名称（按首次出现的位置，不重复）
+        """
+        # 地区 -> 首次出现的位置
+        found = {}
+        for flags, pattern in self.keyword_patterns:
+            for match in pattern.finditer(name):
+                position = match.start()
+                for region in self.match_keywords(flags, match.group(1)):
+                    if region not in found or position < found[region]:
+                        found[region] = position
+        for region, pattern in self.region_patterns:
+            match = pattern.search(name)
+            if match is not None and (region not in found or match.start() < found[region]):
+                found[region] = match.start()
+        return sorted(found, key=lambda region: (found[region], self.region_order[region]))
+
+
+def parse_source(name: str, yml_file: str, json_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    解析并验证单个订阅源（在进程池的工作进程中执行，不使用日志器，结果由主进程记录）
+    
+    Args:
+        name: 源名称
+        yml_file: YAML文件路径
+        json_file: 中间JSON文件路径，为None时不写出
+        
+    Returns:
+        Dict: {"name", "proxies": 有效代理列表, "total": 源中的代理总数,
+               "error": 错误信息或None, "json_error": 中间文件写出错误或None}
+    """
+    result = {"name": name, "proxies": [], "total": 0, "error": None, "json_error": None}
+    try:
+        data = load_yaml_file(yml_file)
+    except yaml.YAMLError as e:
+        result["error"] = f"YAML解析错误: {e}"
+        return result
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    
+    if not isinstance(data, dict) or not isinstance(data.get('proxies'), list):
+        result["error"] = "缺少 proxies 字段"
+        return result
+    
+    result["total"] = len(data['proxies'])
+    result["proxies"] = [proxy for proxy in data['proxies'] if is_valid_proxy(proxy)]
+    
+    if json_file:
+        try:
+            write_json_file(data, json_file)
+        except OSError as e:
+            # 中间文件只用于调试，写出失败不影响合并
+            result["json_error"] = str(e)
+    return result
+
 
 class YamlToJsonMerger:
     """YAML配置文件合并工具类"""
     
-    def __init__(self, work_dir: str = None):
+    def __init__(self, work_dir: str = None, keep_json: bool = False, workers: Optional[int] = None,
+                 use_cache: bool = True, dedup: str = 'first', output_format: str = 'json'):
         """
         初始化合并工具
         
         Args:
             work_dir: 工作目录，默认为当前脚本所在目录
+            keep_json: 是否将每个源文件的解析结果另存为JSON文件（调试用）
+            workers: 解析订阅的进程数，默认为CPU核数
+            use_cache: 是否使用增量构建缓存
+            dedup: 重复节点（连接身份相同）的保留策略，见 DEDUP_POLICIES
+            output_format: 输出格式，json、json-compact 或 yaml，见 config_writer.OUTPUT_FORMATS
         """
         self.work_dir = Path(work_dir) if work_dir else Path(__file__).parent
+        self.keep_json = keep_json
+        self.workers = workers or os.cpu_count() or 1
+        self.use_cache = use_cache
+        self.set_dedup_policy(dedup)
+        # 订阅下载配置：是否下载配置了 url 的订阅源，以及传给 SubscriptionFetcher 的参数
+        self.fetch_enabled = True
+        self.fetch_options = {}
+        # 节点测速配置，probe_policy 为None时不测速，见 set_probe_options
+        self.probe_policy = None
+        self.probe_concurrency = DEFAULT_CONCURRENCY
+        self.probe_timeout = DEFAULT_TIMEOUT
+        self.probe_tls = False
+        # 是否在生成前优化模板规则，见 optimize_template_rules
+        self.optimize_rules = False
+        # 超大分组拆分配置，shard_limit 为None时不拆分，见 set_shard_options
+        self.shard_limit = None
+        self.shard_strategy = 'region'
+        self.shard_parent_type = 'url-test'
+        # 代理名称 -> 订阅源名称，由阶段二填充，按订阅源拆分时使用
+        self.proxy_sources = {}
+        # 运行指标的输出文件，metrics_file 为None时不写出JSON指标，prometheus_file 为None时不写出Prometheus文本文件
+        self.metrics_file = self.work_dir / METRICS_NAME
+        self.prometheus_file = None
+        self.cache_dir = self.work_dir / CACHE_DIR_NAME
         self.setup_logging()
         
         # 配置文件路径
-        self.yml2json_script = self.work_dir / "yml2json.py"
         self.template_file = self.work_dir / "all-in-one-template.json"
         
         # 生成带日期的输出文件名：all-in-one-yyyymmdd.json
         current_date = datetime.now().strftime("%Y%m%d")
         self.output_file = self.work_dir / f"all-in-one-{current_date}.json"
+        self.set_output_format(output_format)
         
-        # 源文件配置
+        # 源文件配置（按顺序合并，json 仅在 keep_json 时写出）。
+        # 工作目录中存在 merger-sources.json 时使用其中的源列表，见 load_sources_config
         self.source_files = {
             "glados": {
                 "yml": self.work_dir / "glados.yml",
@@ -62,67 +417,142 @@ class YamlToJsonMerger:
             }
         }
         
-        # AI-Proxy分组的地区匹配配置（支持正则表达式扩展）
-        self.ai_proxy_patterns = [
+        # 源名称 -> 已验证的有效代理列表，由阶段一填充，阶段二直接使用
+        self.source_proxies = {}
+        # 源名称 -> 源文件内容摘要，由 compute_source_digests 填充
+        self.source_digests = {}
+        # 上一次构建的缓存清单
+        self.manifest = {}
+        
+        # 地区匹配配置（支持正则表达式扩展）：地区名称 -> 模式
+        self.regions = {
             # 美国相关
-            r'(?i).*(美国|US|USA|United\s*States).*',
-            # 英国相关  
-            r'(?i).*(英国|UK|United\s*Kingdom|Britain).*',
+            "US": r'(?i).*(美国|US|USA|United\s*States).*',
+            # 英国相关
+            "UK": r'(?i).*(英国|UK|United\s*Kingdom|Britain).*',
             # 加拿大相关
-            r'(?i).*(加拿大|CA|Canada).*',
+            "CA": r'(?i).*(加拿大|CA|Canada).*',
             # 日本相关
-            r'(?i).*(日本|JP|Japan).*',
+            "JP": r'(?i).*(日本|JP|Japan).*',
             # 新加坡相关
-            r'(?i).*(新加坡|SG|Singapore).*',
+            "SG": r'(?i).*(新加坡|SG|Singapore).*',
             # 台湾相关
-            r'(?i).*(台湾|TW|Taiwan).*',
+            "TW": r'(?i).*(台湾|TW|Taiwan).*',
             # 越南相关
-            r'(?i).*(越南|VN|Vietnam).*'
-        ]
+            "VN": r'(?i).*(越南|VN|Vietnam).*'
+        }
+        # 地区分组：模板分组名称 -> 地区名称列表。模板中与地区同名的分组（如 "US"）会自动填充该地区的节点
+        self.region_groups = {
+            "AI-Proxy": list(self.regions)
+        }
+        
+        # 使用的订阅源配置文件，未使用时为None
+        self.sources_config = None
+        sources_config = self.work_dir / SOURCES_CONFIG_NAME
+        if sources_config.exists():
+            self.load_sources_config(sources_config)
         
-        # 统计信息
+        self.reset_stats()
+    
+    def reset_stats(self):
+        """重置统计信息（同一实例多次执行 run 时，每次从零开始统计）"""
         self.stats = {
             "total_proxies": 0,
+            "duplicate_proxies": 0,
+            "unreachable_proxies": 0,
             "ai_proxy_count": 0,
+            "region_group_counts": {},
             "auto_proxy_count": 0,
+            "sharded_groups": {},
+            "rules_removed": 0,
+            "rule_conflicts": 0,
+            "cached_sources": 0,
+            "fetch": {},
             "conversion_errors": [],
             "merge_errors": []
         }
+        self.metrics = RunMetrics()
     
     def setup_logging(self):
-        """设置日志配置"""
-        # 创建日志格式器
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        """
+        设置日志配置
         
-        # 文件处理器（UTF-8编码）
-        file_handler = logging.FileHandler(self.work_dir / 'merger.log', encoding='utf-8')
-        file_handler.setFormatter(formatter)
+        每个工作目录使用独立的日志器，只带写入该目录 merger.log 的文件处理器，
+        同一进程中的多个实例（不同工作目录）不会把日志写进彼此的日志文件；
+        日志器传递到模块日志器，由其唯一的控制台处理器输出。
+        同一工作目录多次创建实例时复用同一日志器，不重复添加处理器（否则每条日志会被写出多次）。
+        """
+        formatter = logging.Formatter(LOG_FORMAT)
         
-        # 控制台处理器（使用系统默认编码，避免特殊字符）
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(formatter)
+        # 控制台处理器（使用系统默认编码，避免特殊字符），所有实例共用
+        module_logger = logging.getLogger(__name__)
+        module_logger.setLevel(logging.INFO)
+        if not any(type(handler) is logging.StreamHandler for handler in module_logger.handlers):
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(formatter)
+            module_logger.addHandler(console_handler)
         
-        # 配置根日志器
-        self.logger = logging.getLogger(__name__)
+        # 日志器名称按点分层级，转义路径中的点，避免 x 和 x.bak 等工作目录的日志器成为父子关系
+        log_file = os.path.abspath(self.work_dir / 'merger.log')
+        escaped = log_file.replace('%', '%25').replace('.', '%2E')
+        self.logger = logging.getLogger(f"{__name__}.{escaped}")
         self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        
+        # 文件处理器（UTF-8编码）
+        if not any(isinstance(handler, logging.FileHandler) and handler.baseFilename == log_file
+                   for handler in self.logger.handlers):
+            file_handler = logging.FileHandler(log_file, encoding='utf-8')
+            file_handler.setFormatter(formatter)
+            self.logger.addHandler(file_handler)
     
-    def add_ai_proxy_pattern(self, pattern: str):
+    @property
+    def ai_proxy_patterns(self) -> List[str]:
+        """AI-Proxy分组使用的地区匹配模式列表"""
+        return [self.regions[region] for region in self.region_groups.get("AI-Proxy", [])]
+    
+    def add_region(self, region: str, pattern: str, groups: Optional[List[str]] = None):
         """
-        添加新的AI-Proxy地区匹配模式
+        添加或替换地区匹配模式
         
         Args:
+            region: 地区名称（模板中同名的分组会自动填充该地区的节点）
             pattern: 正则表达式模式字符串
+            groups: 同时加入的其他分组名称，如 ["AI-Proxy"]
         """
         try:
-            # 验证正则表达式的有效性
-            re.compile(pattern)
-            self.ai_proxy_patterns.append(pattern)
-            self.logger.info(f"已添加新的AI-Proxy匹配模式: {pattern}")
+            split_region_pattern(pattern)
         except re.error as e:
             self.logger.error(f"无效的正则表达式模式 '{pattern}': {e}")
             raise ValueError(f"无效的正则表达式模式: {e}")
+        self.regions[region] = pattern
+        for group in groups or []:
+            members = self.region_groups.setdefault(group, [])
+            if region not in members:
+                members.append(region)
+        self.logger.info(f"已添加地区匹配模式 {region}: {pattern}")
+    
+    def set_region_groups(self, region_groups: Dict[str, List[str]]):
+        """
+        设置地区分组（会覆盖同名分组的配置）
+        
+        Args:
+            region_groups: 模板分组名称 -> 地区名称列表
+        """
+        for group, regions in region_groups.items():
+            unknown = [region for region in regions if region not in self.regions]
+            if unknown:
+                raise ValueError(f"分组 {group} 引用了未定义的地区: {unknown}")
+            self.region_groups[group] = list(regions)
+        self.logger.info(f"已设置地区分组: {', '.join(region_groups)}")
+    
+    def add_ai_proxy_pattern(self, pattern: str):
+        """
+        添加新的AI-Proxy地区匹配模式
+        
+        Args:
+            pattern: 正则表达式模式字符串
+        """
+        self.add_region(pattern, pattern, ["AI-Proxy"])
     
     def set_ai_proxy_patterns(self, patterns: List[str]):
         """
@@ -134,14 +564,231 @@ class YamlToJsonMerger:
         valid_patterns = []
         for pattern in patterns:
             try:
-                re.compile(pattern)
+                split_region_pattern(pattern)
                 valid_patterns.append(pattern)
             except re.error as e:
                 self.logger.error(f"跳过无效的正则表达式模式 '{pattern}': {e}")
         
-        self.ai_proxy_patterns = valid_patterns
+        # 已有地区使用相同模式时直接引用该地区，否则以模式本身作为地区名称
+        by_pattern = {pattern: region for region, pattern in self.regions.items()}
+        members = []
+        for pattern in valid_patterns:
+            region = by_pattern.get(pattern)
+            if region is None:
+                region = self.regions[pattern] = pattern
+            members.append(region)
+        self.region_groups["AI-Proxy"] = members
         self.logger.info(f"已设置AI-Proxy匹配模式，共{len(valid_patterns)}个模式")
     
+    def set_dedup_policy(self, policy: str):
+        """
+        设置重复节点的保留策略
+        
+        Args:
+            policy: first（保留最先出现的）、last（保留最后出现的）或 off（不去重）
+        """
+        if policy not in DEDUP_POLICIES:
+            raise ValueError(f"无效的去重策略: {policy}，可选: {', '.join(DEDUP_POLICIES)}")
+        self.dedup = policy
+    
+    def set_output_format(self, output_format: str):
+        """
+        设置输出格式，输出文件的扩展名随之改变（yaml 格式为 .yaml）
+        
+        Args:
+            output_format: json（indent=2）、json-compact（紧凑JSON）或 yaml（Clash原生YAML）
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"无效的输出格式: {output_format}，可选: {', '.join(OUTPUT_FORMATS)}")
+        self.output_format = output_format
+        self.output_file = self.output_file.with_suffix(OUTPUT_FORMATS[output_format])
+    
+    def set_probe_options(self, policy: Optional[str] = 'demote', concurrency: Optional[int] = None,
+                          timeout: Optional[float] = None, tls: Optional[bool] = None):
+        """
+        设置节点测速（阶段二之后并发测量TCP连接延迟，按延迟排序）
+        
+        Args:
+            policy: 不可达节点的处理方式，drop（移除）或 demote（排到最后）；为None时关闭测速
+            concurrency: 最大并发连接数
+            timeout: 单次连接超时秒数
+            tls: 是否对使用TLS的节点同时测量TLS握手
+        """
+        if policy is not None and policy not in PROBE_POLICIES:
+            raise ValueError(f"无效的测速策略: {policy}，可选: {', '.join(PROBE_POLICIES)}")
+        self.probe_policy = policy
+        if concurrency is not None:
+            self.probe_concurrency = int(concurrency)
+        if timeout is not None:
+            self.probe_timeout = float(timeout)
+        if tls is not None:
+            self.probe_tls = bool(tls)
+    
+    def set_shard_options(self, limit: Optional[int], strategy: Optional[str] = None,
+                          parent_type: Optional[str] = None):
+        """
+        设置超大分组拆分：成员超过 limit 的分组拆分为不超过 limit 的 url-test 子分组，原分组改为在子分组之间选择
+        
+        Args:
+            limit: 每个分组的最大成员数，为None或0时不拆分
+            strategy: 拆分方式，region（按地区）或 provider（按订阅源）
+            parent_type: 原分组的新类型，url-test（选择延迟最低的子分组）或 fallback（按顺序选择第一个可用的子分组）
+        """
+        if strategy is not None and strategy not in SHARD_STRATEGIES:
+            raise ValueError(f"无效的拆分方式: {strategy}，可选: {', '.join(SHARD_STRATEGIES)}")
+        if parent_type is not None and parent_type not in SHARD_PARENT_TYPES:
+            raise ValueError(f"无效的父分组类型: {parent_type}，可选: {', '.join(SHARD_PARENT_TYPES)}")
+        if limit is not None and int(limit) < 0:
+            raise ValueError(f"分组大小上限不能为负数: {limit}")
+        self.shard_limit = int(limit) if limit else None
+        if strategy is not None:
+            self.shard_strategy = strategy
+        if parent_type is not None:
+            self.shard_parent_type = parent_type
+    
+    def set_metrics_options(self, metrics_file: Any = None, prometheus_file: Any = None,
+                            base_dir: Optional[Path] = None):
+        """
+        设置运行指标的输出文件（见 merger_metrics.py）
+        
+        Args:
+            metrics_file: JSON指标文件路径，为None时保持不变，为False或空字符串时不写出
+            prometheus_file: Prometheus文本文件路径（如 node_exporter textfile collector 目录下的 clash_merger.prom），
+                             为None时保持不变，为False或空字符串时不写出
+            base_dir: 相对路径的基准目录，默认为工作目录
+        """
+        base_dir = Path(base_dir) if base_dir else self.work_dir
+        if metrics_file is not None:
+            self.metrics_file = base_dir / metrics_file if metrics_file else None
+        if prometheus_file is not None:
+            self.prometheus_file = base_dir / prometheus_file if prometheus_file else None
+    
+    def set_sources(self, entries: List[Any], base_dir: Optional[Path] = None):
+        """
+        设置订阅源列表，合并时按列表顺序排列代理
+        
+        Args:
+            entries: 源列表。字符串为文件路径或glob模式（按文件名排序展开，源名称为文件名去掉扩展名），
+                     字典为 {"name": 源名称, "path": 文件路径, "url": 订阅地址（可选）}，
+                     有 url 时每次运行先下载到 path（默认为 源名称.yml）
+            base_dir: 相对路径的基准目录，默认为工作目录
+        """
+        base_dir = Path(base_dir) if base_dir else self.work_dir
+        source_files = {}
+        
+        def add_source(name, path, url=None):
+            if name in source_files:
+                raise ValueError(f"订阅源名称重复: {name}（{source_files[name]['yml']} 和 {path}）")
+            source_files[name] = {"yml": path, "json": path.with_suffix('.json')}
+            if url:
+                source_files[name]["url"] = url
+        
+        for entry in entries:
+            if isinstance(entry, dict):
+                if not entry.get('name') or not (entry.get('path') or entry.get('url')):
+                    raise ValueError(f"订阅源配置缺少 name，或 path 和 url 都没有指定: {entry}")
+                add_source(entry['name'], base_dir / (entry.get('path') or f"{entry['name']}.yml"), entry.get('url'))
+            elif isinstance(entry, str):
+                if glob.has_magic(entry):
+                    matches = sorted(glob.glob(str(base_dir / entry)))
+                    if not matches:
+                        self.logger.warning(f"glob模式没有匹配到任何文件: {entry}")
+                    for match in matches:
+                        add_source(Path(match).stem, Path(match))
+                else:
+                    add_source(Path(entry).stem, base_dir / entry)
+            else:
+                raise ValueError(f"无法识别的订阅源配置: {entry!r}")
+        
+        self.source_files = source_files
+        self.logger.info(f"已设置订阅源，共{len(source_files)}个")
+    
+    def load_sources_config(self, config_file: Path):
+        """
+        从JSON配置文件加载订阅源列表，相对路径相对于配置文件所在目录
+        
+        配置文件示例：
+            {"sources": [{"name": "glados", "path": "glados.yml"}, "subscriptions/*.yml"], "workers": 8, "dedup": "first"}
+        
+        Args:
+            config_file: 配置文件路径
+        """
+        config_file = Path(config_file)
+        self.sources_config = config_file
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"订阅源配置文件格式错误 {config_file}: {e}")
+        
+        if not isinstance(config, dict) or not isinstance(config.get('sources'), list):
+            raise ValueError(f"订阅源配置文件 {config_file} 缺少 sources 列表")
+        if config.get('workers'):
+            self.workers = int(config['workers'])
+        if config.get('dedup'):
+            self.set_dedup_policy(config['dedup'])
+        if isinstance(config.get('fetch'), dict):
+            self.fetch_options = dict(config['fetch'])
+        if config.get('output_format'):
+            self.set_output_format(config['output_format'])
+        if 'optimize_rules' in config:
+            self.optimize_rules = bool(config['optimize_rules'])
+        if isinstance(config.get('shard'), dict):
+            shard = config['shard']
+            self.set_shard_options(shard.get('limit'), shard.get('by'), shard.get('parent_type'))
+        if isinstance(config.get('metrics'), dict):
+            metrics = config['metrics']
+            self.set_metrics_options(metrics.get('file'), metrics.get('prometheus'), config_file.parent)
+        if config.get('probe'):
+            probe = config['probe'] if isinstance(config['probe'], dict) else {}
+            self.set_probe_options(probe.get('policy', 'demote'), probe.get('concurrency'),
+                                   probe.get('timeout'), probe.get('tls'))
+        for region, pattern in (config.get('regions') or {}).items():
+            self.add_region(region, pattern)
+        if config.get('region_groups'):
+            self.set_region_groups(config['region_groups'])
+        self.logger.info(f"加载订阅源配置: {config_file}")
+        self.set_sources(config['sources'], config_file.parent)
+    
+    def fetch_subscriptions(self) -> Dict[str, int]:
+        """
+        阶段零：并发下载配置了 url 的订阅源（见 subscription_fetcher.py）
+        
+        服务器返回304或内容与已有文件相同时不改写文件，后续的增量构建可以直接跳过；
+        下载失败时保留已有文件继续合并。
+        
+        Returns:
+            Dict[str, int]: 各结果（updated/unchanged/failed）的数量
+        """
+        subscriptions = [(name, info["url"], info["yml"]) for name, info in self.source_files.items() if info.get("url")]
+        counts = {"updated": 0, "unchanged": 0, "failed": 0}
+        if not subscriptions:
+            return counts
+        
+        self.logger.info(f"=== 阶段零：开始下载 {len(subscriptions)} 个订阅 ===")
+        start = datetime.now()
+        try:
+            fetcher = SubscriptionFetcher(self.cache_dir, logger=self.logger, **self.fetch_options)
+        except TypeError as e:
+            raise ValueError(f"订阅下载配置无效: {e}")
+        for result in fetcher.fetch_all(subscriptions):
+            counts[result["status"]] += 1
+            name = result["name"]
+            if result["status"] == "updated":
+                self.logger.info(f"[OK] {name}: 已更新（{result['bytes']} 字节）")
+            elif result["status"] == "unchanged":
+                self.logger.info(f"[OK] {name}: 未变化")
+            elif self.source_files[name]["yml"].exists():
+                self.logger.warning(f"[WARN] {name}: 下载失败（{result['error']}），使用已有文件")
+            else:
+                self.logger.error(f"[FAIL] {name}: 下载失败（{result['error']}）")
+        
+        elapsed = (datetime.now() - start).total_seconds()
+        self.stats["fetch"] = counts
+        self.logger.info(f"订阅下载完成，耗时 {elapsed:.1f} 秒：更新 {counts['updated']} 个，"
+                         f"未变化 {counts['unchanged']} 个，失败 {counts['failed']} 个")
+        return counts
+    
     def validate_prerequisites(self) -> bool:
         """
         验证前置条件
@@ -151,20 +798,21 @@ class YamlToJsonMerger:
         """
         self.logger.info("开始验证前置条件...")
         
-        # 检查yml2json.py脚本是否存在
-        if not self.yml2json_script.exists():
-            self.logger.error(f"yml2json.py脚本不存在: {self.yml2json_script}")
-            return False
-        
         # 检查模板文件是否存在
         if not self.template_file.exists():
             self.logger.error(f"模板文件不存在: {self.template_file}")
             return False
         
-        # 检查源YAML文件是否存在
+        if not self.source_files:
+            self.logger.error("没有配置任何订阅源")
+            return False
+        
+        # 检查源YAML文件是否存在，同时记录文件大小
         missing_files = []
         for name, files in self.source_files.items():
-            if not files["yml"].exists():
+            try:
+                self.metrics.record_source(name, bytes=files["yml"].stat().st_size)
+            except OSError:
                 missing_files.append(str(files["yml"]))
         
         if missing_files:
@@ -174,191 +822,388 @@ class YamlToJsonMerger:
         self.logger.info("前置条件验证通过")
         return True
     
-    def convert_yaml_to_json(self) -> bool:
+    def load_cache_manifest(self):
+        """加载上一次构建的缓存清单，不存在、损坏或版本不符时视为空"""
+        try:
+            with open(self.cache_dir / CACHE_MANIFEST_NAME, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        self.manifest = manifest if manifest.get('version') == CACHE_VERSION else {}
+    
+    def save_cache_manifest(self):
+        """原子地写出缓存清单，并删除不再被引用的代理缓存文件"""
+        self.cache_dir.mkdir(exist_ok=True)
+        manifest_file = self.cache_dir / CACHE_MANIFEST_NAME
+        tmp_file = manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, manifest_file)
+        
+        # 只清理以内容摘要命名的代理缓存文件，缓存目录中的其他文件（如下载缓存清单）保持不变
+        referenced = {f"{entry['sha256']}.json" for entry in self.manifest.get('sources', {}).values()}
+        for cache_file in self.cache_dir.glob('*.json'):
+            if re.fullmatch(r'[0-9a-f]{64}', cache_file.stem) and cache_file.name not in referenced:
+                cache_file.unlink()
+    
+    def compute_source_digests(self):
+        """
+        计算所有源文件的内容摘要。(mtime, 大小) 与上次构建相同时直接复用上次的摘要，不重新读取文件。
+        """
+        previous = self.manifest.get('sources', {})
+        for name, files in self.source_files.items():
+            st = files["yml"].stat()
+            entry = previous.get(name)
+            if (entry and entry.get('path') == str(files["yml"]) and entry.get('mtime_ns') == st.st_mtime_ns
+                    and entry.get('size') == st.st_size):
+                self.source_digests[name] = entry['sha256']
+            else:
+                self.source_digests[name] = file_digest(files["yml"])
+    
+    def compute_build_key(self) -> str:
         """
-        阶段一：将所有YAML文件转换为JSON格式
+        计算本次构建的输入摘要：订阅源（顺序、名称和内容）、模板内容、地区匹配模式、地区分组和去重策略
         
         Returns:
-            bool: 转换是否成功
+            str: SHA-256摘要
+        """
+        inputs = {
+            'version': CACHE_VERSION,
+            'sources': [[name, self.source_digests[name]] for name in self.source_files],
+            'template': file_digest(self.template_file),
+            'regions': self.regions,
+            'region_groups': self.region_groups,
+            'dedup': self.dedup,
+            'output_format': self.output_format,
+            'probe': [self.probe_policy, self.probe_tls],
+            'optimize_rules': self.optimize_rules,
+            'shard': [self.shard_limit, self.shard_strategy, self.shard_parent_type],
+        }
+        return hashlib.sha256(json.dumps(inputs, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def is_up_to_date(self, build_key: str) -> bool:
         """
-        self.logger.info("=== 阶段一：开始YAML到JSON转换 ===")
+        判断上一次生成的输出是否仍然有效：输入摘要相同，且输出文件存在且未被修改
         
-        success_count = 0
-        total_count = len(self.source_files)
+        Args:
+            build_key: compute_build_key 的结果
+        """
+        output = self.manifest.get('output') or {}
+        if self.manifest.get('build_key') != build_key or output.get('path') != str(self.output_file):
+            return False
+        try:
+            st = self.output_file.stat()
+        except OSError:
+            return False
+        return output.get('mtime_ns') == st.st_mtime_ns and output.get('size') == st.st_size
+    
+    def load_cached_proxies(self, name: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取未变化的源在上一次构建时缓存的有效代理列表
         
-        for name, files in self.source_files.items():
-            yml_file = files["yml"]
-            json_file = files["json"]
-            
-            self.logger.info(f"转换 {name}: {yml_file.name} -> {json_file.name}")
+        Args:
+            name: 源名称
             
-            try:
-                # 调用yml2json.py脚本进行转换
-                cmd = [sys.executable, str(self.yml2json_script), str(yml_file), str(json_file)]
-                
-                # 使用二进制模式避免编码问题，然后手动解码
-                result = subprocess.run(cmd, capture_output=True)
-                
-                # 手动处理输出编码，避免线程编码错误
-                if result.stdout:
-                    try:
-                        stdout = result.stdout.decode('utf-8')
-                    except UnicodeDecodeError:
-                        stdout = result.stdout.decode('gbk', errors='replace')
-                else:
-                    stdout = ''
-                
-                if result.stderr:
-                    try:
-                        stderr = result.stderr.decode('utf-8')
-                    except UnicodeDecodeError:
-                        stderr = result.stderr.decode('gbk', errors='replace')
-                else:
-                    stderr = ''
-                
-                # 创建一个模拟的result对象
-                class ResultWrapper:
-                    def __init__(self, returncode, stdout, stderr):
-                        self.returncode = returncode
-                        self.stdout = stdout
-                        self.stderr = stderr
-                
-                result = ResultWrapper(result.returncode, stdout, stderr)
-                
-                if result.returncode == 0:
-                    self.logger.info(f"[OK] {name} 转换成功")
-                    
-                    # 验证转换后的JSON文件
-                    if self.validate_json_file(json_file):
-                        success_count += 1
-                    else:
-                        self.stats["conversion_errors"].append(f"{name}: JSON格式验证失败")
-                else:
-                    error_msg = f"{name}: {result.stderr}"
-                    self.logger.error(f"[FAIL] {name} 转换失败: {error_msg}")
-                    self.stats["conversion_errors"].append(error_msg)
-                    
-            except Exception as e:
-                error_msg = f"{name}: {str(e)}"
-                self.logger.error(f"[ERROR] {name} 转换异常: {error_msg}")
-                self.stats["conversion_errors"].append(error_msg)
+        Returns:
+            Optional[List[Dict]]: 缓存的代理列表，没有可用缓存时返回None
+        """
+        entry = self.manifest.get('sources', {}).get(name)
+        if not entry or entry.get('sha256') != self.source_digests.get(name):
+            return None
+        try:
+            with open(self.cache_dir / f"{entry['sha256']}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_cached_proxies(self, name: str, proxies: List[Dict[str, Any]]):
+        """
+        以紧凑JSON缓存新解析源的有效代理列表（阶段二重命名之前的原始内容），文件名为源文件内容摘要
         
-        success = success_count == total_count
-        self.logger.info(f"YAML转换完成: {success_count}/{total_count} 成功")
-        return success
+        Args:
+            name: 源名称
+            proxies: 有效代理列表
+        """
+        digest = self.source_digests.get(name)
+        if not digest:
+            return
+        self.cache_dir.mkdir(exist_ok=True)
+        cache_file = self.cache_dir / f"{digest}.json"
+        tmp_file = cache_file.with_suffix('.tmp')
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(proxies, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            # 缓存只用于加速，写出失败不影响本次结果
+            self.logger.warning(f"写出 {name} 的代理缓存失败: {e}")
     
-    def validate_json_file(self, json_file: Path) -> bool:
+    def update_cache(self, build_key: str):
         """
-        验证JSON文件的有效性
+        生成成功后更新缓存清单：记录各源摘要、输出文件签名和统计信息
         
         Args:
-            json_file: JSON文件路径
-            
+            build_key: compute_build_key 的结果
+        """
+        sources = {}
+        for name, files in self.source_files.items():
+            digest = self.source_digests[name]
+            if not (self.cache_dir / f"{digest}.json").exists():
+                continue
+            st = files["yml"].stat()
+            sources[name] = {'path': str(files["yml"]), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size,
+                             'sha256': digest}
+        
+        st = self.output_file.stat()
+        self.manifest = {
+            'version': CACHE_VERSION,
+            'build_key': build_key,
+            'sources': sources,
+            'output': {'path': str(self.output_file), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size},
+            'stats': {key: self.stats[key]
+                      for key in ('total_proxies', 'duplicate_proxies', 'unreachable_proxies', 'ai_proxy_count',
+                                  'region_group_counts', 'auto_proxy_count')},
+        }
+        self.save_cache_manifest()
+    
+    def convert_yaml_to_json(self) -> bool:
+        """
+        阶段一：在进程池中并行解析和验证所有YAML文件
+        
+        每个源文件只解析一次，有效代理列表保存在 self.source_proxies 中供阶段二使用；
+        结果按配置顺序记录，与各源完成的先后无关。keep_json 为True时额外写出中间JSON文件，便于调试。
+        
         Returns:
-            bool: 验证是否通过
+            bool: 转换是否成功
         """
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # 检查必要的字段
-            if 'proxies' not in data:
-                self.logger.warning(f"{json_file.name} 缺少 proxies 字段")
-                return False
-            
-            proxy_count = len(data['proxies'])
-            self.logger.info(f"{json_file.name} 包含 {proxy_count} 个代理节点")
-            
-            return True
+        self.logger.info("=== 阶段一：开始解析YAML文件 ===")
+        self.logger.info(f"YAML解析后端: {yaml_backend_description()}")
+        
+        total_count = len(self.source_files)
+        cached = {}
+        if self.use_cache and not self.keep_json:
+            # 内容未变化的源直接使用缓存的代理列表，不重新解析
+            for name in self.source_files:
+                proxies = self.load_cached_proxies(name)
+                if proxies is not None:
+                    cached[name] = proxies
+        jobs = [(name, str(files["yml"]), str(files["json"]) if self.keep_json else None)
+                for name, files in self.source_files.items() if name not in cached]
+        workers = max(1, min(self.workers, len(jobs)))
+        self.logger.info(f"解析 {len(jobs)} 个订阅源（{len(cached)} 个未变化，使用缓存），使用 {workers} 个进程")
+        self.stats["cached_sources"] = len(cached)
+        
+        if not jobs:
+            results = []
+        elif workers == 1:
+            results = [parse_source(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(parse_source, *job) for job in jobs]
+                results = []
+                for (name, _yml, _json), future in zip(jobs, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        # 工作进程异常退出等情况
+                        results.append({"name": name, "proxies": [], "total": 0,
+                                        "error": f"解析进程异常: {e}", "json_error": None})
+        
+        success_count = len(cached)
+        self.source_proxies.update(cached)
+        for name, proxies in cached.items():
+            self.metrics.record_source(name, valid=len(proxies), cached=True, ok=True)
+        for result in results:
+            name = result["name"]
+            if result["error"]:
+                error_msg = f"{name}: {result['error']}"
+                self.logger.error(f"[FAIL] {name} 解析失败: {result['error']}")
+                self.stats["conversion_errors"].append(error_msg)
+                self.metrics.record_source(name, cached=False, ok=False)
+                continue
             
-        except json.JSONDecodeError as e:
-            self.logger.error(f"{json_file.name} JSON格式错误: {e}")
-            return False
-        except Exception as e:
-            self.logger.error(f"验证 {json_file.name} 时发生错误: {e}")
-            return False
+            self.source_proxies[name] = result["proxies"]
+            self.metrics.record_source(name, proxies=result["total"], valid=len(result["proxies"]),
+                                       cached=False, ok=True)
+            success_count += 1
+            if self.use_cache:
+                self.save_cached_proxies(name, result["proxies"])
+            self.logger.info(f"[OK] {name} 包含 {result['total']} 个代理节点，有效 {len(result['proxies'])} 个")
+            if self.keep_json:
+                json_name = self.source_files[name]["json"].name
+                if result["json_error"]:
+                    self.logger.warning(f"写出中间JSON文件 {json_name} 失败: {result['json_error']}")
+                else:
+                    self.logger.info(f"已写出中间JSON文件: {json_name}")
+        
+        success = success_count == total_count
+        self.logger.info(f"YAML解析完成: {success_count}/{total_count} 成功")
+        return success
     
     def extract_proxies(self) -> List[Dict[str, Any]]:
         """
-        阶段二：从转换后的JSON文件中提取所有代理配置
+        阶段二：从阶段一的解析结果中提取所有代理配置，去除重复节点并保证名称唯一
         
         Returns:
             List[Dict]: 所有代理配置的列表
         """
         self.logger.info("=== 阶段二：开始提取代理配置 ===")
         
-        all_proxies = []
-        proxy_names = set()  # 用于检测重复名称
-        
-        for name, files in self.source_files.items():
-            json_file = files["json"]
-            
-            if not json_file.exists():
-                self.logger.error(f"JSON文件不存在: {json_file}")
+        # (源名称, 代理) 按配置顺序排列
+        entries = []
+        for name in self.source_files:
+            proxies = self.source_proxies.get(name)
+            if proxies is None:
+                self.logger.error(f"{name} 没有解析结果")
                 continue
-                
-            try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                proxies = data.get('proxies', [])
-                self.logger.info(f"从 {name} 提取 {len(proxies)} 个代理")
-                
-                # 处理代理配置
-                for proxy in proxies:
-                    proxy_name = proxy.get('name', '')
-                    
-                    # 跳过无效的代理配置
-                    if not proxy_name or not self.is_valid_proxy(proxy):
-                        continue
-                    
-                    # 处理重复名称
-                    if proxy_name in proxy_names:
-                        original_name = proxy_name
-                        counter = 1
-                        while proxy_name in proxy_names:
-                            proxy_name = f"{original_name}_dup_{counter}"
-                            counter += 1
-                        proxy['name'] = proxy_name
-                        self.logger.warning(f"重复代理名称，重命名: {original_name} -> {proxy_name}")
-                    
-                    proxy_names.add(proxy_name)
-                    all_proxies.append(proxy)
-                    
-            except Exception as e:
-                error_msg = f"提取 {name} 代理配置失败: {str(e)}"
-                self.logger.error(error_msg)
-                self.stats["merge_errors"].append(error_msg)
+            self.logger.info(f"从 {name} 提取 {len(proxies)} 个代理")
+            entries.extend((name, proxy) for proxy in proxies)
+        
+        try:
+            entries = self.deduplicate_proxies(entries)
+        except Exception as e:
+            error_msg = f"代理去重失败: {str(e)}"
+            self.logger.error(error_msg)
+            self.stats["merge_errors"].append(error_msg)
+        
+        all_proxies = [proxy for _, proxy in entries]
+        self.assign_unique_names(all_proxies)
+        self.proxy_sources = {proxy['name']: source for source, proxy in entries}
+        merged = {}
+        for source, _proxy in entries:
+            merged[source] = merged.get(source, 0) + 1
+        for name in self.source_files:
+            self.metrics.record_source(name, merged=merged.get(name, 0))
         
         self.stats["total_proxies"] = len(all_proxies)
         self.logger.info(f"代理提取完成，共获得 {len(all_proxies)} 个有效代理")
         return all_proxies
     
-    def is_valid_proxy(self, proxy: Dict[str, Any]) -> bool:
+    def probe_proxy_latency(self, proxies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        验证代理配置的有效性
+        节点测速：并发测量所有代理的TCP连接延迟（见 proxy_probe.py），按延迟从低到高排序，
+        不可达节点按 probe_policy 移除或排到最后，测量结果写入 probe-results.json；
+        只走UDP的节点不测量，保持原有位置
         
         Args:
-            proxy: 代理配置字典
+            proxies: 所有代理配置列表（名称已唯一）
             
         Returns:
-            bool: 是否为有效代理
+            List[Dict]: 排序后的代理列表；全部不可达时（通常是本机网络问题）保持原列表
         """
-        required_fields = ['name', 'type', 'server', 'port']
+        self.logger.info(f"=== 节点测速：{len(proxies)} 个代理，并发 {self.probe_concurrency}，"
+                         f"超时 {self.probe_timeout} 秒{'，含TLS握手' if self.probe_tls else ''} ===")
+        start = datetime.now()
+        latencies = probe_proxies(proxies, self.probe_concurrency, self.probe_timeout, self.probe_tls)
+        elapsed = (datetime.now() - start).total_seconds()
         
-        for field in required_fields:
-            if field not in proxy or not proxy[field]:
-                return False
+        # 只走UDP的节点（hysteria2、tuic等）无法用TCP测量，不在 latencies 中，保持原位置
+        unreachable = sum(1 for latency in latencies.values() if latency is None)
+        unmeasured = len(proxies) - len(latencies)
+        self.logger.info(f"测速完成，耗时 {elapsed:.1f} 秒，可达 {len(latencies) - unreachable} 个，"
+                         f"不可达 {unreachable} 个，未测量（UDP） {unmeasured} 个")
         
-        # 检查端口是否为有效数字
+        results_file = self.work_dir / PROBE_RESULTS_NAME
         try:
-            port = int(proxy['port'])
-            if not (1 <= port <= 65535):
-                return False
-        except (ValueError, TypeError):
-            return False
+            with open(results_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'timestamp': start.isoformat(timespec='seconds'),
+                    'timeout': self.probe_timeout,
+                    'tls': self.probe_tls,
+                    'latency_ms': {name: None if latency is None else round(latency, 1)
+                                   for name, latency in latencies.items()},
+                    'unmeasured': [proxy['name'] for proxy in proxies if proxy['name'] not in latencies],
+                }, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.logger.warning(f"写出测速结果失败: {e}")
         
-        return True
+        if not latencies:
+            return proxies
+        if unreachable == len(latencies):
+            self.logger.warning("所有代理均不可达，可能是本机网络问题，保留全部代理且不排序")
+            return proxies
+        
+        drop = self.probe_policy == 'drop'
+        ranked = rank_proxies(proxies, latencies, drop_unreachable=drop)
+        if drop:
+            self.stats["unreachable_proxies"] = unreachable
+            self.stats["total_proxies"] = len(ranked)
+            self.logger.info(f"已移除 {unreachable} 个不可达代理")
+        return ranked
+    
+    def deduplicate_proxies(self, entries: List[Any]) -> List[Any]:
+        """
+        按连接身份指纹（proxy_fingerprint）去除重复节点，保留策略见 self.dedup
+        
+        Args:
+            entries: (源名称, 代理配置) 列表
+            
+        Returns:
+            List: 去重后的列表，保持原有顺序
+        """
+        if self.dedup == 'off':
+            return entries
+        
+        # 指纹 -> 保留的条目下标
+        keep_index = {}
+        for index, (_, proxy) in enumerate(entries):
+            fingerprint = proxy_fingerprint(proxy)
+            if self.dedup == 'last' or fingerprint not in keep_index:
+                keep_index[fingerprint] = index
+        
+        kept = set(keep_index.values())
+        result = []
+        for index, (source, proxy) in enumerate(entries):
+            if index in kept:
+                result.append((source, proxy))
+            else:
+                self.logger.debug(f"重复节点，已移除: {source}/{proxy['name']}")
+        
+        removed = len(entries) - len(result)
+        self.stats["duplicate_proxies"] = removed
+        if removed:
+            self.logger.info(f"去除重复节点 {removed} 个（保留策略: {self.dedup}）")
+        return result
+    
+    def assign_unique_names(self, proxies: List[Dict[str, Any]]):
+        """
+        为重复的代理名称追加 _dup_N 后缀（就地修改）
+        
+        每个原始名称记录下一次使用的序号，重名再多也不需要从 1 开始逐个尝试。
+        
+        Args:
+            proxies: 代理配置列表
+        """
+        proxy_names = set()  # 已使用的名称
+        next_suffix = {}  # 原始名称 -> 下一个候选序号
+        for proxy in proxies:
+            proxy_name = proxy['name']
+            
+            # 处理重复名称
+            if proxy_name in proxy_names:
+                original_name = proxy_name
+                counter = next_suffix.get(original_name, 1)
+                proxy_name = f"{original_name}_dup_{counter}"
+                while proxy_name in proxy_names:
+                    counter += 1
+                    proxy_name = f"{original_name}_dup_{counter}"
+                next_suffix[original_name] = counter + 1
+                proxy['name'] = proxy_name
+                self.logger.warning(f"重复代理名称，重命名: {original_name} -> {proxy_name}")
+            
+            proxy_names.add(proxy_name)
+    
+    def is_valid_proxy(self, proxy: Dict[str, Any]) -> bool:
+        """
+        验证代理配置的有效性（见模块级函数 is_valid_proxy）
+        
+        Args:
+            proxy: 代理配置字典
+            
+        Returns:
+            bool: 是否为有效代理
+        """
+        return is_valid_proxy(proxy)
     
     def load_template(self) -> Dict[str, Any]:
         """
@@ -376,50 +1221,90 @@ class YamlToJsonMerger:
             self.logger.error(f"加载模板文件失败: {e}")
             raise
     
-    def configure_ai_proxy_group(self, proxies: List[Dict[str, Any]], template: Dict[str, Any]) -> List[str]:
+    def optimize_template_rules(self, template: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        移除模板规则中重复、被遮蔽和不可达（MATCH之后）的规则，其余规则保持原有顺序，匹配结果不变
+        
+        被遮蔽的规则与遮蔽它的规则目标不同时记为冲突并输出警告。
+        
+        Args:
+            template: 模板配置（原地修改 rules）
+            
+        Returns:
+            Dict: rules_optimizer.optimize_rules 的报告
+        """
+        rules = template.get('rules')
+        if not isinstance(rules, list):
+            return {}
+        kept, report = optimize_rules(rules)
+        template['rules'] = kept
+        removed = report['removed']
+        self.stats["rules_removed"] = len(rules) - len(kept)
+        self.stats["rule_conflicts"] = len(report['conflicts'])
+        self.logger.info(f"规则优化: {len(rules)} 条 -> {len(kept)} 条（重复 {removed[REASON_DUPLICATE]}，"
+                         f"被遮蔽 {removed[REASON_SHADOWED]}，不可达 {removed[REASON_UNREACHABLE]}）")
+        for entry in report['invalid'][:10]:
+            self.logger.warning(f"无法解析的规则（原样保留）: {entry['rule']}")
+        if report['conflicts']:
+            self.logger.warning(f"发现 {len(report['conflicts'])} 条目标冲突的规则（被前面目标不同的规则遮蔽，已移除）:")
+            for entry in report['conflicts'][:10]:  # 只显示前10个
+                self.logger.warning(f"  - {entry['rule']}  <-  {entry['by']}")
+            if len(report['conflicts']) > 10:
+                self.logger.warning(f"  ... 还有 {len(report['conflicts']) - 10} 条")
+        return report
+    
+    def configure_region_groups(self, proxies: List[Dict[str, Any]], template: Dict[str, Any]) -> Dict[str, List[str]]:
         """
-        阶段三：配置AI-Proxy分组
+        阶段三：一次扫描所有代理，配置AI-Proxy及各地区分组
+        
+        所有地区模式合并为一个组合正则（RegionClassifier），每个代理名称只扫描一次，
+        得到的地区映射到 region_groups 中的分组以及模板中与地区同名的分组。
         
         Args:
             proxies: 所有代理配置列表
             template: 模板配置
             
         Returns:
-            List[str]: 匹配AI-Proxy条件的代理名称列表
+            Dict[str, List[str]]: 分组名称 -> 匹配的代理名称列表
         """
-        self.logger.info("=== 阶段三：开始配置AI-Proxy分组 ===")
+        self.logger.info("=== 阶段三：开始配置地区分组 ===")
         
-        ai_proxy_names = []
-        compiled_patterns = []
+        template_groups = {group.get('name'): group for group in template.get('proxy-groups', [])}
         
-        # 编译正则表达式模式
-        for pattern in self.ai_proxy_patterns:
-            try:
-                compiled_patterns.append(re.compile(pattern))
-            except re.error as e:
-                self.logger.error(f"正则表达式编译失败: {pattern}, 错误: {e}")
+        # 地区 -> 需要填充的分组
+        group_regions = {group: regions for group, regions in self.region_groups.items()}
+        for region in self.regions:
+            if region in template_groups and region not in group_regions:
+                group_regions[region] = [region]
+        region_to_groups = {}
+        for group, regions in group_regions.items():
+            for region in regions:
+                region_to_groups.setdefault(region, []).append(group)
+        
+        classifier = RegionClassifier({region: self.regions[region] for region in region_to_groups})
+        members = {group: [] for group in group_regions}
         
-        # 遍历所有代理，匹配AI-Proxy条件
+        # 遍历所有代理，一次扫描得到全部地区
         for proxy in proxies:
             proxy_name = proxy['name']
-            
-            # 检查是否匹配任一模式
-            for pattern in compiled_patterns:
-                if pattern.search(proxy_name):
-                    ai_proxy_names.append(proxy_name)
-                    self.logger.debug(f"AI-Proxy匹配: {proxy_name}")
-                    break
+            for region in classifier.classify(proxy_name):
+                for group in region_to_groups[region]:
+                    group_members = members[group]
+                    if not group_members or group_members[-1] != proxy_name:
+                        group_members.append(proxy_name)
+                        self.logger.debug(f"{group}匹配: {proxy_name}")
         
-        # 更新模板中的AI-Proxy分组
-        for group in template.get('proxy-groups', []):
-            if group.get('name') == 'AI-Proxy':
-                group['proxies'] = ai_proxy_names
-                break
-        else:
-            self.logger.warning("模板中未找到AI-Proxy分组")
+        # 更新模板中的分组
+        for group, names in members.items():
+            if group in template_groups:
+                template_groups[group]['proxies'] = names
+                self.logger.info(f"{group}分组配置完成，包含 {len(names)} 个代理")
+            else:
+                self.logger.warning(f"模板中未找到{group}分组")
         
+        ai_proxy_names = members.get("AI-Proxy", [])
         self.stats["ai_proxy_count"] = len(ai_proxy_names)
-        self.logger.info(f"AI-Proxy分组配置完成，包含 {len(ai_proxy_names)} 个代理")
+        self.stats["region_group_counts"] = {group: len(names) for group, names in members.items()}
         
         # 输出匹配的代理名称（用于调试）
         if ai_proxy_names:
@@ -429,7 +1314,7 @@ class YamlToJsonMerger:
             if len(ai_proxy_names) > 10:
                 self.logger.info(f"  ... 还有 {len(ai_proxy_names) - 10} 个代理")
         
-        return ai_proxy_names
+        return members
     
     def configure_auto_group(self, proxies: List[Dict[str, Any]], template: Dict[str, Any]) -> List[str]:
         """
@@ -459,9 +1344,94 @@ class YamlToJsonMerger:
         
         return all_proxy_names
     
+    def shard_oversized_groups(self, proxies: List[Dict[str, Any]], template: Dict[str, Any],
+                               groups: List[str]) -> Dict[str, List[str]]:
+        """
+        将成员超过 shard_limit 的分组按地区或订阅源拆分为子分组
+        
+        每个地区（或订阅源）的节点组成一个 url-test 子分组，超过上限时再按顺序均匀切分为多个，
+        子分组名称为 "原分组-地区" 或 "原分组-地区-序号"，插入在原分组之后；
+        原分组改为 shard_parent_type 类型，成员为这些子分组，引用原分组的规则和分组不需要修改。
+        
+        Args:
+            proxies: 所有代理配置列表
+            template: 配置好分组的模板（原地修改 proxy-groups）
+            groups: 由合并工具填充、允许拆分的分组名称
+            
+        Returns:
+            Dict[str, List[str]]: 被拆分的分组名称 -> 子分组名称列表
+        """
+        limit = self.shard_limit
+        proxy_groups = template.get('proxy-groups', [])
+        used_names = {group.get('name') for group in proxy_groups} | {proxy['name'] for proxy in proxies}
+        
+        if self.shard_strategy == 'region':
+            classifier = RegionClassifier(self.regions)
+            
+            def shard_key(name):
+                regions = classifier.classify(name)
+                return regions[0] if regions else SHARD_OTHER_KEY
+            key_order = list(self.regions) + [SHARD_OTHER_KEY]
+        else:
+            def shard_key(name):
+                return self.proxy_sources.get(name, SHARD_OTHER_KEY)
+            key_order = list(self.source_files) + [SHARD_OTHER_KEY]
+        
+        sharded = {}
+        result = []
+        for group in proxy_groups:
+            result.append(group)
+            members = group.get('proxies') or []
+            if group.get('name') not in groups or len(members) <= limit:
+                continue
+            
+            # 按地区或订阅源分桶，保持组内原有顺序（如测速后的延迟顺序）
+            buckets = {}
+            for name in members:
+                buckets.setdefault(shard_key(name), []).append(name)
+            
+            parent = group['name']
+            subgroups = []
+            for key in sorted(buckets, key=lambda key: key_order.index(key) if key in key_order else len(key_order)):
+                names = buckets[key]
+                # 切分为大小尽量均匀的若干份，避免出现只有几个节点的子分组
+                count = -(-len(names) // limit)
+                size, extra = divmod(len(names), count)
+                bounds = [index * size + min(index, extra) for index in range(count + 1)]
+                chunks = [names[bounds[index]:bounds[index + 1]] for index in range(count)]
+                for index, chunk in enumerate(chunks, 1):
+                    subgroup_name = f"{parent}-{key}" if len(chunks) == 1 else f"{parent}-{key}-{index}"
+                    while subgroup_name in used_names:
+                        subgroup_name += "_"
+                    used_names.add(subgroup_name)
+                    subgroups.append({
+                        'name': subgroup_name,
+                        'type': 'url-test',
+                        'proxies': chunk,
+                        'url': group.get('url', SHARD_DEFAULT_TEST_URL),
+                        'interval': group.get('interval', SHARD_DEFAULT_INTERVAL),
+                        **{option: group[option] for option in ('tolerance', 'lazy', 'timeout') if option in group},
+                    })
+            
+            group['type'] = self.shard_parent_type
+            group['proxies'] = [subgroup['name'] for subgroup in subgroups]
+            group.setdefault('url', SHARD_DEFAULT_TEST_URL)
+            group.setdefault('interval', SHARD_DEFAULT_INTERVAL)
+            result.extend(subgroups)
+            sharded[parent] = group['proxies']
+            self.logger.info(f"{parent}分组包含 {len(members)} 个代理，超过上限 {limit}，"
+                             f"按{'地区' if self.shard_strategy == 'region' else '订阅源'}拆分为 {len(subgroups)} 个子分组")
+        
+        template['proxy-groups'] = result
+        self.stats["sharded_groups"] = {parent: len(subgroups) for parent, subgroups in sharded.items()}
+        return sharded
+    
     def generate_final_config(self, proxies: List[Dict[str, Any]], template: Dict[str, Any]) -> bool:
         """
-        阶段四：生成最终配置文件
+        阶段四：验证并生成最终配置文件
+        
+        先在内存中验证配置结构，再按 output_format 流式写出到临时文件并原子替换输出文件，
+        验证失败或写出失败时保留原有的输出文件。
         
         Args:
             proxies: 所有代理配置列表
@@ -473,44 +1443,37 @@ class YamlToJsonMerger:
         self.logger.info("=== 阶段四：开始生成最终配置文件 ===")
         
         try:
-            # 将代理配置添加到模板中
+            # 将代理配置添加到模板中（浅拷贝，不复制代理列表）
             final_config = template.copy()
             final_config['proxies'] = proxies
             
-            # 保存最终配置文件
-            with open(self.output_file, 'w', encoding='utf-8') as f:
-                json.dump(final_config, f, indent=2, ensure_ascii=False)
-            
-            self.logger.info(f"最终配置文件已生成: {self.output_file}")
-            
-            # 验证生成的配置文件
-            if self.validate_final_config():
-                self.logger.info("[OK] 最终配置文件验证通过")
-                return True
-            else:
-                self.logger.error("[FAIL] 最终配置文件验证失败")
+            if not self.validate_final_config(final_config):
+                self.logger.error("[FAIL] 最终配置验证失败")
                 return False
+            self.logger.info("[OK] 最终配置验证通过")
+            
+            # 流式写出并原子替换
+            size = write_config(final_config, self.output_file, self.output_format)
+            self.logger.info(f"最终配置文件已生成: {self.output_file}（{self.output_format}，{size} 字节）")
+            return True
                 
         except Exception as e:
             self.logger.error(f"生成最终配置文件失败: {e}")
             return False
     
-    def validate_final_config(self) -> bool:
+    def validate_final_config(self, config: Dict[str, Any]) -> bool:
         """
-        验证最终配置文件的正确性
+        验证最终配置的正确性（检查内存中的配置结构，不重新读取输出文件）
         
+        Args:
+            config: 最终配置字典
+            
         Returns:
             bool: 验证是否通过
         """
-        self.logger.info("开始验证最终配置文件...")
+        self.logger.info("开始验证最终配置...")
         
         try:
-            with open(self.output_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            # 验证JSON格式
-            self.logger.info("[OK] JSON格式验证通过")
-            
             # 验证必要字段
             required_fields = ['proxies', 'proxy-groups', 'rules']
             for field in required_fields:
@@ -524,6 +1487,20 @@ class YamlToJsonMerger:
                 self.logger.error(f"[FAIL] 代理数量不匹配: 期望{self.stats['total_proxies']}，实际{proxy_count}")
                 return False
             
+            # 验证代理名称唯一
+            proxy_names = {proxy['name'] for proxy in config['proxies']}
+            if len(proxy_names) != proxy_count:
+                self.logger.error("[FAIL] 代理名称存在重复")
+                return False
+            
+            # 验证规则：目标应为分组、节点或内置策略（只警告，由客户端最终判断）
+            if not isinstance(config['rules'], list):
+                self.logger.error("[FAIL] rules 不是列表")
+                return False
+            unknown_targets = find_unknown_targets(config['rules'], config)
+            if unknown_targets:
+                self.logger.warning(f"[WARN] {len(unknown_targets)} 条规则的目标不存在，如: {unknown_targets[0]}")
+            
             # 验证分组配置
             groups = config.get('proxy-groups', [])
             ai_proxy_group = None
@@ -543,9 +1520,15 @@ class YamlToJsonMerger:
                 self.logger.error("[FAIL] 未找到Auto分组")
                 return False
             
-            # 验证分组代理数量
-            ai_proxy_count = len(ai_proxy_group.get('proxies', []))
-            auto_proxy_count = len(auto_group.get('proxies', []))
+            # 验证分组代理数量（被拆分的分组按子分组的成员计算）
+            groups_by_name = {group.get('name'): group for group in groups}
+            
+            def member_count(group):
+                if group.get('name') not in self.stats["sharded_groups"]:
+                    return len(group.get('proxies', []))
+                return sum(len(groups_by_name[name].get('proxies', [])) for name in group.get('proxies', []))
+            ai_proxy_count = member_count(ai_proxy_group)
+            auto_proxy_count = member_count(auto_group)
             
             if ai_proxy_count != self.stats["ai_proxy_count"]:
                 self.logger.error(f"[FAIL] AI-Proxy分组代理数量不匹配: 期望{self.stats['ai_proxy_count']}，实际{ai_proxy_count}")
@@ -555,16 +1538,13 @@ class YamlToJsonMerger:
                 self.logger.error(f"[FAIL] Auto分组代理数量不匹配: 期望{self.stats['auto_proxy_count']}，实际{auto_proxy_count}")
                 return False
             
-            self.logger.info("[OK] 配置文件结构验证通过")
+            self.logger.info("[OK] 配置结构验证通过")
             self.logger.info(f"[OK] 代理节点总数: {proxy_count}")
             self.logger.info(f"[OK] AI-Proxy分组: {ai_proxy_count} 个代理")
             self.logger.info(f"[OK] Auto分组: {auto_proxy_count} 个代理")
             
             return True
             
-        except json.JSONDecodeError as e:
-            self.logger.error(f"[FAIL] JSON格式错误: {e}")
-            return False
         except Exception as e:
             self.logger.error(f"[FAIL] 验证过程中发生错误: {e}")
             return False
@@ -574,9 +1554,22 @@ class YamlToJsonMerger:
         self.logger.info("=" * 50)
         self.logger.info("执行摘要")
         self.logger.info("=" * 50)
-        self.logger.info(f"总代理数量: {self.stats['total_proxies']}")
+        self.logger.info(f"订阅源: {len(self.source_files)} 个（{self.stats['cached_sources']} 个使用缓存）")
+        if self.stats["fetch"]:
+            fetch = self.stats["fetch"]
+            self.logger.info(f"订阅下载: 更新 {fetch['updated']} 个，未变化 {fetch['unchanged']} 个，失败 {fetch['failed']} 个")
+        self.logger.info(f"总代理数量: {self.stats['total_proxies']}（去除重复节点 {self.stats['duplicate_proxies']} 个）")
+        if self.stats["unreachable_proxies"]:
+            self.logger.info(f"移除不可达节点: {self.stats['unreachable_proxies']} 个")
         self.logger.info(f"AI-Proxy分组: {self.stats['ai_proxy_count']} 个代理")
+        for group, count in self.stats["region_group_counts"].items():
+            if group != "AI-Proxy":
+                self.logger.info(f"{group}分组: {count} 个代理")
         self.logger.info(f"Auto分组: {self.stats['auto_proxy_count']} 个代理")
+        for group, count in self.stats["sharded_groups"].items():
+            self.logger.info(f"{group}分组已拆分为 {count} 个子分组")
+        if self.optimize_rules:
+            self.logger.info(f"规则优化: 移除 {self.stats['rules_removed']} 条，目标冲突 {self.stats['rule_conflicts']} 条")
         
         if self.stats["conversion_errors"]:
             self.logger.error("转换错误:")
@@ -588,67 +1581,221 @@ class YamlToJsonMerger:
             for error in self.stats["merge_errors"]:
                 self.logger.error(f"  - {error}")
         
+        stages = "，".join(f"{name} {entry['wall_seconds']:.2f}s" for name, entry in self.metrics.stages.items())
+        if stages:
+            self.logger.info(f"各阶段耗时: {stages}")
+        
         self.logger.info(f"最终配置文件: {self.output_file}")
         self.logger.info("=" * 50)
     
     def run(self) -> bool:
         """
-        执行完整的合并流程
+        执行完整的合并流程，结束后写出运行指标
         
         Returns:
             bool: 执行是否成功
         """
         self.logger.info("开始执行YAML配置文件合并任务")
+        self.reset_stats()
+        success = False
         
         try:
-            # 验证前置条件
+            success = self.run_stages()
+            return success
+        except Exception as e:
+            self.logger.error(f"执行过程中发生异常: {e}")
+            return False
+        finally:
+            self.write_metrics(success)
+            self.print_summary()
+    
+    def run_stages(self) -> bool:
+        """
+        依次执行各阶段，每个阶段的耗时记录在 self.metrics 中
+        
+        Returns:
+            bool: 执行是否成功
+        """
+        metrics = self.metrics
+        
+        # 阶段零：下载订阅
+        if self.fetch_enabled:
+            with metrics.stage('fetch'):
+                self.fetch_subscriptions()
+        
+        # 验证前置条件
+        with metrics.stage('validate'):
             if not self.validate_prerequisites():
                 return False
             
-            # 阶段一：YAML到JSON转换
+            # 增量构建：所有输入都未变化且输出文件完好时跳过生成
+            build_key = None
+            if self.use_cache:
+                self.load_cache_manifest()
+                self.compute_source_digests()
+                build_key = self.compute_build_key()
+                # 开启测速时节点可达性随时会变化，每次都重新生成；
+                # keep_json 要求写出各源的中间JSON文件，跳过生成时不会写出，同样每次都重新生成
+                if self.is_up_to_date(build_key) and not self.probe_policy and not self.keep_json:
+                    self.stats.update(self.manifest.get('stats', {}))
+                    self.stats["cached_sources"] = len(self.source_files)
+                    metrics.skipped = True
+                    self.logger.info("[SKIP] 订阅源、模板和匹配模式均未变化，输出文件已是最新，跳过生成")
+                    return True
+        
+        # 阶段一：YAML到JSON转换
+        with metrics.stage('convert'):
             if not self.convert_yaml_to_json():
                 self.logger.error("YAML转换阶段失败")
                 return False
-            
-            # 阶段二：提取代理配置
+        
+        # 阶段二：提取代理配置
+        with metrics.stage('extract'):
             all_proxies = self.extract_proxies()
-            if not all_proxies:
-                self.logger.error("未能提取到任何有效代理配置")
-                return False
-            
-            # 加载模板
+        if not all_proxies:
+            self.logger.error("未能提取到任何有效代理配置")
+            return False
+        
+        # 节点测速：按延迟排序，处理不可达节点
+        if self.probe_policy:
+            with metrics.stage('probe'):
+                all_proxies = self.probe_proxy_latency(all_proxies)
+        
+        # 加载模板
+        with metrics.stage('template'):
             template = self.load_template()
-            
-            # 阶段三：配置代理分组
-            self.configure_ai_proxy_group(all_proxies, template)
+            if self.optimize_rules:
+                self.optimize_template_rules(template)
+        
+        # 阶段三：配置代理分组
+        with metrics.stage('classify'):
+            region_members = self.configure_region_groups(all_proxies, template)
             self.configure_auto_group(all_proxies, template)
-            
-            # 阶段四：生成最终配置
+            if self.shard_limit:
+                self.shard_oversized_groups(all_proxies, template, list(region_members) + ['Auto'])
+        
+        # 阶段四：生成最终配置
+        with metrics.stage('write'):
             if not self.generate_final_config(all_proxies, template):
                 self.logger.error("生成最终配置失败")
                 return False
             
-            self.logger.info("[SUCCESS] 所有阶段执行成功")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"执行过程中发生异常: {e}")
-            return False
-        finally:
-            self.print_summary()
-
+            if build_key is not None:
+                try:
+                    self.update_cache(build_key)
+                except OSError as e:
+                    # 缓存只用于加速，写出失败不影响本次结果
+                    self.logger.warning(f"更新构建缓存失败: {e}")
+        
+        self.logger.info("[SUCCESS] 所有阶段执行成功")
+        return True
+    
+    def write_metrics(self, success: bool):
+        """
+        写出本次运行的指标（JSON指标文件和可选的Prometheus文本文件），写出失败只记录警告
+        
+        Args:
+            success: 本次运行是否成功
+        """
+        self.metrics.finish(success, self.stats)
+        for path, write in ((self.metrics_file, self.metrics.write_json),
+                            (self.prometheus_file, self.metrics.write_prometheus)):
+            if not path:
+                continue
+            try:
+                write(path)
+            except OSError as e:
+                self.logger.warning(f"写出运行指标 {path} 失败: {e}")
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='合并多个Clash YAML订阅为一个JSON配置')
+    parser.add_argument('--keep-json', action='store_true', help='将每个源文件的解析结果另存为JSON文件（调试用）')
+    parser.add_argument('--sources', help=f'订阅源配置文件（默认使用工作目录中的 {SOURCES_CONFIG_NAME}）')
+    parser.add_argument('--glob', action='append', help='按glob模式选择订阅源，如 "subscriptions/*.yml"，可重复指定')
+    parser.add_argument('--workers', type=int, help='解析订阅的进程数（默认为CPU核数）')
+    parser.add_argument('--dedup', choices=DEDUP_POLICIES,
+                        help='连接身份相同的重复节点的保留策略：first 保留最先出现的（默认），last 保留最后出现的，off 不去重')
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS),
+                        help='输出格式：json（默认，indent=2）、json-compact（紧凑JSON）、yaml（Clash原生YAML）')
+    parser.add_argument('--probe', choices=PROBE_POLICIES,
+                        help='并发测量节点TCP延迟并按延迟排序，不可达节点 drop 移除或 demote 排到最后')
+    parser.add_argument('--probe-concurrency', type=int, help=f'测速的最大并发连接数（默认{DEFAULT_CONCURRENCY}）')
+    parser.add_argument('--probe-timeout', type=float, help=f'测速的单次连接超时秒数（默认{DEFAULT_TIMEOUT}）')
+    parser.add_argument('--probe-tls', action='store_true', help='测速时对使用TLS的节点同时测量TLS握手')
+    parser.add_argument('--optimize-rules', action='store_true',
+                        help='移除模板中重复、被遮蔽和不可达的规则（匹配结果不变），并报告目标冲突')
+    parser.add_argument('--shard-limit', type=int,
+                        help='分组成员超过该数量时拆分为子分组，原分组改为在子分组之间自动选择')
+    parser.add_argument('--shard-by', choices=SHARD_STRATEGIES, help='拆分方式：region 按地区（默认），provider 按订阅源')
+    parser.add_argument('--shard-parent-type', choices=SHARD_PARENT_TYPES,
+                        help='拆分后原分组的类型：url-test（默认，选择延迟最低的子分组）或 fallback')
+    parser.add_argument('--metrics', help=f'运行指标JSON文件路径（默认为工作目录中的 {METRICS_NAME}）')
+    parser.add_argument('--metrics-prom', help='同时写出Prometheus文本文件，如 node_exporter textfile collector 目录下的 clash_merger.prom')
+    parser.add_argument('--serve', action='store_true',
+                        help='启动本地HTTP服务提供最新配置（支持ETag/304和gzip），订阅源或模板变化时在后台重新生成')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'--serve 的监听地址（默认{DEFAULT_HOST}）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'--serve 的监听端口（默认{DEFAULT_PORT}）')
+    parser.add_argument('--watch-interval', type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help=f'--serve 检查输入变化的间隔秒数（默认{DEFAULT_WATCH_INTERVAL}）')
+    parser.add_argument('--no-fetch', action='store_true', help='不下载订阅，直接使用已有的订阅源文件')
+    parser.add_argument('--fetch-interval', type=float,
+                        help='--serve 定期下载订阅的间隔秒数（默认只在输入变化重新生成时下载）')
+    parser.add_argument('--no-cache', action='store_true', help=f'不使用增量构建缓存（{CACHE_DIR_NAME}），重新解析全部订阅源')
+    args = parser.parse_args()
+    
     print("YAML配置文件合并工具")
     print("=" * 50)
     
     # 创建合并工具实例
-    merger = YamlToJsonMerger()
+    try:
+        merger = YamlToJsonMerger(keep_json=args.keep_json, use_cache=not args.no_cache)
+        if args.sources:
+            merger.load_sources_config(Path(args.sources))
+        if args.glob:
+            merger.set_sources(args.glob, Path.cwd())
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+    if args.workers:
+        merger.workers = args.workers
+    if args.no_fetch:
+        merger.fetch_enabled = False
+    if args.dedup:
+        merger.set_dedup_policy(args.dedup)
+    if args.format:
+        merger.set_output_format(args.format)
+    if args.optimize_rules:
+        merger.optimize_rules = True
+    if args.shard_limit is not None or args.shard_by or args.shard_parent_type:
+        limit = args.shard_limit if args.shard_limit is not None else merger.shard_limit
+        merger.set_shard_options(limit, args.shard_by, args.shard_parent_type)
+    if args.metrics or args.metrics_prom:
+        merger.set_metrics_options(args.metrics, args.metrics_prom, Path.cwd())
+    probe_tuning = args.probe_concurrency is not None or args.probe_timeout is not None or args.probe_tls
+    if args.probe or probe_tuning:
+        # 测速参数也作用于订阅源配置中开启的测速；两处都没有开启测速时参数不会生效，直接报错
+        policy = args.probe or merger.probe_policy
+        if policy is None:
+            parser.error("--probe-concurrency、--probe-timeout 和 --probe-tls 需要与 --probe 一起使用，"
+                         "或在订阅源配置中开启 probe")
+        merger.set_probe_options(policy, args.probe_concurrency, args.probe_timeout, args.probe_tls or None)
     
     # 示例：添加自定义的AI-Proxy匹配模式
     # merger.add_ai_proxy_pattern(r'(?i).*(德国|DE|Germany).*')
     # merger.add_ai_proxy_pattern(r'(?i).*(法国|FR|France).*')
+    # 示例：添加地区，并填充模板中名为 "DE" 的分组
+    # merger.add_region("DE", r'(?i)德国|DE|Germany')
+    
+    # 服务模式：生成后持续提供配置，直到 Ctrl+C
+    if args.serve:
+        try:
+            server = ConfigServer(merger, args.host, args.port, args.watch_interval, args.fetch_interval)
+        except OSError as e:
+            print(f"错误: 无法监听 {args.host}:{args.port}: {e}")
+            return 1
+        server.serve_forever()
+        return 0
     
     # 执行合并任务
     success = merger.run()
@@ -2,77 +2,574 @@ import yaml
 import json
 import sys
 import os
+import glob
+import hashlib
+import argparse
+from json.encoder import encode_basestring
+from concurrent.futures import ProcessPoolExecutor
 
-def convert_yml_to_json(yml_file_path, json_file_path):
+# 优先使用libyaml的C实现（PyYAML编译时带有libyaml才可用），否则退回纯Python实现，两者解析结果相同。
+# 设置环境变量 YML2JSON_PURE_PYTHON=1 可强制使用纯Python实现（用于对比或排查问题）
+if os.environ.get('YML2JSON_PURE_PYTHON') != '1' and hasattr(yaml, 'CSafeLoader'):
+    SafeLoader, SafeDumper = yaml.CSafeLoader, yaml.CSafeDumper
+    YAML_BACKEND = 'libyaml'
+else:
+    SafeLoader, SafeDumper = yaml.SafeLoader, yaml.SafeDumper
+    YAML_BACKEND = 'python'
+
+# 批量转换时记录源文件状态的缓存文件（位于输出目录或当前目录），用于跳过未变化的文件
+BATCH_CACHE_NAME = ".yml2json-cache.json"
+# 目录输入时转换的文件扩展名
+YAML_EXTENSIONS = ('.yml', '.yaml')
+# 超过该大小（字节）的文件默认使用流式转换，内存占用与文件大小基本无关
+STREAM_THRESHOLD = 32 * 1024 * 1024
+# 流式转换支持的标签（JSON可以表示的类型），其他标签（时间戳、二进制、集合等）退回完整加载
+STREAM_SCALAR_TAGS = {
+    'tag:yaml.org,2002:str', 'tag:yaml.org,2002:int', 'tag:yaml.org,2002:float',
+    'tag:yaml.org,2002:bool', 'tag:yaml.org,2002:null',
+}
+STREAM_COLLECTION_TAGS = {None, '!', 'tag:yaml.org,2002:seq', 'tag:yaml.org,2002:map'}
+# 流式转换累积多少个输出片段后写出一次
+STREAM_FLUSH_PARTS = 8192
+
+class StreamingUnsupportedError(ValueError):
+    """YAML中含有流式转换不支持的结构（合并键、重复键、非JSON类型等），需要使用完整加载"""
+
+def yaml_backend_description():
+    """返回当前使用的YAML解析后端说明，用于日志输出"""
+    return f"{YAML_BACKEND} ({SafeLoader.__name__}/{SafeDumper.__name__})"
+
+def load_yaml(stream, loader=None):
+    """
+    使用安全加载器解析YAML文本或文件流
+
+    参数:
+        stream: YAML文本、字节串或文件对象
+        loader: 加载器类，默认使用 SafeLoader（C实现可用时为 CSafeLoader）
     """
-    将YAML文件转换为JSON文件
+    return yaml.load(stream, Loader=loader or SafeLoader)
+
+def dump_yaml(data, stream=None, dumper=None):
+    """
+    使用安全输出器输出YAML（保留中文字符和键的顺序）
+
+    参数:
+        data: 要输出的数据
+        stream: 文件对象，为None时返回字符串
+        dumper: 输出器类，默认使用 SafeDumper（C实现可用时为 CSafeDumper）
+    """
+    return yaml.dump(data, stream, Dumper=dumper or SafeDumper, allow_unicode=True, sort_keys=False)
+
+def load_yaml_document(stream):
+    """
+    解析单个YAML文档，空文档（空文件、只有注释或 ~）统一返回空字典
+    
+    单文件转换、批量转换和 load_yaml_file 共用，保证各模式对空文档的输出相同（流式转换同样输出 {}）
+    """
+    yml_data = load_yaml(stream)
+    return {} if yml_data is None else yml_data
+
+def load_yaml_file(yml_file_path):
+    """
+    读取并解析YAML文件，供其他脚本在进程内直接调用
     
     参数:
         yml_file_path (str): YAML源文件路径
-        json_file_path (str): JSON目标文件路径
+    
+    返回:
+        解析后的数据，文件为空时返回空字典
     
     异常:
         FileNotFoundError: 当源文件不存在时抛出
+        ValueError: 当路径不是文件时抛出
         yaml.YAMLError: 当YAML文件格式错误时抛出
-        IOError: 当文件读写出现错误时抛出
     """
-    try:
-        # 检查YAML源文件是否存在
-        if not os.path.exists(yml_file_path):
-            raise FileNotFoundError(f"YAML源文件不存在: {yml_file_path}")
-        
-        # 检查YAML源文件是否为文件（而非目录）
-        if not os.path.isfile(yml_file_path):
-            raise ValueError(f"指定的YAML路径不是文件: {yml_file_path}")
-        
-        # 读取YML文件，明确指定使用utf-8编码
-        print(f"正在读取YAML文件: {yml_file_path}")
-        with open(yml_file_path, 'r', encoding='utf-8') as yml_file:
-            yml_data = yaml.safe_load(yml_file)
-        
-        # 检查YAML数据是否为空
-        if yml_data is None:
-            print("警告: YAML文件为空或无有效内容")
-            yml_data = {}
+    # 检查YAML源文件是否存在
+    if not os.path.exists(yml_file_path):
+        raise FileNotFoundError(f"YAML源文件不存在: {yml_file_path}")
+    
+    # 检查YAML源文件是否为文件（而非目录）
+    if not os.path.isfile(yml_file_path):
+        raise ValueError(f"指定的YAML路径不是文件: {yml_file_path}")
+    
+    # 读取YML文件，明确指定使用utf-8编码
+    with open(yml_file_path, 'r', encoding='utf-8') as yml_file:
+        return load_yaml_document(yml_file)
+
+def write_json_file(data, json_file_path):
+    """
+    将数据写入格式化JSON文件（utf-8编码，保留中文字符），目标目录不存在时自动创建
+    
+    参数:
+        data: 要写入的数据
+        json_file_path (str): JSON目标文件路径
+    """
+    json_dir = os.path.dirname(json_file_path)
+    if json_dir and not os.path.exists(json_dir):
+        os.makedirs(json_dir, exist_ok=True)
+    with open(json_file_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, indent=2, ensure_ascii=False)
+
+def json_scalar(value):
+    """按 json.dump 的规则输出标量（字符串不转义中文，nan/inf 输出为 NaN/Infinity）"""
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == -float('inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+def stream_yaml_to_json(yml_stream, json_stream):
+    """
+    逐个处理YAML解析事件，增量输出JSON，不在内存中构建整个文档
+    
+    输出与 load_yaml_file + write_json_file（json.dump indent=2）完全相同。内存占用只与嵌套深度、
+    单个映射的键数量和锚点内容有关，与文件大小基本无关。
+    
+    参数:
+        yml_stream: YAML文本或文件对象
+        json_stream: 输出的文本文件对象
+    
+    异常:
+        StreamingUnsupportedError: 含有合并键（<<）、重复键、复杂键或JSON无法表示的类型，需要完整加载
+        yaml.YAMLError: 当YAML文件格式错误时抛出
+    """
+    # 用纯Python加载器实例解析标量的隐式类型和构造值，规则与完整加载相同
+    helper = yaml.SafeLoader('')
+    constructors = helper.yaml_constructors
+    resolve = helper.resolve
+    str_tag = 'tag:yaml.org,2002:str'
+    
+    parts = []
+    # 容器栈：每层为 [是否映射, 已输出的元素数, 当前是否等待键, 已出现的键]
+    stack = []
+    anchors = {}
+    # 正在记录的锚点：[锚点名, 事件列表, 嵌套深度]
+    recordings = []
+    documents = 0
+    
+    def fail(message, event):
+        raise StreamingUnsupportedError(f"{message}{event.start_mark}")
+    
+    def scalar_value(event):
+        tag = event.tag
+        if tag is None or tag == '!':
+            if not event.implicit[0] and event.implicit[1]:
+                return event.value
+            tag = resolve(yaml.ScalarNode, event.value, event.implicit)
+        if tag == str_tag:
+            return event.value
+        if tag not in STREAM_SCALAR_TAGS:
+            fail(f"不支持的标量类型 {tag}", event)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        return constructors[tag](helper, node)
+    
+    def begin_value(event):
+        """输出一个值之前的分隔符和缩进；处于等待键的位置时返回True"""
+        if not stack:
+            return False
+        level = stack[-1]
+        if level[0] and level[2]:
+            return True
+        if not level[0]:
+            parts.append((',\n' if level[1] else '\n') + '  ' * len(stack))
+            level[1] += 1
+        return False
+    
+    def write_key(event):
+        level = stack[-1]
+        if not isinstance(event, yaml.ScalarEvent):
+            fail("不支持复杂键", event)
+        if event.tag is None and event.implicit[0] and event.value == '<<':
+            fail("不支持合并键", event)
+        key = scalar_value(event)
+        if key in level[3]:
+            fail(f"重复的键 {key!r}", event)
+        level[3].add(key)
+        # 与 json.dump 相同，非字符串的键转换为其JSON文本
+        text = encode_basestring(key if isinstance(key, str) else json_scalar(key))
+        parts.append((',\n' if level[1] else '\n') + '  ' * len(stack) + text + ': ')
+        level[1] += 1
+        level[2] = False
+    
+    def end_value():
+        if stack and stack[-1][0]:
+            stack[-1][2] = True
+    
+    def handle(event):
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in anchors:
+                # 未定义或引用自身的别名，由完整加载报告错误
+                fail(f"无法展开的别名 {event.anchor!r}", event)
+            for replayed in anchors[event.anchor]:
+                handle(replayed)
+            return
+        if isinstance(event, yaml.ScalarEvent):
+            if begin_value(event):
+                write_key(event)
+                return
+            value = scalar_value(event)
+            if not stack:
+                # 文档根节点为空时与 load_yaml_file 一样输出空字典
+                parts.append('{}' if value is None else json_scalar(value))
+            else:
+                parts.append(json_scalar(value))
+            end_value()
+        elif isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            if begin_value(event):
+                fail("不支持复杂键", event)
+            if event.tag not in STREAM_COLLECTION_TAGS:
+                fail(f"不支持的集合类型 {event.tag}", event)
+            is_mapping = isinstance(event, yaml.MappingStartEvent)
+            parts.append('{' if is_mapping else '[')
+            stack.append([is_mapping, 0, True, set() if is_mapping else None])
+        elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+            level = stack.pop()
+            if level[1]:
+                parts.append('\n' + '  ' * len(stack) + ('}' if level[0] else ']'))
+            else:
+                parts.append('}' if level[0] else ']')
+            end_value()
+    
+    for event in yaml.parse(yml_stream, Loader=SafeLoader):
+        if isinstance(event, yaml.DocumentStartEvent):
+            documents += 1
+            if documents > 1:
+                raise yaml.composer.ComposerError("expected a single document in the stream", None,
+                                                  "but found another document", event.start_mark)
+            continue
+        if isinstance(event, (yaml.StreamStartEvent, yaml.StreamEndEvent, yaml.DocumentEndEvent)):
+            continue
         
-        # 确保JSON目标文件的目录存在
-        json_dir = os.path.dirname(json_file_path)
-        if json_dir and not os.path.exists(json_dir):
-            os.makedirs(json_dir, exist_ok=True)
-            print(f"已创建目录: {json_dir}")
+        # 记录带锚点的节点的事件，遇到别名时重放
+        for recording in recordings:
+            recording[1].append(event)
+        anchor = getattr(event, 'anchor', None)
+        if anchor is not None and not isinstance(event, yaml.AliasEvent):
+            if anchor in anchors or any(recording[0] == anchor for recording in recordings):
+                fail(f"重复的锚点 {anchor!r}", event)
+            recordings.append([anchor, [event], 0])
+        for recording in recordings:
+            if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+                recording[2] += 1
+            elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+                recording[2] -= 1
+        while recordings and recordings[-1][2] == 0:
+            name, events, _ = recordings.pop()
+            anchors[name] = events
         
-        # 转换为格式化JSON并保存到文件，使用utf-8编码，保留中文字符
+        handle(event)
+        if len(parts) >= STREAM_FLUSH_PARTS:
+            json_stream.write(''.join(parts))
+            parts.clear()
+    
+    if not documents:
+        parts.append('{}')
+    json_stream.write(''.join(parts))
+
+def stream_convert_file(yml_file_path, json_file_path):
+    """
+    流式转换一个文件：写入同目录的临时文件，完成后原子替换目标文件
+    
+    异常:
+        StreamingUnsupportedError: 需要完整加载（目标文件保持不变）
+        yaml.YAMLError: 当YAML文件格式错误时抛出
+    """
+    # config_writer 依赖本模块，在函数内导入避免循环导入
+    from config_writer import atomic_open
+    os.makedirs(os.path.dirname(os.path.abspath(json_file_path)), exist_ok=True)
+    with open(yml_file_path, 'r', encoding='utf-8') as yml_file, atomic_open(json_file_path) as json_file:
+        stream_yaml_to_json(yml_file, json_file)
+
+def convert_yml_to_json(yml_file_path, json_file_path, verbose=True, stream=None):
+    """
+    将YAML文件转换为JSON文件（库函数，出错时抛出异常，不会退出进程）
+    
+    参数:
+        yml_file_path (str): YAML源文件路径
+        json_file_path (str): JSON目标文件路径
+        verbose (bool): 是否输出转换过程信息
+        stream (bool): 是否使用流式转换，为None时超过 STREAM_THRESHOLD 的文件使用流式转换；
+                       含有流式转换不支持的结构时自动退回完整加载，输出相同
+    
+    异常:
+        FileNotFoundError: 当源文件不存在时抛出
+        ValueError: 当源路径不是文件时抛出
+        yaml.YAMLError: 当YAML文件格式错误时抛出
+        IOError: 当文件读写出现错误时抛出
+    """
+    if verbose:
+        print(f"正在读取YAML文件: {yml_file_path}（解析后端: {yaml_backend_description()}）")
+    if not os.path.exists(yml_file_path):
+        raise FileNotFoundError(f"YAML源文件不存在: {yml_file_path}")
+    if stream is None:
+        stream = os.path.isfile(yml_file_path) and os.path.getsize(yml_file_path) > STREAM_THRESHOLD
+    if stream:
+        try:
+            stream_convert_file(yml_file_path, json_file_path)
+            if verbose:
+                print(f"流式转换成功完成: {yml_file_path} -> {json_file_path}")
+            return
+        except StreamingUnsupportedError as e:
+            if verbose:
+                print(f"无法流式转换，改为完整加载: {e}")
+    yml_data = load_yaml_file(yml_file_path)
+    
+    # 检查YAML数据是否为空
+    if not yml_data and verbose:
+        print("警告: YAML文件为空或无有效内容")
+    
+    # 转换为格式化JSON并保存到文件，使用utf-8编码，保留中文字符
+    if verbose:
         print(f"正在写入JSON文件: {json_file_path}")
-        with open(json_file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(yml_data, json_file, indent=2, ensure_ascii=False)
-        
+    write_json_file(yml_data, json_file_path)
+    
+    if verbose:
         print(f"转换成功完成: {yml_file_path} -> {json_file_path}")
+
+def file_state(path):
+    """返回文件的 (mtime_ns, 大小)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def collect_yaml_files(inputs, output_dir=None):
+    """
+    展开输入列表，确定每个源文件的JSON目标路径
+    
+    参数:
+        inputs: 文件路径、glob模式或目录（目录下递归查找 .yml/.yaml 文件）的列表
+        output_dir: 输出目录，为None时JSON文件写在源文件旁边；
+                    目录输入在输出目录中保持原有的子目录结构，glob输入保持相对于
+                    模式中不含通配符的目录部分的子目录结构（如 in*/y.yml 输出为 in/y.json、in2/y.json）
+    
+    返回:
+        list: (源文件路径, 目标文件路径) 列表，按输入顺序排列，重复的源文件只保留一次
+    
+    异常:
+        FileNotFoundError: 当输入的文件或目录不存在、或glob模式没有匹配到文件时抛出
+        ValueError: 当不同的源文件对应同一个目标文件时抛出（如 a.yml 和 a.yaml，或不同目录下的同名文件）
+    """
+    pairs = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = []
+            for root, _, files in os.walk(item):
+                matches.extend(os.path.join(root, name) for name in files
+                               if name.lower().endswith(YAML_EXTENSIONS))
+            matches = [(path, os.path.relpath(path, item)) for path in sorted(matches)]
+        elif glob.has_magic(item):
+            base = os.path.dirname(item)
+            while glob.has_magic(base):
+                base = os.path.dirname(base)
+            matches = [(path, os.path.relpath(path, base or os.curdir))
+                       for path in sorted(glob.glob(item)) if os.path.isfile(path)]
+            if not matches:
+                raise FileNotFoundError(f"glob模式没有匹配到任何文件: {item}")
+        elif os.path.isfile(item):
+            matches = [(item, os.path.basename(item))]
+        else:
+            raise FileNotFoundError(f"YAML源文件或目录不存在: {item}")
         
-    except FileNotFoundError as e:
-        print(f"错误: {e}")
-        sys.exit(1)
-    except yaml.YAMLError as e:
-        print(f"YAML解析错误: {e}")
-        sys.exit(1)
-    except IOError as e:
-        print(f"文件读写错误: {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"未知错误: {e}")
-        sys.exit(1)
+        for path, relative in matches:
+            base = os.path.join(output_dir, relative) if output_dir else path
+            pairs.setdefault(os.path.abspath(path), os.path.splitext(base)[0] + '.json')
+    
+    # 多个源文件写同一个目标时只有最后写出的结果保留，缓存也会使它们每次都重新转换
+    sources = {}
+    for source, target in pairs.items():
+        key = os.path.normcase(os.path.abspath(target))
+        if key in sources:
+            raise ValueError(f"源文件 {sources[key]} 和 {source} 的输出文件相同: {target}")
+        sources[key] = source
+    return list(pairs.items())
+
+def convert_task(task):
+    """
+    批量转换的工作进程任务：读取、解析并写出一个文件
+    
+    参数:
+        task: (源文件路径, 目标文件路径, 是否流式转换；为None时按 STREAM_THRESHOLD 判断)
+    
+    返回:
+        tuple: (源文件路径, 源文件SHA-256摘要, 错误信息；成功时为None)
+    """
+    yml_file_path, json_file_path, stream = task
+    try:
+        if stream is None:
+            stream = os.path.getsize(yml_file_path) > STREAM_THRESHOLD
+        if stream:
+            # 大文件分块计算摘要，不把整个文件读入内存
+            digest = hashlib.sha256()
+            with open(yml_file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            convert_yml_to_json(yml_file_path, json_file_path, verbose=False, stream=True)
+            return yml_file_path, digest.hexdigest(), None
+        with open(yml_file_path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        write_json_file(load_yaml_document(content.decode('utf-8')), json_file_path)
+        return yml_file_path, digest, None
+    except (OSError, UnicodeDecodeError, yaml.YAMLError, ValueError, TypeError) as e:
+        return yml_file_path, None, f"{type(e).__name__}: {e}"
+
+def load_batch_cache(cache_path):
+    """读取批量转换缓存，文件不存在或损坏时返回空字典"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def is_unchanged(entry, source, target):
+    """
+    判断源文件自上次转换以来是否未变化，且上次的输出文件完好
+    
+    源文件的修改时间和大小与记录相同时直接判定未变化；只有修改时间变化时
+    （如重新下载了相同内容）再比较内容摘要，并更新记录的修改时间。
+    """
+    if not entry or entry.get('target') != target or file_state(target) != entry.get('target_state'):
+        return False
+    state = file_state(source)
+    if state == entry.get('source_state'):
+        return True
+    if state is None or state[1] != entry.get('source_state', [None, None])[1]:
+        return False
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    if digest.hexdigest() != entry.get('sha256'):
+        return False
+    entry['source_state'] = state
+    return True
+
+def convert_batch(inputs, output_dir=None, workers=None, force=False, cache_path=None, stream=None):
+    """
+    批量转换YAML文件：在进程池中并行转换，跳过自上次转换以来未变化的文件
+    
+    单个文件转换失败不会中断其他文件，失败信息记录在返回结果中。
+    
+    参数:
+        inputs: 文件路径、glob模式或目录的列表，见 collect_yaml_files
+        output_dir: 输出目录，为None时JSON文件写在源文件旁边
+        workers: 进程数，默认为CPU核数
+        force: 是否忽略缓存，全部重新转换
+        cache_path: 缓存文件路径，默认为输出目录（或当前目录）下的 .yml2json-cache.json
+        stream: 是否使用流式转换，为None时只对超过 STREAM_THRESHOLD 的文件使用
+    
+    返回:
+        dict: converted（转换成功的源文件列表）、skipped（未变化而跳过的源文件列表）、
+              failed（源文件 -> 错误信息）
+    
+    异常:
+        FileNotFoundError: 当输入的文件或目录不存在时抛出
+        ValueError: 当多个源文件对应同一个目标文件时抛出
+    """
+    pairs = collect_yaml_files(inputs, output_dir)
+    cache_path = cache_path or os.path.join(output_dir or os.getcwd(), BATCH_CACHE_NAME)
+    cache = {} if force else load_batch_cache(cache_path)
+    
+    tasks = []
+    skipped = []
+    for source, target in pairs:
+        if not force and is_unchanged(cache.get(source), source, target):
+            skipped.append(source)
+        else:
+            tasks.append((source, target, stream))
+    
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    if workers == 1:
+        results = [convert_task(task) for task in tasks]
+    else:
+        # 文件通常很小，按批分发任务，减少进程间通信次数
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(convert_task, tasks, chunksize=chunksize))
+    
+    targets = {source: target for source, target, _ in tasks}
+    converted = []
+    failed = {}
+    for source, digest, error in results:
+        if error:
+            failed[source] = error
+            cache.pop(source, None)
+            continue
+        converted.append(source)
+        target = targets[source]
+        cache[source] = {
+            'target': target,
+            'sha256': digest,
+            'source_state': file_state(source),
+            'target_state': file_state(target),
+        }
+    
+    if pairs:
+        cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    return {'converted': converted, 'skipped': skipped, 'failed': failed}
 
 def show_usage():
     """显示程序使用方法"""
     print("使用方法:")
-    print("  python yml2json.py <yaml文件路径> <json文件路径>")
+    print("  python yml2json.py <yaml文件路径> <json文件路径> [--stream]")
+    print("  python yml2json.py --batch <文件|glob|目录>... [-o 输出目录] [-j 进程数] [--force] [--stream]")
     print("")
     print("参数说明:")
     print("  <yaml文件路径>  : 要转换的YAML源文件路径（必须存在）")
     print("  <json文件路径>  : 要生成的JSON目标文件路径")
+    print(f"  --stream        : 使用流式转换，内存占用与文件大小无关（超过 {STREAM_THRESHOLD // 1024 // 1024}MB 的文件默认使用）")
     print("")
     print("示例:")
     print("  python yml2json.py config.yml config.json")
     print("  python yml2json.py data/settings.yaml output/settings.json")
+    print("  python yml2json.py --batch rule-providers/ -o json/ -j 8")
+
+def batch_main(argv):
+    """
+    批量模式：转换多个文件、glob匹配的文件或目录下的所有YAML文件
+    
+    返回:
+        int: 退出码，有文件转换失败时为1
+    """
+    parser = argparse.ArgumentParser(prog='yml2json.py --batch', description='批量将YAML文件转换为JSON文件')
+    parser.add_argument('inputs', nargs='+', help='YAML文件、glob模式（需加引号）或目录')
+    parser.add_argument('-o', '--output-dir', help='输出目录（默认写在源文件旁边）')
+    parser.add_argument('-j', '--workers', type=int, help='进程数（默认为CPU核数）')
+    parser.add_argument('--force', action='store_true', help='忽略缓存，重新转换所有文件')
+    parser.add_argument('--stream', action='store_true',
+                        help=f'所有文件都使用流式转换（默认只对超过 {STREAM_THRESHOLD // 1024 // 1024}MB 的文件使用）')
+    args = parser.parse_args(argv)
+    
+    print(f"YAML解析后端: {yaml_backend_description()}")
+    try:
+        result = convert_batch(args.inputs, args.output_dir, args.workers, args.force, stream=args.stream or None)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return 1
+    
+    for source, error in result['failed'].items():
+        print(f"转换失败: {source}: {error}")
+    print(f"转换 {len(result['converted'])} 个文件，跳过未变化的 {len(result['skipped'])} 个，"
+          f"失败 {len(result['failed'])} 个")
+    return 1 if result['failed'] else 0
 
 def main():
     """
@@ -82,17 +579,25 @@ def main():
         - 必须提供2个参数：YAML源文件路径和JSON目标文件路径
         - YAML源文件必须存在
     """
+    # 批量模式
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        sys.exit(batch_main(sys.argv[2:]))
+    
+    # --stream：强制流式转换（默认只对大文件使用）
+    args = [arg for arg in sys.argv[1:] if arg != '--stream']
+    stream = True if len(args) != len(sys.argv) - 1 else None
+    
     # 检查命令行参数数量（sys.argv[0]是脚本名，实际参数从索引1开始）
-    if len(sys.argv) != 3:
+    if len(args) != 2:
         print("错误: 参数数量不正确")
-        print(f"提供了 {len(sys.argv) - 1} 个参数，需要 2 个参数")
+        print(f"提供了 {len(args)} 个参数，需要 2 个参数")
         print("")
         show_usage()
         sys.exit(1)
     
     # 获取命令行参数
-    yml_file_path = sys.argv[1]
-    json_file_path = sys.argv[2]
+    yml_file_path = args[0]
+    json_file_path = args[1]
     
     # 检查YAML源文件是否存在
     if not os.path.exists(yml_file_path):
@@ -109,7 +614,20 @@ def main():
         sys.exit(1)
     
     # 执行转换
-    convert_yml_to_json(yml_file_path, json_file_path)
+    try:
+        convert_yml_to_json(yml_file_path, json_file_path, stream=stream)
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"YAML解析错误: {e}")
+        sys.exit(1)
+    except IOError as e:
+        print(f"文件读写错误: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"未知错误: {e}")
+        sys.exit(1)
 
 # 程序入口点
 if __name__ == "__main__":